@@ -1,12 +1,14 @@
 from msaGlobal import GetMsa, GetVersion, SetModuleVersion
 import cmath, os, re, time, wx
 import copy as dcopy
-from numpy import array, cos, interp, pi, sin, tan, zeros
+from numpy import angle, array, asarray, clip, column_stack, cos, empty, \
+    interp, log10, pi, searchsorted, sin, tan, where, zeros
 from util import constMaxValue, DegreesPerRad, floatOrEmpty, floatSI, message, \
     polarDbDeg, RadsPerDegree, uSafeLog10
 from msa import MSA
 from functionDialog import MainDialog
 from spectrum import Spectrum
+from rlcModel import RLCModel
 
 SetModuleVersion("cal",("1.30","EON","05/20/2014"))
 
@@ -21,6 +23,63 @@ def uNormalizeDegrees(deg):
         deg -= 360
     return deg
 
+# Array version of uNormalizeDegrees, doing the same steps for each element
+
+def uNormalizeDegreesArray(deg):
+    deg = array(deg, dtype=float)
+    low = deg <= -180
+    while low.any():
+        deg[low] += 360
+        low = deg <= -180
+    high = deg > 180
+    while high.any():
+        deg[high] -= 360
+        high = deg > 180
+    return deg
+
+# Convert a list or array of (dB, degrees) pairs to an array of complex
+# values, as cmath.rect(10 ** (db / 20), deg * RadsPerDegree) would for each
+
+def dbDegToComplex(dbDeg):
+    dbDeg = array(dbDeg, dtype=float).reshape(-1, 2)
+    return rectDbDeg(dbDeg[:,0], dbDeg[:,1])
+
+# Same, given separate arrays of dB and degrees
+
+def rectDbDeg(db, deg):
+    rho = 10 ** (asarray(db, dtype=float) / 20)
+    theta = asarray(deg, dtype=float) * RadsPerDegree
+    Z = zeros(len(rho), dtype=complex)
+    Z.real = rho * cos(theta)
+    Z.imag = rho * sin(theta)
+    return Z
+
+# Array version of polarDbDeg: (dB, degrees) arrays for complex array Z
+
+def polarDbDegArray(Z):
+    mag = abs(Z)
+    tiny = mag <= 1e-20
+    db = 20 * where(tiny, -20, log10(where(tiny, 1, mag)))
+    deg = angle(Z) * DegreesPerRad
+    return db, deg
+
+# Linearly interpolate each column of fp (sampled at ascending xp) at x, as
+# interp() would one column at a time, sharing one search of the grid.
+
+def interpColumns(x, xp, fp):
+    x = array(x, dtype=float)
+    xp = array(xp, dtype=float)
+    fp = array(fp, dtype=float)
+    if len(xp) < 2:
+        return fp[[0] * len(x)]
+    j = clip(searchsorted(xp, x, side="right") - 1, 0, len(xp) - 2)
+    f0 = fp[j]
+    slope = (fp[j+1] - f0) / (xp[j+1] - xp[j])[:,None]
+    out = slope * (x - xp[j])[:,None] + f0
+    out[x <= xp[0]] = fp[0]
+    out[x >= xp[-1]] = fp[-1]
+    return out
+
 def cpx(Z):
     val = "(%10.3e,%10.3e)" % (Z.real, Z.imag)
     return val
@@ -178,7 +237,7 @@ class PerformCalDialog(MainDialog):
             self.EnableButtons(True)
             msa.calibrating = False
             ##p.planeExt = savePlaneExt
-            frame.SetBandCal(dcopy.deepcopy(frame.spectrum))
+            frame.SetBandCal(frame.spectrum.Copy())
             frame.SetCalLevel(2)
             self.Update()
 
@@ -411,6 +470,7 @@ class PerformCalUpdDialog(wx.Dialog): # EON Jan 29, 2014
                     Mdeg = spectrum.Mdeg[i]
                     #(db, deg) = oslCal.bandRef[i]
                     oslCal.bandRef[i] = (Mdb, Mdeg)
+                oslCal.BandChanged()
             else:
                 cal = msa.bandCal # EON Jan 29, 2014
                 if cal != None:
@@ -1155,6 +1215,10 @@ class OslCal:
         self.nSteps = nSteps
         self._nSteps = self.nSteps + 1
         n = self._nSteps
+        # interpolated (bandRef, bandA, bandB, bandC), by band version and
+        # target grid
+        self._interpCache = {}
+        self._bandVersion = 0
         self.Fmhz = dcopy.copy(Fmhz)
         self.OSLcalOpen = [None] * n
         self.OSLcalShort = [None] * n
@@ -1176,7 +1240,8 @@ class OslCal:
         self.S21JigAttach = ""
         self.S21JigShuntDelay = 0
         self.OSLBandRefType = ""
-        self.OSLBandRef = [None] * n
+        # (dB, degrees) rows
+        self.OSLBandRef = zeros((n, 2))
         self.OSLBandA = zeros(n, dtype=complex)
         self.OSLBandB = zeros(n, dtype=complex)
         self.OSLBandC = zeros(n, dtype=complex)
@@ -1186,6 +1251,20 @@ class OslCal:
         self.bandB = []
         self.bandC = []
 
+    # Assigning the frequencies or band arrays changes what InterpolatedBand
+    # interpolates from, so moves on to a new band version. Changes made in
+    # place must call BandChanged.
+
+    _bandAttrs = ("Fmhz", "OSLBandRef", "OSLBandA", "OSLBandB", "OSLBandC")
+
+    def __setattr__(self, name, value):
+        self.__dict__[name] = value
+        if name in self._bandAttrs:
+            self.BandChanged()
+
+    def BandChanged(self):
+        self._bandVersion += 1
+
     # OSLCal[i] returns the tuple (Sdb, Sdeg) for step i
 
     def __getitem__(self, i):
@@ -1207,63 +1286,47 @@ class OslCal:
         self.bandB = self.OSLBandB
         self.bandC = self.OSLBandC
 
-    def interpolateCal(self, fMhz):
-        nSteps = len(fMhz)
-        self.bandRef = [(None, None)] * nSteps
-        self.bandA = zeros(nSteps, dtype=complex)
-        self.bandB = zeros(nSteps, dtype=complex)
-        self.bandC = zeros(nSteps, dtype=complex)
-
-        db = zeros(self._nSteps)
-        deg = zeros(self._nSteps)
-        for i in range(self._nSteps):
-            (db[i], deg[i]) = self.OSLBandRef[i]
-
-        i = 0
-        for freq in fMhz:
-            self.bandRef[i] = (interp(freq, self.Fmhz, db),
-                               interp(freq, self.Fmhz, deg))
-            i += 1
-
-        dst = zeros(nSteps)
-        src = self.OSLBandA.real
-        i = 0
-        for freq in fMhz:
-            dst[i] = interp(freq, self.Fmhz, src)
-            i += 1
-        self.bandA.real = dcopy.copy(dst)
-        src = self.OSLBandA.imag
-        i = 0
-        for freq in fMhz:
-            dst[i] = interp(freq, self.Fmhz, src)
-            i += 1
-        self.bandA.imag = dcopy.copy(dst)
-
-        src = self.OSLBandB.real
-        i = 0
-        for freq in fMhz:
-            dst[i] = interp(freq, self.Fmhz, src)
-            i += 1
-        self.bandB.real = dcopy.copy(dst)
-        src = self.OSLBandB.imag
-        i = 0
-        for freq in fMhz:
-            dst[i] = interp(freq, self.Fmhz, src)
-            i += 1
-        self.bandB.imag = dcopy.copy(dst)
+    # Interpolate the calibration onto the sweep frequencies fMhz, making
+    # them the band values used by ConvertRawDataToReflection. The reference
+    # is copied, as Update Cal writes to it.
 
-        src = self.OSLBandC.real
-        i = 0
-        for freq in fMhz:
-            dst[i] = interp(freq, self.Fmhz, src)
-            i += 1
-        self.bandC.real = dcopy.copy(dst)
-        src = self.OSLBandC.imag
-        i = 0
-        for freq in fMhz:
-            dst[i] = interp(freq, self.Fmhz, src)
-            i += 1
-        self.bandC.imag = dcopy.copy(dst)
+    def interpolateCal(self, fMhz):
+        fMhz = array(fMhz, dtype=float)
+        (bandRef, self.bandA, self.bandB, self.bandC) = \
+            self.InterpolatedBand(fMhz)
+        self.bandRef = bandRef.copy()
+        self.bandFmhz = fMhz
+
+    # The calibration interpolated onto frequencies fMhz, as (bandRef, bandA,
+    # bandB, bandC). Results are cached and the calibration is left as is,
+    # so this can be called from another thread to have them ready. The
+    # arrays returned are shared by the cache, so they are read-only.
+
+    def InterpolatedBand(self, fMhz):
+        fMhz = array(fMhz, dtype=float)
+        key = (self._bandVersion, fMhz.tostring())
+        band = self._interpCache.get(key)
+        if band == None:
+            src = column_stack((self.OSLBandRef, self.OSLBandA.real,
+                                self.OSLBandA.imag, self.OSLBandB.real,
+                                self.OSLBandB.imag, self.OSLBandC.real,
+                                self.OSLBandC.imag))
+            dst = interpColumns(fMhz, self.Fmhz, src)
+            band = (dst[:,0:2].copy(), self._Complex(dst[:,2], dst[:,3]),
+                    self._Complex(dst[:,4], dst[:,5]),
+                    self._Complex(dst[:,6], dst[:,7]))
+            for a in band:
+                a.flags.writeable = False
+            if len(self._interpCache) >= 16:
+                self._interpCache.clear()
+            self._interpCache[key] = band
+        return band
+
+    def _Complex(self, re, im):
+        Z = empty(len(re), dtype=complex)
+        Z.real = re
+        Z.imag = im
+        return Z
 
     def WriteS1P(self, fileName, p, contPhase=False):
         f = open(fileName, "w") # EON Jan 29, 2014
@@ -1331,16 +1394,28 @@ class OslCal:
         this.OSLBandA = array(a)
         this.OSLBandB = array(b) # EON Jan 29, 2014
         this.OSLBandC = array(c) # EON Jan 29, 2014
-        this.OSLBandRef = bandRef
+        this.OSLBandRef = array(bandRef)
         this.S11JigType = S11Jig
         this.S11BridgeR0 = S11BridgeR0
         return this
 
+    #--------------------------------------------------------------------------
+    # Convert the raw reflection data of step i, returning (db, deg).
+
+    def ConvertRawDataToReflection(self, i, Sdb, Sdeg):
+        (db, deg) = self.ConvertRawSweepToReflection([Sdb], [Sdeg], [i])
+        return float(db[0]), float(deg[0])
+
 # sub ConvertRawDataToReflection currStep
 
 # For the current step in reflection mode, calculate S11, referenced to S11GraphR0
+#
+# Array version: Sdb and Sdeg hold the reference-adjusted raw data of the
+# steps selected by steps (all steps by default; a slice or index array
+# otherwise), and arrays of db and deg are returned. Raw data saved from
+# earlier sweeps can be passed through any calibration this way.
 
-    def ConvertRawDataToReflection(self, i, Sdb, Sdeg):
+    def ConvertRawSweepToReflection(self, Sdb, Sdeg, steps=slice(None)):
 
 # Calculate reflection in db, angle format and puts results in
 # ReflectArray, which already contains the raw data.  Also calculates
@@ -1400,10 +1475,10 @@ class OslCal:
 #         cR=OSLc(currStep,0) : cI=OSLc(currStep,1)   'coefficient c, real and imaginary
 
         if True:
-            M = cmath.rect(10 ** (Sdb / 20), Sdeg * RadsPerDegree)
-            a = self.bandA[i]
-            b = self.bandB[i]
-            c = self.bandC[i]
+            M = rectDbDeg(Sdb, Sdeg)
+            a = asarray(self.bandA)[steps]
+            b = asarray(self.bandB)[steps]
+            c = asarray(self.bandC)[steps]
 
 #
 #         'calculate adjusted db, ang via OSL. Note OSL must be referenced to S11BridgeR0
@@ -1454,9 +1529,8 @@ class OslCal:
 #         ang=uATan2(refR, refI)      'angle of S in degrees
 #             'db, ang (degrees) now have S11 data produced by applying OSL calibration.
 
-        (db, deg) = polarDbDeg(S)
-        if db > 0:
-            db = 0
+        (db, deg) = polarDbDegArray(S)
+        db[db > 0] = 0
 
 #     end if
 #
@@ -1823,6 +1897,7 @@ class OslCal:
 
                     f.write("%2d, freq %7.0f, measDB %10.3e, measDeg %10.3e\n\n" % (i, freq, measDB, measDeg))
                 self.OSLBandRef[i] = (measDB, measDeg)
+                self.BandChanged()
 
 
 #     else    'All three standards used   'ver116-4n
@@ -1871,26 +1946,26 @@ class OslCal:
             if self.oslDbg:
                 f.write("%s\n" % (self.OSLBandRefType))
 
-            for i in range(self._nSteps):
-                if self.OSLBandRefType == "Open":
-                    (refdB, refDeg) = self.OSLcalOpen[i]
-                elif self.OSLBandRefType == "Short":
-                    (refdB, refDeg) = self.OSLcalShort[i]
-                else:
-                    (refdB, refDeg) = self.OSLcalLoad[i]
-
-                if self.oslDbg:
-                    f.write("%2d, ref  %s\n" % (i, pol((refdB, refDeg))))
-
-                self.OSLBandRef[i] = (refdB, refDeg)
-
-                # Adjust measurements per reference
-                (db, deg) = self.OSLcalOpen[i]
-                self.OSLcalOpen[i] = (db - refdB, uNormalizeDegrees(deg - refDeg))
-                (db, deg) = self.OSLcalLoad[i]
-                self.OSLcalLoad[i] = (db - refdB, uNormalizeDegrees(deg - refDeg))
-                (db, deg) = self.OSLcalShort[i]
-                self.OSLcalShort[i] = (db - refdB, uNormalizeDegrees(deg - refDeg))
+            ref = array({"Open": self.OSLcalOpen, "Short": self.OSLcalShort,
+                         "Load": self.OSLcalLoad}[self.OSLBandRefType],
+                        dtype=float)
+            (refdB, refDeg) = (ref[:,0], ref[:,1])
+            if self.oslDbg:
+                for i in range(self._nSteps):
+                    f.write("%2d, ref  %s\n" % (i, pol((refdB[i], refDeg[i]))))
+
+            self.OSLBandRef = ref
+
+            # Adjust measurements per reference, leaving them as
+            # (dB, degrees) rows
+            def AdjustByRef(cal):
+                cal = array(cal, dtype=float)
+                cal[:,0] -= refdB
+                cal[:,1] = uNormalizeDegreesArray(cal[:,1] - refDeg)
+                return cal
+            self.OSLcalOpen = AdjustByRef(self.OSLcalOpen)
+            self.OSLcalLoad = AdjustByRef(self.OSLcalLoad)
+            self.OSLcalShort = AdjustByRef(self.OSLcalShort)
 
 #         next i
 #     end if
@@ -1919,29 +1994,21 @@ class OslCal:
         # (real, imaginary), and calc OSL coefficients.  We leave the reference
         # data in db, ang (degrees) format
 
-        for i in range(self._nSteps):
-            (db, deg) = self.OSLcalOpen[i]
-            if self.oslDbg:
-                f.write("%2d, calOpen  %s," % (i, pol((db, deg))))
-            self.OSLcalOpen[i] = cmath.rect(10 ** (db / 20), deg * RadsPerDegree)
-            if self.oslDbg:
-                f.write(" %s\n" % cpx(self.OSLcalOpen[i]))
+        calOpen = self.OSLcalOpen
+        calLoad = self.OSLcalLoad
+        calShort = self.OSLcalShort
+        self.OSLcalOpen = dbDegToComplex(calOpen)
+        self.OSLcalLoad = dbDegToComplex(calLoad)
+        self.OSLcalShort = dbDegToComplex(calShort)
 
-            (db, deg) = self.OSLcalLoad[i]
-            if self.oslDbg:
-                f.write("%2d, calLoad  %s," % (i, pol((db, deg))))
-            self.OSLcalLoad[i] = cmath.rect(10 ** (db / 20), deg * RadsPerDegree)
-            if self.oslDbg:
+        if self.oslDbg:
+            for i in range(self._nSteps):
+                f.write("%2d, calOpen  %s," % (i, pol(calOpen[i])))
+                f.write(" %s\n" % cpx(self.OSLcalOpen[i]))
+                f.write("%2d, calLoad  %s," % (i, pol(calLoad[i])))
                 f.write(" %s\n" % cpx(self.OSLcalLoad[i]))
-
-            (db, deg) = self.OSLcalShort[i]
-            if self.oslDbg:
-                f.write("%2d, calShort %s," % (i, pol((db, deg))))
-            self.OSLcalShort[i] = cmath.rect(10 ** (db / 20), deg * RadsPerDegree)
-            if self.oslDbg:
+                f.write("%2d, calShort %s," % (i, pol(calShort[i])))
                 f.write(" %s\n\n" % cpx(self.OSLcalShort[i]))
-
-        if self.oslDbg:
             f.close()
 
         # Calculate A, B, C coefficients; set OSLError to 1 if math error
@@ -2003,19 +2070,15 @@ class OslCal:
 #         SLr=OSLstdLoad(calStep,0) : SLi=OSLstdLoad(calStep,1)     'Load standard, real and imag
 #         SSr=OSLstdShort(calStep,0) : SSi=OSLstdShort(calStep,1)     'Short standard, real and imag
 
-        if self.oslDbg:
-            f = open("OSLCoef1.txt", "w")
-        for i in range(self._nSteps):
-            MO = self.OSLcalOpen[i]     # Measured open, real and imag
-            ML = self.OSLcalLoad[i]     # Measured load, real and imag
-            MS = self.OSLcalShort[i]    # Measured short, real and imag
+        # All steps are calculated at once; each name below is an array
+        # with one complex element per calibration step.
+        MO = self.OSLcalOpen     # Measured open, real and imag
+        ML = self.OSLcalLoad     # Measured load, real and imag
+        MS = self.OSLcalShort    # Measured short, real and imag
 
-            SO = self.OSLstdOpen[i]     # Open standard, real and imag
-            SL = self.OSLstdLoad[i]     # Load standard, real and imag
-            SS = self.OSLstdShort[i]    # Short standard, real and imag
-            if self.oslDbg:
-                f.write("%3d mo (%10.3e, %10.3e) ml (%10.3e, %10.3e) ms (%10.3e, %10.3e)\n" % (i, MO.real, MO.imag, ML.real, ML.imag, MS.real, MS.imag))
-                f.write("%3d so (%10.3e, %10.3e) sl (%10.3e, %10.3e) ss (%10.3e, %10.3e)\n" % (i, SO.real, SO.imag, SL.real, SL.imag, SS.real, SS.imag))
+        SO = self.OSLstdOpen     # Open standard, real and imag
+        SL = self.OSLstdLoad     # Load standard, real and imag
+        SS = self.OSLstdShort    # Short standard, real and imag
 
 #         K1r=MLr-MSr : K1i=MLi-MSi   'K1=ML-MS, real and imag
 #         K2r=MSr-MOr : K2i=MSi-MOi   'K2=MS-MO, real and imag
@@ -2038,23 +2101,18 @@ class OslCal:
 #
 #         Dr=K4r+K5r+K6r : Di=K4i+K5i+K6i    'D = K4 + K5 + K6
 
-            K1 = ML - MS
-            K2 = MS - MO
-            K3 = MO - ML
-            K4 = SL * SS * K1
-            K5 = SO * SS * K2
-            K6 = SL * SO * K3
+        K1 = ML - MS
+        K2 = MS - MO
+        K3 = MO - ML
+        K4 = SL * SS * K1
+        K5 = SO * SS * K2
+        K6 = SL * SO * K3
 
-            K7 = SO * K1
-            K8 = SL * K2
-            K9 = SS * K3
-
-            if self.oslDbg:
-                f.write("%3d k1 (%10.3e, %10.3e) k2 (%10.3e, %10.3e) k3 (%10.3e, %10.3e)\n" % (i, K1.real, K1.imag, K2.real, K2.imag, K3.real, K3.imag))
-                f.write("%3d k4 (%10.3e, %10.3e) k5 (%10.3e, %10.3e) k6 (%10.3e, %10.3e)\n" % (i, K4.real, K1.imag, K5.real, K5.imag, K6.real, K6.imag))
-                f.write("%3d k7 (%10.3e, %10.3e) k8 (%10.3e, %10.3e) k9 (%10.3e, %10.3e)\n" % (i, K7.real, K1.imag, K8.real, K8.imag, K9.real, K9.imag))
+        K7 = SO * K1
+        K8 = SL * K2
+        K9 = SS * K3
 
-            D = K4 + K5 + K6
+        D = K4 + K5 + K6
 
 #         if Dr=0 and Di=0 then notice "Divide by zero in calculating OSL coefficients." : OSLError=1 : exit sub  'ver115-4j
 #         call cxInvert Dr, Di, invDr, invDi   'invD= 1/D
@@ -2083,31 +2141,36 @@ class OslCal:
 #         OSLBandC[i]=cr : OSLBandC(calStep,1)=ci
 #     next calStep
 
-            try:
-                invD = 1 / D
-            except ZeroDivisionError:
-                message("Divide by zero in calculating OSL coefficients.") # EON Jan 29, 2014
-                self.OSLError = True
-                return
+        if (D == 0).any():
+            message("Divide by zero in calculating OSL coefficients.") # EON Jan 29, 2014
+            self.OSLError = True
+            return
+        invD = 1 / D
 
-            # Now calculate coefficient a
-            a = (MO * K7 + ML * K8 + MS * K9) * invD
+        # Now calculate coefficient a
+        a = (MO * K7 + ML * K8 + MS * K9) * invD
 
-            # The procedure for calculating b is identical to that for a,
-            # just changing the K values.
-            b = (MO * K4 + ML * K5 + MS * K6) * invD
+        # The procedure for calculating b is identical to that for a,
+        # just changing the K values.
+        b = (MO * K4 + ML * K5 + MS * K6) * invD
 
-            # Calculate coefficient c.
-            c = (K7 + K8 + K9) * invD
+        # Calculate coefficient c.
+        c = (K7 + K8 + K9) * invD
 
-            # Put coefficients into OSLBandx()
-            self.OSLBandA[i] = a
-            self.OSLBandB[i] = b
-            self.OSLBandC[i] = c
-            if self.oslDbg:
-                f.write("%3d a (%10.3e, %10.3e), b (%10.3e, %10.3e), c (%10.3e, %10.3e)\n\n" % (i, a.real, a.imag, b.real, b.imag, c.real, c.imag))
+        # Put coefficients into OSLBandx()
+        self.OSLBandA = a
+        self.OSLBandB = b
+        self.OSLBandC = c
 
         if self.oslDbg:
+            f = open("OSLCoef1.txt", "w")
+            for i in range(self._nSteps):
+                f.write("%3d mo (%10.3e, %10.3e) ml (%10.3e, %10.3e) ms (%10.3e, %10.3e)\n" % (i, MO[i].real, MO[i].imag, ML[i].real, ML[i].imag, MS[i].real, MS[i].imag))
+                f.write("%3d so (%10.3e, %10.3e) sl (%10.3e, %10.3e) ss (%10.3e, %10.3e)\n" % (i, SO[i].real, SO[i].imag, SL[i].real, SL[i].imag, SS[i].real, SS[i].imag))
+                f.write("%3d k1 (%10.3e, %10.3e) k2 (%10.3e, %10.3e) k3 (%10.3e, %10.3e)\n" % (i, K1[i].real, K1[i].imag, K2[i].real, K2[i].imag, K3[i].real, K3[i].imag))
+                f.write("%3d k4 (%10.3e, %10.3e) k5 (%10.3e, %10.3e) k6 (%10.3e, %10.3e)\n" % (i, K4[i].real, K4[i].imag, K5[i].real, K5[i].imag, K6[i].real, K6[i].imag))
+                f.write("%3d k7 (%10.3e, %10.3e) k8 (%10.3e, %10.3e) k9 (%10.3e, %10.3e)\n" % (i, K7[i].real, K7[i].imag, K8[i].real, K8[i].imag, K9[i].real, K9[i].imag))
+                f.write("%3d a (%10.3e, %10.3e), b (%10.3e, %10.3e), c (%10.3e, %10.3e)\n\n" % (i, a[i].real, a[i].imag, b[i].real, b[i].imag, c[i].real, c[i].imag))
             f.close()
 # end sub
 #
@@ -2186,12 +2249,12 @@ class OslCal:
 #         SOr=OSLstdOpen(calStep,0) : SOi=OSLstdOpen(calStep,1)     'Open standard, real and imag
 #         SSr=OSLstdShort(calStep,0) : SSi=OSLstdShort(calStep,1)     'Short standard, real and imag
 
-        for i in range(self._nSteps):
-            MO = self.OSLcalOpen[i]    # Measured open, real and imag
-            ML = self.OSLcalLoad[i]    # Measured load, real and imag
-            MS = self.OSLcalShort[i]   # Measured short, real and imag
-            SO = self.OSLstdOpen[i]    # Open standard, real and imag
-            SS = self.OSLstdShort[i]   # Short standard, real and imag
+        # All steps are calculated at once, as arrays
+        MO = self.OSLcalOpen    # Measured open, real and imag
+        ML = self.OSLcalLoad    # Measured load, real and imag
+        MS = self.OSLcalShort   # Measured short, real and imag
+        SO = self.OSLstdOpen    # Open standard, real and imag
+        SS = self.OSLstdShort   # Short standard, real and imag
 
 #
 # Compute Ks
@@ -2199,10 +2262,10 @@ class OslCal:
 #         K2r=MSr-MLr : K2i=MSi-MLi   'K2, real and imag
 #         K3r=MOr-MSr : K3i=MOi-MSi   'K3, real and imag
 
-            # Compute Ks
-            K1 = ML - MO
-            K2 = MS - ML
-            K3 = MO - MS
+        # Compute Ks
+        K1 = ML - MO
+        K2 = MS - ML
+        K3 = MO - MS
 
 #
 # Compute 1/D
@@ -2214,14 +2277,13 @@ class OslCal:
 #         if Dr=0 and Di=0 then notice "Divide by zero in calculating OSL coefficients." : OSLError=1 : exit sub  'ver115-4j
 #         call cxInvert Dr, Di, DinvR, DinvI       'Invert of D is in Dinv
 
-            # Compute 1/D
-            D = (MS * SS * K1) + (MO * SO * K2)
-            try:
-                invD = 1 / D
-            except ZeroDivisionError:
-                message("Divide by zero in calculating OSL coefficients.") # EON Jan 29, 2014
-                self.OSLError = True
-                return
+        # Compute 1/D
+        D = (MS * SS * K1) + (MO * SO * K2)
+        if (D == 0).any():
+            message("Divide by zero in calculating OSL coefficients.") # EON Jan 29, 2014
+            self.OSLError = True
+            return
+        invD = 1 / D
 
 # Compute c
 #         Wr=SOr*SSr-SOi*SSi : Wi=SOr*SSi+SOi*SSr     'SO*SS
@@ -2235,19 +2297,19 @@ class OslCal:
 #         Yr=Wr+Xr : Yi=Wi+Xi                    'Y=SO*K2 + SS*K1
 #         br=DinvR*Yr-DinvI*Yi : bi=DinvR*Yi+DinvI*Yr     'b=Y/D
 
-            c = (SO * SS * K3) * invD
-            a = ML * c
-            b = (SO * K2 + SS * K1) * invD
+        c = (SO * SS * K3) * invD
+        a = ML * c
+        b = (SO * K2 + SS * K1) * invD
 
 # Put coefficients into OSLBandx()
 #         OSLBandA(calStep,0)=ar : OSLBandA(calStep,1)=ai
 #         OSLBandB(calStep,0)=br : OSLBandB(calStep,1)=bi
 #         OSLBandC(calStep,0)=cr : OSLBandC(calStep,1)=ci
 
-            # Put coefficients into OSLBandx()
-            self.OSLBandA[i] = a
-            self.OSLBandB[i] = b
-            self.OSLBandC[i] = c
+        # Put coefficients into OSLBandx()
+        self.OSLBandA = a
+        self.OSLBandB = b
+        self.OSLBandC = c
 
 #     next calStep
 # end sub
@@ -2305,19 +2367,9 @@ class OslCal:
             self.OSLError = True
             return
 
+        self.OSLstdOpen = dbDegToComplex(self.comboResp)
         if self.oslDbg:
-            f = open("OSLstdOpen1.txt","w")
-
-        for i in range(self._nSteps):
-            (rho, theta) = self.comboResp[i]
-            rho = (10 ** (rho / 20))
-            theta = theta * RadsPerDegree
-            self.OSLstdOpen[i] = cmath.rect(rho, theta)
-            if self.oslDbg:
-                f.write("%2d, freq %7.0f, rho %10.3e, theta %9.2e, stdOpen r %10.3e, i %9.2e\n" %
-                        (i, self.Fmhz[i], rho, theta, self.OSLstdOpen[i].real, self.OSLstdOpen[i].imag))
-        if self.oslDbg:
-            f.close()
+            self._WriteOSLStd("OSLstdOpen1.txt", "stdOpen", self.OSLstdOpen)
 
 #     isErr=uRLCComboResponse(OSLShortSpec$, R0, "S11") 'Calculate short standard response at all frequencies
 #     if isErr then notice "Error in OSL standards specifications" : OSLError=1 : exit sub
@@ -2334,18 +2386,9 @@ class OslCal:
             self.OSLError = True
             return
 
+        self.OSLstdShort = dbDegToComplex(self.comboResp)
         if self.oslDbg:
-            f = open("OSLstdShort1.txt","w")
-        for i in range(self._nSteps):
-            (rho, theta) = self.comboResp[i]
-            rho = (10 ** (rho / 20))
-            theta = theta * RadsPerDegree
-            self.OSLstdShort[i] = cmath.rect(rho, theta)
-            if self.oslDbg:
-                f.write("%2d, freq %7.0f, rho %10.3e, theta %9.2e, stdShort r %10.3e, i %9.2e\n" %
-                        (i, self.Fmhz[i], rho, theta, self.OSLstdShort[i].real, self.OSLstdShort[i].imag))
-        if self.oslDbg:
-            f.close()
+            self._WriteOSLStd("OSLstdShort1.txt", "stdShort", self.OSLstdShort)
 
 #     isErr=uRLCComboResponse(OSLLoadSpec$, R0, "S11") 'Calculate load standard response at all frequencies
 #     if isErr then notice "Error in OSL standards specifications" : OSLError=1 : exit sub
@@ -2362,21 +2405,23 @@ class OslCal:
             self.OSLError = True
             return
 
+        self.OSLstdLoad = dbDegToComplex(self.comboResp)
         if self.oslDbg:
-            f = open("OSLstdLoad1.txt","w")
-        for i in range(self._nSteps):
-            (rho, theta) = self.comboResp[i]
-            rho = (10 ** (rho / 20))
-            theta = theta * RadsPerDegree
-            self.OSLstdLoad[i] = cmath.rect(rho, theta)
-            if self.oslDbg:
-                f.write("%2d, freq %7.0f, rho %10.3e, theta %9.2e, stdLoad r %10.3e, i %9.2e\n" %
-                        (i, self.Fmhz[i], rho, theta, self.OSLstdLoad[i].real, self.OSLstdLoad[i].imag))
-        if self.oslDbg:
-            f.close()
+            self._WriteOSLStd("OSLstdLoad1.txt", "stdLoad", self.OSLstdLoad)
 
 # end sub
 
+    # Debug listing of one standard's response, as calculated by
+    # CalcOSLStandards.
+
+    def _WriteOSLStd(self, fileName, name, std):
+        f = open(fileName, "w")
+        for i in range(self._nSteps):
+            (db, deg) = self.comboResp[i]
+            f.write("%2d, freq %7.0f, rho %10.3e, theta %9.2e, %s r %10.3e, i %9.2e\n" %
+                    (i, self.Fmhz[i], 10 ** (db / 20), deg * RadsPerDegree, name, std[i].real, std[i].imag))
+        f.close()
+
 # sub uS11DBToImpedance R0, S11DB, S11Deg, byRef Res, byRef React   'Calc impedance from S11
 
     def uS11DBToImpedance(self, R0, S11DB, S11Deg):
@@ -2709,12 +2754,6 @@ class OslCal:
 #         RLC$=Mid$(spec$, openBracket+1, closeBracket-openBracket-1) 'Get data in brackets
 #     end if
 
-        m = re.match("RLC\\[(.+?)\\]", spec)
-        if m == None:
-            RLC = ""
-        else:
-            RLC = m.group(1)
-
 #
 #     tagPos=instr(spec$, "Coax")  'find Coax tag
 #     if tagPos=0 then
@@ -2726,12 +2765,6 @@ class OslCal:
 #         coaxSpecs$=Mid$(spec$, openBracket+1, closeBracket-openBracket-1) 'Get data in brackets
 #     end if
 
-        m = re.match("Coax\\[(.+?)\\]", spec)
-        if m == None:
-            coaxSpec = ""
-        else:
-            coaxSpec = m.group(1)
-
 #      'ver116-4i changed the defaults for backward compatibility with old method to specify OSL standards
 #     connect$="P" : R=constMaxValue : L=constMaxValue : C=0 : D=0  'default is series RLC with high impedance and no delay
 #     QL=100000 : QC=100000 'ver116-4i
@@ -2781,49 +2814,9 @@ class OslCal:
 #         wend
 #     end if  'end RLC
 
-        connect = "P"
-        R = constMaxValue
-        L = constMaxValue
-        C = 0
-        D = 0
-        QL = 100000
-        QC = 100000
-        isErr = False
-        args = re.split(", *",RLC)
-        for val in args:
-            m = re.match("([A-Z]+)(.*)",val)
-            tag = m.group(1)
-            v = m.group(2)
-            if tag == "S":
-                connect = "S"
-                R = 0
-                L = 0
-                C = constMaxValue
-            elif tag == "P":
-                connect = "P"
-                R = constMaxValue
-                L = constMaxValue
-                C = 0
-            elif v != "":
-                v = floatSI(v)
-                if tag == "R":
-                    R = v
-                elif tag == "L":
-                    L = v
-                elif tag == "C":
-                    C = v
-                elif tag == QL:
-                    QL = v
-                elif tag == QC:
-                    QC = v
-                elif tag == "D":
-                    if coaxSpec == "":
-                        D = v
-                else:
-                    isErr = True
-            else:
-                isErr = True
-        return isErr, connect, R, L, C, QL, QC, D, coaxSpec
+        isErr, model = RLCModel.Parse(spec)
+        return isErr, model.connect, model.R, model.L, model.C, model.QL, \
+            model.QC, model.D, model.coaxSpec
 
 #     uParseRLC=0
 # end function
@@ -2844,40 +2837,18 @@ class OslCal:
 #     if QC<=0 then QC=0.000001   'avoids problems below
 #     if QL<=0 then QC=0.000001
 
-        if self.oslDbg:
-            f = open("ComboImpedance1.txt","a")
-            f.write("%8.0f %s %5.0f %5.0f %5.0f %5.0f %5.0f\n" % (freq, connect, R, L, C, QL, QC))
-
-        twoPiF = 2 * pi * freq
-        if QC <= 0:
-            QC = 0.000001
-        if QL <= 0:
-            QC = 0.000001
-
 #     if freq<>0 and abs(L)<constMaxValue then 'If freq=0, we already have Ai=0; also, ignore huge parallel L
 #         ZLi=twoPiF*L :ZLr=ZLi/QL     'Inductor impedance, imag and real, with Q
 #     else
 #         ZLi=constMaxValue : ZLr=0
 #     end if
 
-        if freq != 0 and abs(L) < constMaxValue:
-            ZLi = twoPiF * L
-            ZL = complex(ZLi / QL, ZLi)
-        else:
-            ZL = complex(0, constMaxValue)
-
 #     if freq<>0 and C<>0 then    'Ignore C if freq or C is zero, because huge reactance in parallel is irrelevant
 #         ZCi=-1/(twoPiF*C) :ZCr=abs(ZCi)/QC     'Capacitor impedance, imag and real, with Q
 #     else    'zero freq or C; note that series connection ignores these
 #         ZCi=0-constMaxValue : ZCr=0
 #     end if
 
-        if freq != 0 and C != 0:
-            ZCi = -1 / (twoPiF * C)
-            ZC = complex(abs(ZCi) / QC, ZCi)
-        else:
-            ZC = complex(0, -constMaxValue)
-
 #
 #     if connect$="S" then
 #         Zr=R+ZLr
@@ -2888,14 +2859,6 @@ class OslCal:
 #             if abs(C)<constMaxValue then Zi=Zi+ZCi : Zr=Zr+ZCr
 #         end if
 
-        if connect == "S":
-            Z = R + ZL
-            if C == 0 or freq == 0:
-                Z = complex(0, -constMaxValue)
-            else:
-                if abs(C) < constMaxValue:
-                    Z = Z + ZC
-
 #     else 'this section modver115-1a
 #         if R=0 or L=0 or abs(C)>=constMaxValue then  'parallel with a zero-ohm component
 #             Zr=0 : Zi=0
@@ -2919,42 +2882,11 @@ class OslCal:
 #         end if
 #     end if
 
-        else:
-            # Parallel Add admittances and then invert
-            if (R == 0) or (L == 0) or (abs(C) >= constMaxValue):
-                Z = complex(0, 0)
-            else:
-                A = complex(1 / R, 0)
-                if freq == 0 or abs(L) >= constMaxValue:
-                    A = complex(A.real, 0) # Parallel inductance is huge so C will determine the reactance
-                else:
-                    YL = 1 / ZL
-                    A = A.real + YL
-                if C == 0:
-                    YC = complex(0, 0)
-                else:
-                    YC = 1 / ZC
-                A = A + YC
-                Z = 1 / A
-
 #     if Zi>constMaxValue then Zi=constMaxValue       'ver115-4h imposed limits
 #     if Zi<0-constMaxValue then Zi=0-constMaxValue
 #     if Zr>constMaxValue then Zr=constMaxValue
 
-        if self.oslDbg:
-            f.write("%10.3e %10.3e\n" % (Z.real, Z.imag))
-        if Z.imag > constMaxValue:
-            Z = complex(Z.real,constMaxValue)
-        if Z.imag < -constMaxValue:
-            Z = complex(Z.real, -constMaxValue)
-        if Z.real > constMaxValue:
-            Z = complex(constMaxValue, Z.imag)
-        if Z.real < 0:
-            Z = complex(0,Z.imag)
-        if self.oslDbg:
-            f.write("%10.3e %10.3e\n" % (Z.real, Z.imag))
-            f.close()
-        return Z
+        return RLCModel(connect, R, L, C, QL, QC).Impedance([freq])[0]
 
 # end sub
 
@@ -2982,14 +2914,6 @@ class OslCal:
 #     if isErr=0 then isErr=CoaxParseSpecs(coaxSpecs$, R0, VF, K1, K2, lenFeet) 'ver115-5d
 #     if isErr or Z0<=0 or R0<=0 then uRLCComboResponse=1 : exit function 'ver115-4a
 
-        (isErr, connect, R, L, C, QL, QC, D, coaxSpecs) = self.uParseRLC(spec)
-        if not isErr:
-            if coaxSpecs != "":
-                from coax import Coax
-                (isErr, R0, VF, K1, K2, lenFeet) = Coax.CoaxParseSpecs(coaxSpecs)
-            else:
-                R0 = 50
-
 #     twoPi=2*uPi()
 # Note R0 is the impedance of any transmission line in the RLC combo; Z0 is the reference impedance for
 # calculating S11 or S21. Both are pure resistances.
@@ -3016,28 +2940,6 @@ class OslCal:
 #             end if
 #         end if
 
-        if self.oslDbg:
-            f = open("ComboResponse1.txt","a")
-            f.write("%s, %f, %s, %s, R0 - %f, R - %f, L - %f, C - %f, %f %f\n" % 
-                    (spec, Z0, jig, connect, R0, R, L, C, QL, QC))
-        for i in range(self._nSteps):
-            freq = self.Fmhz[i] * 1e6
-            RLCZ = self.uComboImpedance(connect, R, L, C, QL, QC, freq)
-            if coaxSpecs == "":
-                Z = RLCZ
-            else:
-                if jig == "S11" or jig == "S21Shunt":
-                    if coaxSpecs != "":
-                        Z = Coax.CoaxTerminatedZFromSpecs(coaxSpecs, freq, RLCZ) # EON Jan 29, 2014
-                    else:
-                        (rho, theta) = self.uImpedanceToRefco(R0, RLCZ)
-                        phaseDelay = D * 360 * freq    #phase delay (deg)=delay(sec)*degrees/cycle*cycles/sec
-                        theta = theta - 2 * phaseDelay #Delay reflection by twice phaseDelay, for round trip.
-                        Z = self.uRefcoToImpedance(R0, rho, theta)
-                else:
-                    if coaxSpecs != "":
-                        (db, theta) = Coax.CoaxS21FromSpecs(Z0, 0, coaxSpecs, freq) # EON Jan 29, 2014
-
 #         if jig$="S11" then
 #             call uImpedanceToRefco Z0, ZReal, ZImag, rho, theta   'Impedance to reflection coefficient
 #             db=20*uSafeLog10(rho)   'rho to db
@@ -3051,36 +2953,33 @@ class OslCal:
 #             end if
 #         end if
 
-            if jig == "S11":
-                (rho, theta) = self.uImpedanceToRefco(Z0, Z)
-                db = 20 * uSafeLog10(rho)
-            else:
-                if jig == "S21Shunt":
-                    (db, theta) = self.uShuntImpedanceToS21DB(Z0, Z, 0, freq)
-                else:
-                    if coaxSpecs == "":
-                        (db,theta) = self.uSeriesImpedanceToS21DB(Z0, Z)
-
 #         theta=theta mod 360
 #         if theta<=-180 then theta=theta+360  'Put angle in bounds
 #         if theta>180 then theta=theta-360
 #         uWorkArray(i, 1)=db : uWorkArray(i,2)=theta 'Store db, degrees in uWorkArray
 
-            theta = theta % 360
-            if theta <= -180:
-                theta = theta + 360
-            if theta > 180:
-                theta = theta - 360
-            if self.oslDbg:
-                f.write("%2d, %7.0f, %10.3e, %10.3e, %10.3e, %10.3e\n" % (i, freq, RLCZ.real, RLCZ.imag, db, theta))
-            self.comboResp[i] = (db, theta)
-        if self.oslDbg:
-            f.close()
-
 #     next i
 #     uRLCComboResponse=0  'no error
 # end function
 
+        # the whole sweep is evaluated at once by the parsed model
+        isErr, model = RLCModel.Parse(spec)
+        if isErr or Z0 <= 0:
+            return True
+        n = self._nSteps
+        db, theta = model.Response(self.Fmhz[:n], Z0, jig)
+        self.comboResp = column_stack((db, theta))
+        if self.oslDbg:
+            f = open("ComboResponse1.txt","a")
+            f.write("%s, %f, %s, %s, R - %f, L - %f, C - %f, %f %f\n" %
+                    (spec, Z0, jig, model.connect, model.R, model.L, model.C,
+                     model.QL, model.QC))
+            for i in range(n):
+                f.write("%2d, %7.0f, %10.3e, %10.3e\n" %
+                        (i, self.Fmhz[i] * 1e6, db[i], theta[i]))
+            f.close()
+        return False
+
 #sub uPhaseShiftImpedance R0, theta, byref Zr, byref Zi   'Calc impedance of trans line terminated by Zr+j*Zi; replace Zr, Zi
 
     def uPhaseShiftImpedance(self, R0, theta, Z):
@@ -0,0 +1,143 @@
+from msaGlobal import SetModuleVersion
+import os, threading
+import calStore
+
+SetModuleVersion("calLibrary",("1.30","EON","05/20/2014"))
+
+#==============================================================================
+# Library of saved band calibrations.
+#
+# Every band calibration performed is also saved in the library directory,
+# one file per sweep configuration. The library indexes them by mode, path,
+# fixture, R0 and frequency coverage (read from the file headers), so that
+# a calibration matching a new sweep can be found and installed without
+# recalibrating. The most recently used calibrations are kept loaded.
+
+class CalLibrary:
+    def __init__(self, directory, hotSize=4):
+        self.directory = directory
+        self.hotSize = hotSize
+        self._index = None      # file name -> header metadata
+        self._hot = []          # [(file name, cal)], most recent last
+        self._lock = threading.Lock()
+        self._preloading = False
+
+    #--------------------------------------------------------------------------
+    # Index the library directory, reading only the file headers.
+
+    def Index(self):
+        with self._lock:
+            if self._index != None:
+                return self._index
+        index = {}
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(calStore.calExt):
+                    path = os.path.join(self.directory, name)
+                    try:
+                        index[path] = calStore.ReadCalHeader(path)["meta"]
+                    except (ValueError, KeyError, IOError):
+                        pass
+        with self._lock:
+            self._index = index
+        return index
+
+    #--------------------------------------------------------------------------
+    # Add calibration cal, taken with settings p, replacing any earlier one
+    # of the same sweep configuration.
+
+    def Add(self, cal, p):
+        meta = calStore.CalSweepMeta(cal, p)
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        name = "M%s_P%d_%s%s_%.6f-%.6f_%d%s%s" % (meta.get("mode"),
+                meta.get("pathNo", 1), meta["fixture"] or "Line",
+                ("", "_%g" % meta["R0"])[meta["R0"] != 0], meta["fStart"],
+                meta["fStop"], meta["nSteps"], ("", "log")[meta["isLogF"]],
+                calStore.calExt)
+        path = os.path.join(self.directory, name)
+        calStore.SaveCal(cal, path, p)
+        self.Index()
+        with self._lock:
+            self._index[path] = meta
+            self._hot = [(n, c) for n, c in self._hot if n != path]
+            self._Remember(path, cal)
+
+    #--------------------------------------------------------------------------
+    # Find the best calibration for a sweep of nSteps steps from fStart to
+    # fStop MHz in the given mode and path, for an OSL or line calibration
+    # (oslCal) and, for OSL, the given fixture ("Reflect", "Series" or
+    # "Shunt", as in calStore.CalSweepMeta) and R0. An exact match is
+    # best; otherwise the covering calibration with the finest steps.
+    # Returns (file name, exact), or (None, False) if none can be used.
+
+    def Find(self, mode, pathNo, oslCal, fStart, fStop, nSteps, isLogF,
+             fixture=None, R0=None):
+        best = None
+        bestStep = None
+        for path, meta in self.Index().items():
+            if meta.get("mode") != mode or meta.get("pathNo") != pathNo or \
+                    bool(meta.get("fixture")) != oslCal:
+                continue
+            if oslCal and ((fixture != None and meta["fixture"] != fixture) or
+                           (R0 != None and meta["R0"] != R0)):
+                continue
+            if round(meta["fStart"] - fStart, 8) == 0 and \
+                    round(meta["fStop"] - fStop, 8) == 0 and \
+                    meta["nSteps"] == nSteps and meta["isLogF"] == isLogF:
+                return path, True
+            if meta["fStart"] <= fStart and meta["fStop"] >= fStop:
+                step = (meta["fStop"] - meta["fStart"]) / max(meta["nSteps"], 1)
+                if best == None or step < bestStep:
+                    best, bestStep = path, step
+        return best, False
+
+    #--------------------------------------------------------------------------
+    # Return the calibration saved in file path, loading it if not hot.
+
+    def Get(self, path):
+        with self._lock:
+            for i, (name, cal) in enumerate(self._hot):
+                if name == path:
+                    self._hot.append(self._hot.pop(i))
+                    return cal
+        cal = calStore.LoadCal(path)
+        with self._lock:
+            self._Remember(path, cal)
+        return cal
+
+    def _Remember(self, path, cal):
+        self._hot.append((path, cal))
+        del self._hot[:-self.hotSize]
+
+    #--------------------------------------------------------------------------
+    # Start loading, in the background, the most recently saved calibrations
+    # for mode and path that aren't already hot.
+
+    def Preload(self, mode, pathNo):
+        with self._lock:
+            if self._preloading:
+                return
+            self._preloading = True
+        thread = threading.Thread(target=self._Preload, args=(mode, pathNo))
+        thread.setDaemon(True)
+        thread.start()
+
+    def _Preload(self, mode, pathNo):
+        try:
+            paths = [path for path, meta in self.Index().items()
+                     if meta.get("mode") == mode and
+                        meta.get("pathNo") == pathNo]
+            paths.sort(key=lambda path: os.stat(path).st_mtime)
+            for path in paths[-self.hotSize:]:
+                with self._lock:
+                    hot = path in [name for name, cal in self._hot]
+                if not hot:
+                    try:
+                        self.Get(path)
+                    except (ValueError, KeyError, IOError):
+                        pass
+        except OSError:
+            pass
+        finally:
+            self._preloading = False
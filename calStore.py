@@ -0,0 +1,240 @@
+from msaGlobal import isWin, SetModuleVersion
+import json, os, struct, zlib
+from numpy import array, ascontiguousarray, empty, float64, fromfile, memmap
+
+SetModuleVersion("calStore",("1.30","EON","05/20/2014"))
+
+#==============================================================================
+# Binary calibration files.
+#
+# A calibration file is a short header followed by the data, one float64
+# channel (column) after another, each with one value per frequency step:
+#
+#   "MSACAL\r\n", format version and header length (two little-endian
+#   uint32s), a JSON header giving the kind of calibration, its channel
+#   names, the step count, the CRC-32 of the data and any metadata, then
+#   padding to a 64-byte boundary and the data.
+#
+# Loading reads the data in one block (or memory-maps it) instead of
+# parsing it. The existing text formats can still be read and written with
+# ImportText and ExportText.
+
+calMagic = "MSACAL\r\n"
+calFormatVersion = 1
+calExt = ".cal"
+calAlign = 64
+
+# channels stored for each kind of calibration
+calChannels = {
+    "line": ("Fmhz", "Sdb", "Sdeg", "Scdeg"),
+    "osl":  ("Fmhz", "Are", "Aim", "Bre", "Bim", "Cre", "Cim",
+             "RefDb", "RefDeg"),
+    "mag":  ("Madc", "Sdb", "Sdeg"),
+    "freq": ("Fmhz", "db"),
+}
+
+# OslCal attributes kept as metadata
+oslMetaAttrs = ("when", "path", "isLogF", "OSLBandRefType", "S11JigType",
+                "S11BridgeR0", "S11FixR0", "S21JigAttach", "S21JigR0",
+                "S21JigShuntDelay", "OslOpenSpec", "OslShortSpec",
+                "OslLoadSpec")
+
+#------------------------------------------------------------------------------
+# Write the channels in data (a sequence of equal-length arrays, in the
+# order given by calChannels[kind]) to a calibration file.
+
+def WriteCalFile(fileName, kind, data, meta={}):
+    data = ascontiguousarray(array(data, dtype=float64))
+    names = calChannels[kind]
+    if data.ndim != 2 or len(data) != len(names):
+        raise ValueError("%s calibration needs channels %s" % \
+                         (kind, ", ".join(names)))
+    header = json.dumps({"kind": kind, "channels": list(names),
+                         "steps": data.shape[1], "meta": meta,
+                         "crc": zlib.crc32(buffer(data)) & 0xffffffff},
+                        default=float)
+    start = len(calMagic) + 8 + len(header)
+    pad = -start % calAlign
+    # write a new file and rename it, so a failed write leaves the old one
+    tmpName = fileName + ".tmp"
+    f = open(tmpName, "wb")
+    f.write(calMagic)
+    f.write(struct.pack("<II", calFormatVersion, len(header) + pad))
+    f.write(header + " " * pad)
+    data.tofile(f)
+    f.close()
+    if os.path.exists(fileName):
+        os.remove(fileName)
+    os.rename(tmpName, fileName)
+
+#------------------------------------------------------------------------------
+# Read a calibration file, returning (kind, channels, meta) where channels
+# is a dict of arrays by name. The data is memory-mapped copy-on-write
+# unless mmap is False (the default on Windows, where a mapped file can't
+# be replaced while in use). The data is checked in place, without a copy.
+
+def ReadCalFile(fileName, verify=True, mmap=not isWin):
+    f = open(fileName, "rb")
+    try:
+        header, offset = _ReadHeader(f, fileName)
+        names = header["channels"]
+        shape = (len(names), header["steps"])
+        if mmap:
+            data = memmap(fileName, dtype="<f8", mode="c", offset=offset,
+                          shape=shape)
+        else:
+            f.seek(offset)
+            data = fromfile(f, dtype="<f8", count=shape[0]*shape[1])
+            data = data.reshape(shape)
+    finally:
+        f.close()
+    if verify and zlib.crc32(buffer(data)) & 0xffffffff != header["crc"]:
+        raise ValueError("%s: calibration data is corrupt" % fileName)
+    return header["kind"], dict(zip(names, data)), header["meta"]
+
+# Read just the header of a calibration file, as a dict.
+
+def ReadCalHeader(fileName):
+    f = open(fileName, "rb")
+    try:
+        return _ReadHeader(f, fileName)[0]
+    finally:
+        f.close()
+
+def _ReadHeader(f, fileName):
+    if f.read(len(calMagic)) != calMagic:
+        raise ValueError("%s is not a calibration file" % fileName)
+    version, headerLen = struct.unpack("<II", f.read(8))
+    if version > calFormatVersion:
+        raise ValueError("%s: unsupported calibration format %d" % \
+                         (fileName, version))
+    header = json.loads(f.read(headerLen))
+    return header, len(calMagic) + 8 + headerLen
+
+#------------------------------------------------------------------------------
+# Save a line calibration (Spectrum) or OSL calibration (OslCal) to a binary
+# file. p supplies the sweep settings, as for WriteS1P. The sweep it covers
+# is recorded too, as returned by CalSweepMeta.
+
+def SaveCal(cal, fileName, p=None):
+    meta = CalSweepMeta(cal, p)
+    if cal.oslCal:
+        meta.update([(attr, getattr(cal, attr, None))
+                     for attr in oslMetaAttrs])
+        A, B, C = cal.OSLBandA, cal.OSLBandB, cal.OSLBandC
+        ref = array(cal.OSLBandRef, dtype=float64)
+        data = (cal.Fmhz, A.real, A.imag, B.real, B.imag, C.real, C.imag,
+                ref[:,0], ref[:,1])
+        WriteCalFile(fileName, "osl", data, meta)
+    else:
+        meta["desc"] = cal.desc
+        data = (cal.Fmhz, cal.Sdb, cal.Sdeg, cal.Scdeg)
+        WriteCalFile(fileName, "line", data, meta)
+
+# Sweep and fixture description of a calibration: mode, path, fixture, R0
+# and frequency coverage. An OSL calibration's fixture is "Reflect" for a
+# bridge, or the attachment ("Series" or "Shunt") of a transmission jig.
+
+def CalSweepMeta(cal, p=None):
+    meta = {"fStart": float(cal.Fmhz[0]), "fStop": float(cal.Fmhz[-1]),
+            "nSteps": len(cal.Fmhz) - 1, "isLogF": bool(cal.isLogF)}
+    if cal.oslCal:
+        fixture = cal.S11JigType
+        if fixture == "Trans":
+            fixture = cal.S21JigAttach or fixture
+        meta.update({"pathNo": cal.path, "fixture": fixture,
+                     "R0": float(cal.S11BridgeR0 or 0)})
+    else:
+        meta.update({"fixture": "", "R0": 0.})
+        if p:
+            meta["pathNo"] = p.RBWSelindex + 1
+    if p:
+        meta["mode"] = p.mode
+    return meta
+
+#------------------------------------------------------------------------------
+# Load a calibration saved by SaveCal, constructing its Spectrum or OslCal.
+# The data is copied into them, so it is read rather than mapped.
+
+def LoadCal(fileName):
+    kind, ch, meta = ReadCalFile(fileName, mmap=False)
+    Fmhz = ch["Fmhz"]
+    n = len(Fmhz)
+    if kind == "line":
+        from spectrum import Spectrum
+        cal = Spectrum("", meta.get("pathNo", 1), Fmhz[0], Fmhz[-1], n - 1,
+                       Fmhz)
+        cal.desc = meta.get("desc", cal.desc)
+        cal.Sdb = ch["Sdb"]
+        cal.Sdeg = ch["Sdeg"]
+        cal.Scdeg = ch["Scdeg"]
+    elif kind == "osl":
+        from cal import OslCal
+        cal = OslCal(meta["when"], meta["path"], meta["isLogF"], Fmhz[0],
+                     Fmhz[-1], n - 1, Fmhz)
+        for attr in oslMetaAttrs:
+            if meta.get(attr) != None:
+                setattr(cal, attr, meta[attr])
+        cal.OSLBandA = _Complex(ch["Are"], ch["Aim"])
+        cal.OSLBandB = _Complex(ch["Bre"], ch["Bim"])
+        cal.OSLBandC = _Complex(ch["Cre"], ch["Cim"])
+        cal.OSLBandRef = array((ch["RefDb"], ch["RefDeg"])).T.copy()
+    else:
+        raise ValueError("%s holds a %s table, not a sweep calibration" % \
+                         (fileName, kind))
+    return cal
+
+def _Complex(re, im):
+    Z = empty(len(re), dtype=complex)
+    Z.real = re
+    Z.imag = im
+    return Z
+
+#------------------------------------------------------------------------------
+# Text format converters. ImportText reads a line or OSL calibration from an
+# S1P file, returning None if it is neither; ExportText writes one.
+
+def ImportText(fileName):
+    from spectrum import Spectrum
+    cal = Spectrum.FromS1PFile(fileName)
+    if cal == None:
+        from cal import OslCal
+        cal = OslCal.FromS1PFile(fileName)
+    return cal
+
+def ExportText(cal, fileName, p):
+    cal.WriteS1P(fileName, p, contPhase=True)
+
+# Convert an S1P calibration file to a binary one, returning the new name.
+
+def ConvertTextFile(fileName, p=None):
+    cal = ImportText(fileName)
+    if cal == None:
+        raise ValueError("%s: no calibration data found" % fileName)
+    newName = os.path.splitext(fileName)[0] + calExt
+    SaveCal(cal, newName, p)
+    return newName
+
+#------------------------------------------------------------------------------
+# Read a path (kind "mag") or frequency ("freq") calibration table from its
+# text file using parse (CalParseMagFile or CalParseFreqFile), keeping a
+# binary copy beside it. The copy is used while the text file is unchanged.
+# Returns the table's channels as arrays.
+
+def LoadCalTable(textName, kind, parse):
+    binName = os.path.splitext(textName)[0] + calExt
+    st = os.stat(textName)
+    source = [os.path.basename(textName), st.st_mtime, st.st_size]
+    if os.path.exists(binName):
+        try:
+            binKind, ch, meta = ReadCalFile(binName, mmap=False)
+            if binKind == kind and meta.get("source") == source:
+                return [ch[name] for name in calChannels[kind]]
+        except (ValueError, KeyError, IOError, struct.error):
+            pass
+    table = parse(open(textName, "Ur"))
+    try:
+        WriteCalFile(binName, kind, table, {"source": source})
+    except (ValueError, IOError, OSError):
+        pass
+    return [array(col, dtype=float64) for col in table]
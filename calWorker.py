@@ -0,0 +1,99 @@
+from msaGlobal import SetModuleVersion
+import os, Queue, threading, traceback
+from numpy import linspace, log10, logspace
+from util import Prefs
+
+SetModuleVersion("calWorker",("1.30","EON","05/20/2014"))
+
+#==============================================================================
+# Background calibration worker.
+#
+# Calibration files are saved by a thread of its own rather than the GUI
+# thread, in the order the saves were requested. When a base calibration is
+# captured, the worker also interpolates it to the sweep of each saved test
+# setup it covers, so that when the user changes to one of those sweeps the
+# interpolated calibration is already cached in the calibration object.
+
+class CalWorker:
+    def __init__(self, setupsDir):
+        self.setupsDir = setupsDir
+        self._jobs = Queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    #--------------------------------------------------------------------------
+    # Queue a call of func(*args) on the worker thread.
+
+    def Submit(self, func, *args):
+        self._jobs.put((func, args))
+        with self._lock:
+            if self._thread == None:
+                self._thread = threading.Thread(target=self._Run)
+                self._thread.setDaemon(True)
+                self._thread.start()
+
+    # Wait until all queued work is done. Must not be called from a job.
+
+    def Wait(self):
+        self._jobs.join()
+
+    def _Run(self):
+        while True:
+            func, args = self._jobs.get()
+            try:
+                func(*args)
+            except:
+                traceback.print_exc()
+            self._jobs.task_done()
+
+    #--------------------------------------------------------------------------
+    # Sweep windows (fStart, fStop, nSteps, isLogF) of the saved test setups
+    # in the given mode and path, most recently saved first.
+
+    def SweepWindows(self, mode, pathNo):
+        setups = []
+        if os.path.isdir(self.setupsDir):
+            for fn in os.listdir(self.setupsDir):
+                if fn.startswith("TestSetup"):
+                    path = os.path.join(self.setupsDir, fn)
+                    setups.append((os.stat(path).st_mtime, path))
+        setups.sort(reverse=True)
+        windows = []
+        for mtime, path in setups:
+            s = Prefs.FromFile(path)
+            try:
+                if s.mode != mode or s.RBWSelindex + 1 != pathNo:
+                    continue
+                window = (s.fStart, s.fStop, s.nSteps, bool(s.isLogF))
+            except AttributeError:
+                continue
+            if window not in windows:
+                windows.append(window)
+        return windows
+
+    #--------------------------------------------------------------------------
+    # Queue interpolation of base calibration cal to the test setup sweeps
+    # it covers.
+
+    def PrecomputeBase(self, cal, mode, pathNo):
+        if cal:
+            self.Submit(self._PrecomputeBase, cal, mode, pathNo)
+
+    def _PrecomputeBase(self, cal, mode, pathNo):
+        for fStart, fStop, nSteps, isLogF in self.SweepWindows(mode, pathNo):
+            if fStart < cal.Fmhz[0] or fStop > cal.Fmhz[-1]:
+                continue
+            fMhz = SweepFreqs(fStart, fStop, nSteps, isLogF)
+            if cal.oslCal:
+                cal.InterpolatedBand(fMhz)
+            else:
+                cal.InterpolatedCal(fMhz)
+
+#------------------------------------------------------------------------------
+# Step frequencies of a sweep, as MSA.NewScanSettings calculates them.
+
+def SweepFreqs(fStart, fStop, nSteps, isLogF):
+    if isLogF:
+        fStart = max(fStart, 1e-6)
+        return logspace(log10(fStart), log10(fStop), num=nSteps+1)
+    return linspace(fStart, fStop, nSteps+1)
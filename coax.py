@@ -1042,15 +1042,15 @@ class Coax:
             args = re.split(" *, *", coaxSpecs)
             knum = 0
             for val in args:
-                m = re.match("([A-Z]+)(.*)",val)
-                if m.groups == 2:
+                m = re.match("([A-Za-z]+)(.*)",val)
+                if m:
                     tag = m.group(1)
                     v = floatSI(m.group(2))
                     if tag == "Z":
                         R0 = v
                     elif tag == "V":
                         VF = v
-                    elif tag == "K":
+                    elif tag == "K" or tag == "k":  # CoaxSpec writes K2 as k
                         if knum == 0:
                             K1 = v
                             knum = 1
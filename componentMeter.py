@@ -1,6 +1,5 @@
 from msaGlobal import GetFontSize, GetMsa, SetModuleVersion
 import wx
-import copy as dcopy
 from math import sqrt
 from numpy import Inf, pi
 from functionDialog import FunctionDialog
@@ -230,7 +229,7 @@ class ComponentDialog(FunctionDialog):
                 frame.WaitForStop()
                 msa.calibrating = False
                 p.planeExt = savePlaneExt
-                frame.SetBandCal(dcopy.deepcopy(frame.spectrum))
+                frame.SetBandCal(frame.spectrum.Copy())
                 frame.SetCalLevel(2)
             self.freq = 0.1
             self.inCal = False
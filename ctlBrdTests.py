@@ -1,4 +1,4 @@
-from msaGlobal import GetCb, SetModuleVersion
+from msaGlobal import GetCb, GetMsa, SetModuleVersion
 import wx
 
 SetModuleVersion("ctlBrdTests",("1.30","EON","05/20/2014"))
@@ -114,4 +114,5 @@ class TestBtn(wx.Button):
                 self.parent.ctlByte &= ~self.mask
             cb.OutControl(self.parent.ctlByte ^ cb.contclear)
         cb.Flush()
+        GetMsa().InvalidateHardwareState()
 
@@ -4,6 +4,7 @@ from msa import MSA
 from util import CentSpanToStartStop, divSafe, floatOrEmpty, isNumber, mhzStr,\
     StartStopToCentSpan
 from numKeypad import TextCtrl
+import synth
 
 SetModuleVersion("ddsUtils",("1.30","JGH","05/20/2014"))
 
@@ -353,7 +354,7 @@ class ddsUtils(wx.Dialog):   # JGH 5/10/14
         global cb, msa
 ##        ddsclock = float(self.masterclockBox.GetValue()) # JGH 5/10/14 3 lines
 ##        print ("ddsUtils>258< msa.masterclock: ", msa.masterclock)
-        base = int(round(divSafe(freq * (1<<32), msa.masterclock)))
+        base = int(synth.DDSWords(freq, msa.masterclock)[0])
 ##        base = int(round(divSafe(freq * (1<<32), ddsclock)))
 ##        print ("ddsUtils>261< base %8x" % base)
         DDSbits = base << P1_DDSDataBit
@@ -371,3 +372,4 @@ class ddsUtils(wx.Dialog):   # JGH 5/10/14
         cb.SetP(2, 0)
         cb.Flush()
         cb.setIdle()
+        msa.InvalidateHardwareState()
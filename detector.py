@@ -0,0 +1,143 @@
+from msaGlobal import SetModuleVersion
+from numpy import angle, array, exp, flatnonzero, log10, maximum, minimum, \
+    pi, seterr, where, zeros
+
+SetModuleVersion("detector",("1.30","EON","05/20/2014"))
+
+# detector modes, in chooser order
+DET_NORMAL, DET_MAX, DET_MIN, DET_AVG, DET_EXP = range(5)
+detectorNames = ("Normal", "Max Hold", "Min Hold", "Average", "Exp Average")
+
+#==============================================================================
+# A trace detector, applied to a spectrum's data before its traces are
+# computed.
+#
+# Max and min hold keep each step's highest or lowest magnitude (with its
+# phase). Average is the mean of each step's last count sweeps, and Exp
+# Average an exponential average with a time constant of count sweeps,
+# starting as a plain mean. Averages are of dB values, or of the complex
+# values when vector is set (in the VNA modes).
+#
+# The detected data is kept in a copy of the spectrum, out, from which the
+# traces are made. Each step is detected as the spectrum stores it, so
+# every value counts even when a step is set more than once between draws;
+# other changes to the spectrum are processed when the traces are drawn.
+# Detection starts over with each new spectrum (such as after the sweep
+# changes) and when the mode or count changes.
+
+class Detector:
+    def __init__(self, mode=DET_NORMAL, count=4):
+        self.mode = mode
+        self.count = count
+        self.vector = False
+        self.spec = None
+        self.out = None
+
+    def SetMode(self, mode, count):
+        if mode != self.mode or count != self.count:
+            self.mode = mode
+            self.count = max(int(count), 1)
+            self.Reset()
+
+    def Reset(self):
+        if self.spec != None:
+            self.spec.derived.pop(self, None)
+        self.spec = None
+        self.out = None
+
+    #--------------------------------------------------------------------------
+    # Apply the detector to spectrum spec, returning the spectrum of
+    # detected data. Steps changed in spec since the last call are
+    # processed; spec tells the detector of them through spec.derived.
+
+    def Detect(self, spec, vector):
+        if spec is not self.spec or vector != self.vector or \
+                len(spec.Fmhz) != len(self.out.Fmhz) or \
+                spec.derived.get(self) is not self:
+            self.Reset()
+            self.spec = spec
+            self.vector = vector
+            self.out = out = spec.Copy()
+            n = len(spec.Fmhz)
+            self.n = zeros(n, dtype=int)            # sweeps seen per step
+            # held or averaged values, and phases held with them
+            isComplex = vector and self.mode in (DET_AVG, DET_EXP)
+            self.acc = zeros(n, (float, complex)[isComplex])
+            self.held = zeros((n, 2))
+            if self.mode == DET_AVG:
+                self.history = zeros((self.count, n), self.acc.dtype)
+            self.dirty = zeros(n, dtype=bool)
+            self.dirty[:spec.maxStep+1] = True
+            spec.derived[self] = self
+        out = self.out
+        out.isSeriesFix = getattr(spec, "isSeriesFix", False)
+        out.isShuntFix = getattr(spec, "isShuntFix", False)
+        out.f = spec.Fmhz
+        out.step = spec.step
+        out.maxStep = spec.maxStep
+        self.Update()
+        out.UpdateDerived()
+        return out
+
+    def Invalidate(self, lo, hi):
+        self.dirty[lo:hi] = True
+
+    # Step i of the spectrum has been set: detect it now.
+
+    def SetStep(self, spec, i):
+        self.dirty[i] = False
+        self._Detect(array([i]))
+
+    # Process the changed steps, each as one more sweep.
+
+    def Update(self):
+        if self.out == None:
+            return
+        s = flatnonzero(self.dirty)
+        if len(s) == 0:
+            return
+        self.dirty[s] = False
+        self._Detect(s)
+
+    def _Detect(self, s):
+        spec, out = self.spec, self.out
+        lo, hi = s[0], s[-1] + 1
+        out.CopySteps(spec, s)
+        self.n[s] += 1
+        n = self.n[s]
+        first = n == 1
+        Sdb, Sdeg, Scdeg = spec.Sdb[s], spec.Sdeg[s], spec.Scdeg[s]
+
+        mode = self.mode
+        if mode == DET_MAX or mode == DET_MIN:
+            if mode == DET_MAX:
+                keep = (self.acc[s] > Sdb) & ~first
+            else:
+                keep = (self.acc[s] < Sdb) & ~first
+            self.acc[s] = where(keep, self.acc[s], Sdb)
+            out.Sdb[s] = self.acc[s]
+            out.Sdeg[s] = where(keep, self.held[s, 0], Sdeg)
+            out.Scdeg[s] = where(keep, self.held[s, 1], Scdeg)
+            self.held[s, 0] = out.Sdeg[s]
+            self.held[s, 1] = out.Scdeg[s]
+        elif mode == DET_AVG or mode == DET_EXP:
+            if self.vector:
+                x = 10**(Sdb/20) * exp(1j*pi*Sdeg/180)
+            else:
+                x = Sdb
+            if mode == DET_AVG:
+                self.history[(n - 1) % self.count, s] = x
+                avg = self.history[:, s].sum(axis=0) / minimum(n, self.count)
+            else:
+                avg = self.acc[s] + (x - self.acc[s]) / minimum(n, self.count)
+            self.acc[s] = avg
+            if self.vector:
+                save = seterr(all="ignore")
+                out.Sdb[s] = maximum(20*log10(abs(avg)), -200)
+                seterr(**save)
+                out.Sdeg[s] = deg = angle(avg, deg=True)
+                # keep the raw data's continuous phase offset
+                out.Scdeg[s] = deg + (Scdeg - Sdeg)
+            else:
+                out.Sdb[s] = avg
+        out.Invalidate(lo, hi)
@@ -0,0 +1,107 @@
+from msaGlobal import msPerUpdate, SetModuleVersion
+import threading, time
+
+SetModuleVersion("framePacer",("1.30","EON","05/20/2014"))
+
+#==============================================================================
+# Paces display updates during a scan.
+#
+# The scan thread asks for an update when one is due. Requests made while
+# one is still waiting to be drawn are coalesced, and counted as dropped
+# frames. The GUI times the drawing of each frame, and the update interval
+# is set to keep drawing to about share of the time, within msMin to
+# msMax. So a slow display is updated less often, leaving the scan thread
+# its time, while a fast one moves smoothly.
+
+class FramePacer:
+    def __init__(self, share=0.25, msMin=20, msMax=1000):
+        self.share = share
+        self.msMin = msMin
+        self.msMax = msMax
+        self.interval = msPerUpdate     # current update interval (ms)
+        self._lock = threading.Lock()
+        self._pending = False
+        self._lastRequest = 0.
+        self._frameStart = None
+        self._lastFrame = 0.
+        self.Reset()
+
+    # Clear the statistics, as when a scan starts.
+
+    def Reset(self):
+        self._lastSweep = None
+        self.frames = 0         # frames drawn
+        self.dropped = 0        # update requests coalesced
+        self.frameMs = 0.       # average drawing time (ms)
+        self.maxFrameMs = 0.    # longest drawing time (ms)
+        self.sweepSec = 0.      # time of last complete sweep (s)
+
+    #--------------------------------------------------------------------------
+    # Scan thread side: True if an update should be posted now. Updates come
+    # no more often than the interval, and only one is waiting at a time.
+
+    def Request(self):
+        now = time.time()
+        if (now - self._lastRequest) * 1000 < self.interval:
+            return False
+        with self._lock:
+            self._lastRequest = now
+            if self._pending:
+                self.dropped += 1
+                return False
+            self._pending = True
+            return True
+
+    #--------------------------------------------------------------------------
+    # GUI side: Begin returns True if a frame may be drawn now, which must
+    # then be followed by End. Frames asked for well within the interval
+    # after the last are skipped.
+
+    def Begin(self):
+        now = time.time()
+        with self._lock:
+            self._pending = False
+            if (now - self._lastFrame) * 1000 < 0.8 * self.interval:
+                self.dropped += 1
+                return False
+        self._frameStart = self._lastFrame = now
+        return True
+
+    # End a frame, returning True if the interval has changed enough that
+    # the display timer should be restarted with it.
+
+    def End(self):
+        ms = (time.time() - self._frameStart) * 1000
+        self.frames += 1
+        if self.frames == 1:
+            self.frameMs = ms
+        else:
+            self.frameMs += (ms - self.frameMs) / 8
+        self.maxFrameMs = max(self.maxFrameMs, ms)
+        interval = min(max(self.frameMs / self.share, self.msMin), self.msMax)
+        changed = abs(interval - self.interval) > 0.2 * self.interval
+        if changed:
+            self.interval = int(interval)
+        return changed
+
+    # Note the completion of a sweep, for the sweep time. Called by the scan
+    # thread as it wraps, so the time doesn't depend on when frames are
+    # drawn.
+
+    def SweepDone(self):
+        now = time.time()
+        if self._lastSweep != None:
+            self.sweepSec = now - self._lastSweep
+        self._lastSweep = now
+
+    #--------------------------------------------------------------------------
+    # Lines for the Variables window.
+
+    def GetTextList(self):
+        return [
+            "sweep time = %0.2f s" % self.sweepSec,
+            "frame time = %0.1f ms (max %0.1f)" % (self.frameMs,
+                                                  self.maxFrameMs),
+            "update interval = %d ms" % self.interval,
+            "frames = %d dropped = %d" % (self.frames, self.dropped),
+            ]
@@ -1,7 +1,8 @@
 from msaGlobal import GetFontSize, GetMsa, GetVersion, SetModuleVersion
 import re, string, time, wx
 import wx.lib.colourselect as csel
-from numpy import array, clip, concatenate, floor, log10, nan_to_num
+from numpy import arange, array, clip, column_stack, flatnonzero, floor, \
+    log10, maximum, minimum, nan_to_num, r_, repeat, zeros
 from vScale import VScale
 from events import LogGUIEvent
 from theme import red, blue
@@ -11,6 +12,78 @@ from util import MHz, ns, si, SI_NO,StdScale
 
 SetModuleVersion("graphPanel",("1.30","EON","05/20/2014"))
 
+#==============================================================================
+# The envelope of a trace with more points than pixel columns. Each column's
+# points are reduced to four: its first, lowest, highest, and last, in
+# step order, so the line keeps its shape and narrow spurs stay visible.
+# Drawing time then depends on the graph's width rather than the number of
+# steps. Columns are recomputed only where points have changed since the
+# last update.
+
+class TraceEnvelope:
+    def __init__(self):
+        self.x = self.y = None      # the points last seen
+        self.starts = None          # index of each column's first point
+        self.index = None           # the envelope point indices, 4 per column
+
+    # Return the indices of the envelope points of x, y (window coordinates,
+    # x increasing).
+
+    def Update(self, x, y):
+        n = len(x)
+        lo, hi = 0, n               # range of changed points
+        if self.x is not None:
+            m = min(n, len(self.x))
+            changed = flatnonzero((x[:m] != self.x[:m]) |
+                                  (y[:m] != self.y[:m]))
+            lo = hi = m
+            if len(changed):
+                lo, hi = changed[0], changed[-1] + 1
+            if n != len(self.x):
+                hi = n
+            if lo >= hi and n == len(self.x):
+                return self.index.ravel()
+        self.x, self.y = x, y
+
+        # columns holding the changed points, and any new columns
+        if hi == n:
+            col = floor(x).astype(int)
+            starts = flatnonzero(r_[True, col[1:] != col[:-1]])
+            index = zeros((len(starts), 4), dtype=int)
+            kHi = len(starts)
+        else:
+            starts = self.starts
+            index = self.index
+            kHi = starts.searchsorted(hi - 1, "right")
+        kLo = starts.searchsorted(lo, "right") - 1
+        if index is not self.index and self.index is not None:
+            k = min(kLo, len(self.index))
+            index[:k] = self.index[:k]
+        ends = r_[starts[1:], n][kLo:kHi]
+        index[kLo:kHi] = _Envelope(y, starts[kLo:kHi], ends)
+        self.starts, self.index = starts, index
+        return index.ravel()
+
+# Indices of the first, lowest, highest, and last of the points of y in each
+# range starts[k] to ends[k]-1, one row per range.
+
+def _Envelope(y, starts, ends):
+    lo = starts[0]
+    v = y[lo:ends[-1]]
+    s = starts - lo
+    seg = repeat(arange(len(s)), ends - starts)
+    env = zeros((len(s), 4), dtype=int)
+    env[:,0] = s
+    env[:,3] = ends - lo - 1
+    for j, vExt in ((1, minimum.reduceat(v, s)), (2, maximum.reduceat(v, s))):
+        # first point of each range at its extreme
+        at = flatnonzero(v == vExt[seg])
+        segAt = seg[at]
+        env[:,j] = at[r_[True, segAt[1:] != segAt[:-1]]]
+    iMin, iMax = env[:,1].copy(), env[:,2].copy()
+    env[:,1], env[:,2] = minimum(iMin, iMax), maximum(iMin, iMax)
+    return env + lo
+
 #==============================================================================
 # A graph of a set of traces.
 
@@ -20,6 +93,9 @@ class GraphPanel(wx.Panel):
         self.prefs = p = frame.prefs
         self._gridBitmap = None
         self._haveDrawnGrid = False
+        self._traceBitmap = None    # grid with traces drawn over it
+        self._drawnTraces = {}      # trace lines in it, by name
+        self._envelopes = {}        # envelopes of long traces, by name
         self._isReady = False
 
         # settable parameters
@@ -191,7 +267,8 @@ class GraphPanel(wx.Panel):
                 isLogF = False
 
         # draw the grid, axes, and legend if they're new or updated
-        if not self._haveDrawnGrid:
+        newGrid = not self._haveDrawnGrid
+        if newGrid:
             LogGUIEvent("OnPaint: redraw grid")
             # (GraphicsContext doesn't like AutoBufferedPaintDC, so we use:)
             if False:
@@ -518,8 +595,6 @@ class GraphPanel(wx.Panel):
             dc.SelectObject(wx.NullBitmap)
             self._haveDrawnGrid = True
             dc = dc1
-            ##print ("Graph DoDrawing\n"
-            dc.DrawBitmap(self._gridBitmap, 0, 0)
 
             ##dc.DestroyClippingRegion()
 
@@ -541,8 +616,6 @@ class GraphPanel(wx.Panel):
                 dc = wx.BufferedPaintDC(self)
                 dc.Clear()
 
-            dc.DrawBitmap(self._gridBitmap, 0, 0)
-
         ##LogGUIEvent("OnPaint: have grid")
 
         ##dc.SetClippingRegion(x0, y0, x1-x0, y1-y0)
@@ -552,7 +625,10 @@ class GraphPanel(wx.Panel):
 
         # ------ TRACES ------
 
-        # draw each trace in a different color
+        # find the window coordinates of each trace's points; the traces
+        # are then drawn, each in a different color, into the trace bitmap
+        traceLines = []
+        envelopes = {}
         for name, tr in sorted(self.traces.iteritems(), \
                      key=(lambda (k,v): -v.iScale)):
             LogGUIEvent("OnPaint: compute trace %s" % name)
@@ -582,10 +658,9 @@ class GraphPanel(wx.Panel):
             else:
                 jMin = max(min((int((h0 - trh0) / trdh) - 2), nv-2), 0)
                 jMax = max(min((int((h1 - trh0) / trdh) + 2), nv-1), 1)
-            jStep = max(int(1 / dx), 1)
             if self.printData:
                 print (tr.name, "trh0=", trh0, "trdh=", trdh, "jMin/Max=", \
-                        jMin, jMax, jStep, "nv=", nv)
+                        jMin, jMax, "nv=", nv)
 
             # h,v: coords of points to plot, in given units
             h = Fmhz[jMin:jMax+1]
@@ -615,70 +690,35 @@ class GraphPanel(wx.Panel):
             self.xs = x.copy()
             tr.ys = y.copy()
 
-            if True:
-##            if not isWin:
-                # GraphicsContext: faster and smoother (but broken in Windows?)
-                gc = wx.GraphicsContext.Create(dc)
-##                eraseWidth = 0
-                if tr.isMain and self.eraseOldTrace and trdh > 0 and p.bGap == True:
-                    # remove main line segs at the cursor to form a moving gap
-                    eraseWidth = int(10./(trdh*dx)) + 1
-                else:
-                    eraseWidth = 0
-                path = gc.CreatePath()
-                path.MoveToPoint(x[0], y[0])
-                for i in range(1, len(x)):
-                    if tr.isMain and i > self.cursorStep and \
-                                i <= self.cursorStep+eraseWidth:
-                        path.MoveToPoint(x[i], y[i])
-                    else:
-                        path.AddLineToPoint(x[i], y[i])
-                color = vColors[tr.iColor]
-                gc.SetPen(wx.Pen(color, tr.dotSize, wx.SOLID))
-                gc.StrokePath(path)
-
-                if self.graphWid/fullLen > 20:
-                    # draw larger dots at data points if X low-res
-                    dsz = self.dotSize
-                    path = gc.CreatePath()
-                    for i in range(len(x)):
-                        path.MoveToPoint(x[i], y[i])
-                        path.AddLineToPoint(x[i], y[i])
-                    gc.SetPen(wx.Pen(color, dsz, wx.SOLID))
-                    gc.StrokePath(path)
-
+            # runs of points to join, leaving out the main trace's line
+            # segments just past the cursor to form a moving gap
+            if tr.isMain and self.eraseOldTrace and trdh > 0 and p.bGap == True:
+                eraseWidth = int(10./(trdh*dx)) + 1
             else:
-                ##except NotImplementedError:
-                # form an array of pairs of begin-end line coords tween points
-                xy = concatenate((x.reshape(-1, 1), y.reshape(-1, 1)), axis=1)
-                xpyp = concatenate(([[0,0]], xy[:-1]))
-                lines = concatenate((xpyp, xy), axis=1)[1:]
-                if tr.isMain and self.eraseOldTrace and trdh > 0 and p.bGap == True:
-                    # remove main line segs at the cursor to form a moving gap
-                    eraseWidth = int(10./(trdh*dx)) + 1
-                else:
-                    erasewidth = 0
-                lines = concatenate((lines[:self.cursorStep],
-                                         lines[self.cursorStep+eraseWidth:]))
-##                if isPhase:
-##                    # remove phase line segments that wrap or have feeble mag
-##                    linesY = lines[:,1]
-##                    linesYP = lines[:,3]
-##                    lines = lines[(abs((linesY - linesYP) < (y1 - y0)/2) *
-##                                            (linesY < y1) * (linesYP < y1))]
-##                    lines = lines.tolist()
-                LogGUIEvent("OnPaint: draw trace %s" % name)
-                # draw that list of lines
-                color = vColors[tr.iColor]
-                dc.SetPen(wx.Pen(color, tr.dotSize, wx.SOLID))
-                dc.DrawLineList(lines, None)
-                if self.graphWid/fullLen > 20:
-                    ##dotEdge = [[self.dotSize/2+1, 0]]
-                    dotEdge = [[0, 0]]
-                    dots = concatenate((xy-dotEdge, xy+dotEdge),
-                                        axis=1).tolist()
-                    dc.SetPen(wx.Pen(color, self.dotSize, wx.SOLID))
-                    dc.DrawLineList(dots, None)
+                eraseWidth = 0
+            n = len(x)
+            if eraseWidth > 0:
+                c = min(max(self.cursorStep - jMin, 0), n)
+                runs = [(0, min(c + 1, n)), (min(c + eraseWidth, n), n)]
+            else:
+                runs = [(0, n)]
+            # draw larger dots at data points if X low-res
+            dots = self.graphWid/fullLen > 20
+            if n > 4 * (x[-1] - x[0] + 1):
+                # more points than can be seen: draw each pixel column's
+                # envelope instead
+                env = self._envelopes.get(name) or TraceEnvelope()
+                envelopes[name] = env
+                ie = env.Update(x, y)
+                runs = [(ie.searchsorted(a), ie.searchsorted(b))
+                        for a, b in runs]
+                x, y = x[ie], y[ie]
+            traceLines.append((name, tr, x, y, runs, dots))
+        self._envelopes = envelopes
+
+        LogGUIEvent("OnPaint: draw traces")
+        self.DrawTraceBitmap(traceLines, clientWid, clientHt, newGrid)
+        dc.DrawBitmap(self._traceBitmap, 0, 0)
 
         # ------ MARKERS ------
 
@@ -841,6 +881,93 @@ class GraphPanel(wx.Panel):
 
         LogGUIEvent("OnPaint: done")
 
+    #--------------------------------------------------------------------------
+    # Draw the traces into the trace bitmap, a copy of the grid bitmap with
+    # the traces over it. traceLines holds (name, trace, x, y, runs, dots)
+    # for each trace: the window coordinates of its points, the (start, end)
+    # index ranges of them to join with lines, and whether to put dots on
+    # them. The whole bitmap is redrawn after the grid is or when the traces
+    # have changed. Otherwise only the horizontal span where points have
+    # moved or been added, or the gap has moved, is restored from the grid
+    # and redrawn.
+
+    def DrawTraceBitmap(self, traceLines, clientWid, clientHt, newGrid):
+        drawn = {}
+        for name, tr, x, y, runs, dots in traceLines:
+            drawn[name] = (tr.Fmhz, tr.iColor, tr.dotSize, dots, x, y, runs)
+        prev = self._drawnTraces
+        self._drawnTraces = drawn
+        full = newGrid or self._traceBitmap == None or \
+                sorted(drawn.keys()) != sorted(prev.keys())
+
+        # find the span of x to redraw, xa to xb
+        xa, xb = self.x1, self.x0
+        for name, (Fmhz, iColor, size, dots, x, y, runs) in drawn.items():
+            if full:
+                break
+            pFmhz, pColor, pSize, pDots, px, py, pRuns = prev[name]
+            if Fmhz is not pFmhz or (iColor, size, dots) != \
+                                    (pColor, pSize, pDots):
+                full = True
+                break
+            m = min(len(x), len(px))
+            changed = flatnonzero((x[:m] != px[:m]) | (y[:m] != py[:m]))
+            lo, hi = m, max(len(x), len(px))    # points added or removed
+            if len(changed):
+                lo = changed[0]
+                if hi == m:
+                    hi = changed[-1] + 1
+            # run ends that have moved
+            for i in set(sum(runs, ())) ^ set(sum(pRuns, ())):
+                lo, hi = min(lo, i - 1), max(hi, i + 1)
+            if lo >= hi:
+                continue
+            # lines to the changed points change too
+            for xs in (x, px):
+                a, b = max(lo - 1, 0), min(hi + 1, len(xs))
+                if a < b:
+                    xa = min(xa, xs[a:b].min())
+                    xb = max(xb, xs[a:b].max())
+
+        mdc = wx.MemoryDC()
+        if full:
+            self._traceBitmap = wx.EmptyBitmap(clientWid, clientHt)
+            mdc.SelectObject(self._traceBitmap)
+        else:
+            if xa > xb:
+                return
+            pad = max(self.dotSize, 1) + 2
+            xa = int(max(xa - pad, self.x0))
+            xb = int(min(xb + pad, self.x1))
+            area = (xa, self.y0, xb - xa + 1, self.y1 - self.y0 + 1)
+            mdc.SelectObject(self._traceBitmap)
+            mdc.SetClippingRegion(*area)
+        mdc.DrawBitmap(self._gridBitmap, 0, 0)
+
+        # GraphicsContext: faster and smoother (but broken in Windows?)
+        gc = wx.GraphicsContext.Create(mdc)
+        if not full:
+            gc.Clip(*area)
+        vColors = self.vColors
+        for name, tr, x, y, runs, dots in traceLines:
+            # only the points within the span, and their neighbors
+            i0, i1 = 0, len(x)
+            if not full:
+                i0 = max(x.searchsorted(xa) - 1, 0)
+                i1 = x.searchsorted(xb, "right") + 1
+            color = vColors[tr.iColor]
+            gc.SetPen(wx.Pen(color, tr.dotSize, wx.SOLID))
+            for a, b in runs:
+                a, b = max(a, i0), min(b, i1)
+                if b - a >= 2:
+                    gc.StrokeLines(column_stack((x[a:b], y[a:b])).tolist())
+            if dots:
+                points = column_stack((x[i0:i1], y[i0:i1])).tolist()
+                gc.SetPen(wx.Pen(color, self.dotSize, wx.SOLID))
+                gc.StrokeLineSegments(points, points)
+        del gc
+        mdc.SelectObject(wx.NullBitmap)
+
     #--------------------------------------------------------------------------
     # Mouse event: holding mouse down in graph area puts a cursor on nearest
     # trace. Or a double-click adds the current marker.
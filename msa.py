@@ -34,15 +34,17 @@
 #2. def CreateDDS(self, ddsout, ddsclock)
 
 from msaGlobal import GetHardwarePresent, GetMsa, isWin, \
-    logEvents, msPerUpdate, SetCb, SetHardwarePresent, \
+    logEvents, SetCb, SetHardwarePresent, \
     SetLO1, SetLO2, SetLO3, SetModuleVersion
 import thread, time, traceback, wx
-from numpy import interp, isnan, linspace, log10, logspace, nan
+from numpy import array, interp, isnan, linspace, log10, logspace, nan, zeros
 from Queue import Queue
 from util import divSafe, modDegree, msElapsed
 from events import Event
+from framePacer import FramePacer
 from msaGlobal import UpdateGraphEvent
 from spectrum import Spectrum
+import synth
 
 SetModuleVersion("msa",("1.30","JGH/WS","05/20/2014"))
 
@@ -52,12 +54,31 @@ SetModuleVersion("msa",("1.30","JGH/WS","05/20/2014"))
 goodPhaseMagThreshold = 0x0000 # Scotty will determine usefulness of this 3/2/14
 
 debug = False
+
+# Control board and LOs of the primary MSA (the first one created), kept for
+# modules that still reach the hardware through module globals. Each MSA
+# instance owns its own cb, LO1, LO2 and LO3.
+msa = None
 cb = None
+LO1 = LO2 = LO3 = None
 
 #******************************************************************************
 #****                          MSA Hardware Back End                      *****
 #******************************************************************************
 
+#==============================================================================
+# Raised by the scan thread when the control board interface reports that
+# its ADC reads are out of sync.
+
+class SyncLostError(Exception):
+    pass
+
+# Raised during a recovery when the interface can't be reopened, as while a
+# reset board is still being enumerated.
+
+class ReopenError(Exception):
+    pass
+
 #==============================================================================
 # Modular Spectrum Analyzer.
 
@@ -74,9 +95,17 @@ class MSA:
 
     def __init__(self, frame):
         global msa
-        msa = self
+        if msa is None:
+            msa = self
         self.frame = frame
         p = frame.prefs
+        # control board interface and local oscillators of this instrument,
+        # created by InitializeHardware()
+        self.cb = None
+        self.LO1 = self.LO2 = self.LO3 = None
+        self.hardwarePresent = True
+        self.gui = None
+        self.pacer = FramePacer()   # display update pacing, for the gui
         self.winLPT = p.get("winLPT", False) # True if Win uses parallel port
         self.mode = p.get("mode", self.MODE_SA) # Default start mode
         # Exact frequency of the Master Clock (in MHz).
@@ -143,8 +172,12 @@ class MSA:
         # calibration arrays, if present
         self.baseCal = None # Calibration of through response with a genereric wideband sweep
         self.bandCal = None #
+        self.calLibrary = None # saved band calibrations (calLibrary.CalLibrary)
+        self.calWorker = None # background calibration work (calWorker.CalWorker)
         # set when calibration data doesn't align with current spectrum
         self.calNeedsInterp = False
+        # (cal, freqs, Sdb, Scdeg) of the line calibration interpolated
+        self._calInterp = None
         self.oslCal = None # EON Jan 10 2014
         # set when doing a scan
         self._scanning = False
@@ -188,6 +221,14 @@ class MSA:
         self.syndut = None  # JGH 2/8/14 syndutHook1
         self.dds1Sweep = False
         self.dds3Track = False
+        # transport error recovery: attempts allowed per step, and totals
+        self.maxRecoveries = p.get("maxRecoveries", 3)
+        self.recoveryCount = 0
+        self.recoveryMs = 0
+        self._checkpoint = None
+        self._resumed = False
+        # register values last sent to the hardware, by name
+        self._sentRegs = {}
 
     #--------------------------------------------------------------------------
     # Log one MSA event, given descriptive string. Records current time too.
@@ -232,7 +273,7 @@ class MSA:
     # Return equivalent 1G frequency for f, based on _GHzBand.
 
     def _Equiv1GFreq(self, f):
-        global LO2
+        LO2 = self.LO2
         if self._GHzBand == 1:
             return f
         elif  self._GHzBand == 2:
@@ -245,7 +286,7 @@ class MSA:
     # NOT USED ANY MORE: CODE MOVED TO CREATE SWEEP ARRAY
 
     def _CalculateAllStepsForLO1Synth(self, thisfreq, band):
-        global LO1, LO2
+        LO1, LO2 = self.LO1, self.LO2
         self._GHzBand = band
         thisfreq = self._Equiv1GFreq(thisfreq)  # get equivalent 1G frequency
         # calculate actual LO1 frequency
@@ -255,10 +296,13 @@ class MSA:
     # Calculate all steps for LO3 synthesizer.
 
     def _CalculateAllStepsForLO3Synth(self, TrueFreq):
-        global LO2, LO3
+        self.LO3.Calculate(self._LO3Freq(TrueFreq, self.LO2.freq))
+
+    # Return the wanted LO3 frequency for TrueFreq, given the LO2 frequency.
+
+    def _LO3Freq(self, TrueFreq, LO2freq):
         thisfreq = self._Equiv1GFreq(TrueFreq)  # get equivalent 1G frequency
 
-        LO2freq = LO2.freq
         if self.mode != self.MODE_SA:
             offset = self._offset
             if self._normrev == 0:
@@ -288,7 +332,7 @@ class MSA:
             # Sig Gen mode
             LO3freq = LO2freq + self._sgout
 
-        LO3.Calculate(LO3freq)
+        return LO3freq
 
     #--------------------------------------------------------------------------
     # _CommandAllSlims -- for SLIM Control and SLIM modules.
@@ -301,7 +345,7 @@ class MSA:
     # not transition with a data transition, preventing crosstalk in LPT cable.
 
     def _CommandAllSlims(self): # IS CALLED AT EVERY STEP OF THE SWEEP
-        global cb
+        cb = self.cb
         p = self.frame.prefs
 
         swP4Bits = self.StepArray[self._step][29]
@@ -309,9 +353,10 @@ class MSA:
         if 0 or debug:
             print("msa>307< step:", self._step, "swP4Bits:", swP4Bits, "slimBits", slimBits)
        
-        if self._step == 0 or self._step == self._nSteps:
+        if self._step == 0 or self._step == self._nSteps or self._resumed:
             # give the first step extra time to settle
             cb.msWait(200)
+            self._resumed = False
 
         else: 
             #Get the previous bit
@@ -325,7 +370,7 @@ class MSA:
                 # Remove data, leaving bitsRBW data to filter bank"
                 if p.rbwP4 == False:
                     cb.SetP(1, self.bitsRBW)
-                cb.SetP(4, swP4Bits)
+                self._SetP4(swP4Bits, False)
                 cb.msWait(200)
 
         cb.SendDevBytes(slimBits, cb.P1_Clk)    # JGH 2/9/14
@@ -345,13 +390,13 @@ class MSA:
 ##            # give PLLs more time to settle too
 ##        cb.msWait(100)
         if self.cftest == True:
-            LO2.CommandPLL(self.StepArray[self._step][9]) #scotty,Use VarsArray, LO2.PLLbits
+            self.LO2.CommandPLL(self.StepArray[self._step][9]) #scotty,Use VarsArray, LO2.PLLbits
 
     #--------------------------------------------------------------------------
     # Command just the PDM's static data.
 
     def _CommandPhaseOnly(self):
-        global cb
+        cb = self.cb
         cb.SetP(2, self.invPhase << cb.P2_pdminvbit)
         cb.setIdle()
 
@@ -441,30 +486,34 @@ class MSA:
     # Initialize MSA hardware.
 
     def InitializeHardware(self):
-        global cb, hardwarePresent, LO1, LO2, LO3
         p = self.frame.prefs
 
         from msa_cb import MSA_CB
-        hardwarePresent = GetHardwarePresent()
-        if not hardwarePresent:
-            if cb == None:
-                cb = MSA_CB()
+        if self.IsPrimary():
+            self.hardwarePresent = GetHardwarePresent()
+        if not self.hardwarePresent:
+            if self.cb == None:
+                self.cb = MSA_CB()
+                self._PublishHardware()
             return
 
         # Determine which interface to use to talk to the MSA's Control Board
 
+        cb = self.cb
         if not cb:
             if isWin and p.winLPT:
                 from msa_cb_pc import MSA_CB_PC
                 cb = MSA_CB_PC()
             else:
                 from msa_cb_usb import MSA_CB_USB
-                cb = MSA_CB_USB()
+                # an empty selection takes the first FX2 not already in use
+                cb = MSA_CB_USB(p.get("usbBus", 0), p.get("usbAddress", 0),
+                                p.get("usbSerial", ""))
                 cb.FindInterface()
                 if not cb.usbFX2 or not cb.ValidVersion():
+                    cb.Release()
                     cb = MSA_CB()
-                    hardwarePresent = False
-                    SetHardwarePresent(hardwarePresent)
+                    self._SetHardwarePresent(False)
         else:
             # test interface to see that it's still there
             try:
@@ -472,14 +521,11 @@ class MSA:
                 cb.Flush()
             except:
                 cb = MSA_CB()
-                hardwarePresent = False
-                SetHardwarePresent(hardwarePresent)
-        SetCb(cb)
-
-        
+                self._SetHardwarePresent(False)
+        self.cb = cb
 
-        if not hardwarePresent:
-            if p.syntData:
+        if not self.hardwarePresent:
+            if p.syntData and self.gui:
 ##                print ("\nmsa>454< GENERATING SYNTHETIC DATA") # JGH syndutHook2
                 from synDUT import SynDUTDialog
                 self.syndut = SynDUTDialog(self.gui)
@@ -513,32 +559,35 @@ class MSA:
         # LO3 = MSA_LO(3, 0.,    cb.P1_PLL3DataBit, cb.P2_le3, cb.P2_fqud3, 0.974, 0, appxdds3, dds3filbw)
 
         # JGH above three lines changed to
-        LO1 = MSA_LO(1, 0., cb.P1_PLL1DataBit, cb.P2_le1, cb.P2_fqud1, \
-                     PLL1phasefreq, PLL1phasepol, appxdds1, dds1filbw, PLL1type)
-        SetLO1(LO1)
-        LO2 = MSA_LO(2, appxLO2, cb.P1_PLL2DataBit, cb.P2_le2, 0, PLL2phasefreq, \
-                     PLL2phasepol, 0, 0, PLL2type)
-        SetLO2(LO2)
-        LO3 = MSA_LO(3, 0., cb.P1_PLL3DataBit, cb.P2_le3, cb.P2_fqud3, PLL3phasefreq, \
-                     PLL3phasepol, appxdds3, dds3filbw, PLL3type)
-        SetLO3(LO3)
+        self.LO1 = LO1 = MSA_LO(1, 0., cb.P1_PLL1DataBit, cb.P2_le1, cb.P2_fqud1, \
+                     PLL1phasefreq, PLL1phasepol, appxdds1, dds1filbw, PLL1type, self)
+        self.LO2 = LO2 = MSA_LO(2, appxLO2, cb.P1_PLL2DataBit, cb.P2_le2, 0, PLL2phasefreq, \
+                     PLL2phasepol, 0, 0, PLL2type, self)
+        self.LO3 = LO3 = MSA_LO(3, 0., cb.P1_PLL3DataBit, cb.P2_le3, cb.P2_fqud3, PLL3phasefreq, \
+                     PLL3phasepol, appxdds3, dds3filbw, PLL3type, self)
+        self._PublishHardware()
 
         # JGH change end
 
         # 5. Command Filter Bank to Path one. Begin with all data lines low
         # JGH: This may require some investigation for RBWinP4
-        cb.OutPort(0)
-        # latch "0" into all SLIM Control Board Buffers
-        cb.OutControl(cb.SELTINITSTRBAUTO)
-        # begin with all control lines low
-        cb.OutControl(cb.contclear)
-
-
+        # Registers already holding the wanted values from the previous scan
+        # are not sent again (see _SendIfChanged).
+        if self._sentRegs.get("cb") is not cb:
+            self.InvalidateHardwareState()
+            self._sentRegs["cb"] = cb
+        def ClearLatches():
+            cb.OutPort(0)
+            # latch "0" into all SLIM Control Board Buffers
+            cb.OutControl(cb.SELTINITSTRBAUTO)
+            # begin with all control lines low
+            cb.OutControl(cb.contclear)
+        self._SendIfChanged("latches", True, ClearLatches)
 
         # 6. Initialize DDS3 by reseting to serial mode.
         # Frequency is commanded to zero
         # TODO: Check if USB needs a different value (see LB code)
-        LO3.ResetDDSserSLIM()
+        self._SendIfChanged("DDS3reset", True, LO3.ResetDDSserSLIM)
 
         # JGH starts 3/16/14
         # Precalculate all non-frequency dependent PLL parameters
@@ -549,12 +598,12 @@ class MSA:
         LO3.rcounter, LO3.pdf = LO3.CreateRcounter(LO3.appxdds)
 
         # 7. Initialize PLO3. No frequency command yet.
-        LO3.CommandPLLR()
+        self._SendIfChanged("LO3R", LO3.RConfig(), LO3.CommandPLLR)
 
         # 8.initialize and command PLO2 to proper frequency
         # Create and Command PLL2R and Init Buffers
         # Needs: LO2.(rcounter, preselector, phasepolarity,SELT,PLL2)
-        LO2.CommandPLLR()
+        self._SendIfChanged("LO2R", LO2.RConfig(), LO2.CommandPLLR)
 
         # Create PLO2 Ncounter
         # Needs: LO2. (appxVCO, rcounter, masterclock)
@@ -584,24 +633,29 @@ class MSA:
         # 8c. CommandPLL2N
         # needs:N23-N0,control,Jcontrol=SELT,port,contclear,LEPLL=8
         # commands N23-N0,old ControlBoard
-        LO2.CommandPLL(LO2.PLLbits)
+        # (in cftest LO2's N register is commanded at every step instead,
+        # so it is always resent once the test is over)
+        self._SendIfChanged("LO2N", (LO2.PLLbits, self.cftest),
+                            lambda: LO2.CommandPLL(LO2.PLLbits))
+        if self.cftest:
+            self._sentRegs.pop("LO2N")
 
         # 9.Initialize PLO 1. No frequency command yet.
         # CommandPLL1R and Init Buffers
         # needs:rcounter1,PLL1phasepolarity,SELT,PLL1
         # Initializes and commands PLL1 R Buffer(s)
-        LO1.CommandPLLR()
+        self._SendIfChanged("LO1R", LO1.RConfig(), LO1.CommandPLLR)
         # 10.initialize DDS1 by resetting. Frequency is commanded to zero
         # It should power up in parallel mode, but could power up in a bogus
         # condition. reset serial DDS1 without disturbing Filter Bank or PDM
-        LO1.ResetDDSserSLIM()   # SCOTTY TO MODIFY THIS TO LIMIT HIGH CURRENT
+        self._SendIfChanged("DDS1reset", True, LO1.ResetDDSserSLIM)   # SCOTTY TO MODIFY THIS TO LIMIT HIGH CURRENT
 
         # 10a. JGH added set port 4 switches 2/24/14
         
         swP4Bits = self.getSw4Bits(self._iBand)
 
-        cb.SetP(4, swP4Bits)
-        cb.setIdle()
+        if self._sentRegs.get("P4") != swP4Bits:
+            self._SetP4(swP4Bits)
         # Commanding P1 for RBW switching is done somewhere else
 
         # 10b.
@@ -612,10 +666,34 @@ class MSA:
         print("*********************************************************")
         print("*********************************************************")
     #--------------------------------------------------------------------------
+    # Return True if this is the primary MSA, whose hardware is also reachable
+    # through the msaGlobal accessors (GetCb, GetLO1, ...).
+
+    def IsPrimary(self):
+        return msa is self
+
+    def _SetHardwarePresent(self, val):
+        self.hardwarePresent = val
+        if self.IsPrimary():
+            SetHardwarePresent(val)
+
+    # Make the primary MSA's control board and LOs visible to other modules.
+
+    def _PublishHardware(self):
+        global cb, LO1, LO2, LO3
+        if self.IsPrimary():
+            cb, LO1, LO2, LO3 = self.cb, self.LO1, self.LO2, self.LO3
+            SetCb(cb)
+            if LO1:
+                SetLO1(LO1)
+                SetLO2(LO2)
+                SetLO3(LO3)
+
+    #--------------------------------------------------------------------------
     # Read 16-bit magnitude and phase ADCs.
 
     def _ReadAD16Status(self):
-        global cb
+        cb = self.cb
         # Read16wSlimCB --
         mag, phase = cb.GetADCs(16)
         mag   >>= cb.P5_MagDataBit
@@ -646,7 +724,7 @@ class MSA:
     # Capture magnitude and phase data for one step.
 
     def CaptureOneStep(self, post=True, useCal=True, bypassPDM=False):
-        global cb
+        cb = self.cb
         p = self.frame.prefs  # JGH/SCOTTY 2/6/14
         step = self._step
         self.LogEvent("CaptureOneStep %d" % step)
@@ -659,7 +737,7 @@ class MSA:
         else:
             doPhase = self.mode > self.MODE_SATG
             #invPhase = self.invPhase
-            if hardwarePresent:
+            if self.hardwarePresent:
                 if 0:
                     self.LogEvent("CaptureOneStep hardware, f=%g" % f)
                 self._CommandAllSlims()
@@ -826,8 +904,7 @@ class MSA:
                     else:
                     # End EON Jan 10 2014
                         if self.calNeedsInterp:
-                            calM = interp(f, cal.Fmhz, cal.Sdb)
-                            calP = interp(f, cal.Fmhz, cal.Scdeg)
+                            calM, calP = self._InterpolatedCalStep(cal, step)
                         else:
                             calF, calM, calP = cal[step]
                         Sdb -= calM
@@ -846,22 +923,51 @@ class MSA:
         else:
             return f, self._magdata, Sdb, Sdeg
 
+    # Line calibration cal at step, for a calibration that doesn't match the
+    # sweep. It is interpolated for the whole sweep at once.
+
+    def _InterpolatedCalStep(self, cal, step):
+        ci = self._calInterp
+        if ci == None or ci[0] is not cal or ci[1] is not self._freqs:
+            Sdb, Scdeg = cal.InterpolatedCal(self._freqs)
+            self._calInterp = ci = (cal, self._freqs, Sdb, Scdeg)
+        return ci[2][step], ci[3][step]
+
     #--------------------------------------------------------------------------
     # Internal scan loop thread.
 
     def _ScanThread(self):
-        global cb
         try:
             self.LogEvent("_ScanThread")
 
             # clear out any prior FIFOed data from interface
-            cb.Clear()
-            elapsed = 0
+            self.cb.Clear()
+            attempts = 0
+            recovering = None       # the error being recovered from
             while self.scanEnabled:
                 self.LogEvent("_ScanThread wloop, step %d" % self._step)
-                self.CaptureOneStep()
+                try:
+                    # a failed recovery is retried like a failed step
+                    if recovering:
+                        self._Recover(recovering, attempts)
+                        recovering = None
+                    else:
+                        self._Checkpoint()
+                    self.CaptureOneStep()
+                    if self.cb.syncLost:
+                        raise SyncLostError("ADC read sync lost at step %d" % \
+                                            self._step)
+                except Exception, e:
+                    if not self.cb.IsTransportError(e) and \
+                            not isinstance(e, (SyncLostError, ReopenError)):
+                        raise
+                    attempts += 1
+                    if attempts > self.maxRecoveries:
+                        raise
+                    recovering = e
+                    continue
+                attempts = 0
                 self.NextStep() #Scotty, this is where step incremented +1 or -1
-                elapsed += int(self.wait) + 3
                 self.LogEvent("_ScanThread: step=%d Req.nSteps=%d" % \
                               (self._step, self._nSteps))
                 #if self._step == 0 or self._step == self._nSteps+1:
@@ -872,9 +978,8 @@ class MSA:
                 #    else:
                 #        self.LogEvent("_ScanThread to step 0")
                 #        self.WrapStep()
-                # yield some time to display thread
-                if elapsed > msPerUpdate:
-                    elapsed = 0
+                # yield some time to display thread, when it's ready
+                if self.gui and self.pacer.Request():
                     evt = UpdateGraphEvent()
                     wx.PostEvent(self.gui, evt)
 
@@ -889,6 +994,86 @@ class MSA:
         self.LogEvent("_ScanThread exit")
         self._scanning = False
 
+    #--------------------------------------------------------------------------
+    # Save the state needed to redo the current step exactly: the step, the
+    # PDM inversion and the phase/magnitude continuity history.
+
+    def _Checkpoint(self):
+        self._checkpoint = (self._step, self.invPhase, self._Hquad,
+                            list(self._history), self._baseSdb, self._baseSdeg)
+
+    #--------------------------------------------------------------------------
+    # Recover from a transport error or ADC sync loss during a scan: rewind
+    # to the checkpointed step, reopen the interface and re-run the minimal
+    # part of InitializeHardware. Steps already captured are kept. Later
+    # attempts first wait a little longer each, to let a reset board come
+    # back.
+
+    def _Recover(self, err, attempt=1):
+        start = msElapsed()
+        self._step, self.invPhase, self._Hquad, self._history, \
+            self._baseSdb, self._baseSdeg = self._checkpoint
+        self._history = list(self._history)
+        self.LogEvent("Recover step %d (attempt %d): %s" % \
+                      (self._step, attempt, err))
+        print ("msa: recovering at step %d from: %s" % (self._step, err))
+        if attempt > 1:
+            time.sleep(0.2 * (attempt - 1))
+        if not self.cb.Reopen():
+            raise ReopenError("MSA interface could not be reopened")
+        self.ReinitializeHardware()
+        self._resumed = True
+        dt = msElapsed() - start
+        self.recoveryCount += 1
+        self.recoveryMs += dt
+        self.LogEvent("Recovered step %d in %d ms (%d recoveries, %d ms)" % \
+                      (self._step, dt, self.recoveryCount, self.recoveryMs))
+
+    #--------------------------------------------------------------------------
+    # Reprogram the registers lost when the interface was reset: DDS serial
+    # mode, the PLL R registers, LO2's N register, the P4 switches and the
+    # PDM state. The LOs' computed values from InitializeHardware are kept.
+
+    def ReinitializeHardware(self):
+        cb = self.cb
+        LO1, LO2, LO3 = self.LO1, self.LO2, self.LO3
+        self.InvalidateHardwareState()
+        self._sentRegs["cb"] = cb
+        LO3.ResetDDSserSLIM()
+        LO3.CommandPLLR()
+        LO2.CommandPLLR()
+        LO2.CommandPLL(LO2.PLLbits)
+        LO1.CommandPLLR()
+        LO1.ResetDDSserSLIM()
+        self._SetP4(self.StepArray[self._step][29])
+        self._CommandPhaseOnly()
+
+    #--------------------------------------------------------------------------
+    # Hardware register tracking, so that a new scan only sends the register
+    # writes whose values changed since the last one.
+
+    # Call send() if the register named key doesn't already hold value.
+
+    def _SendIfChanged(self, key, value, send):
+        if self._sentRegs.get(key, self) != value:
+            send()
+            self._sentRegs[key] = value
+
+    # Latch the P4 switch bits, recording them.
+
+    def _SetP4(self, swP4Bits, idle=True):
+        cb = self.cb
+        cb.SetP(4, swP4Bits)
+        if idle:
+            cb.setIdle()
+        self._sentRegs["P4"] = swP4Bits
+
+    # Forget what the hardware holds, forcing a full initialization on the
+    # next scan. Call after writing to the Control Board directly.
+
+    def InvalidateHardwareState(self):
+        self._sentRegs = {}
+
     #--------------------------------------------------------------------------
     # Stop any current scan and set up for a new spectrum scan.
 
@@ -966,11 +1151,14 @@ class MSA:
         self.NewScanSettings(parms)
         if 1 or debug:
             print("msa>969< (at ConfigForScan) self._nSteps:", self._nSteps)
+        if self.calLibrary:
+            # keep this path's recent calibrations ready for the next sweeps
+            self.calLibrary.Preload(self.mode, parms.RBWSelindex + 1)
         self.InitializeHardware()
         self._history = []
         self._baseSdb = 0
         self._baseSdeg = 0
-        if hardwarePresent or self.syndut != None:
+        if self.hardwarePresent or self.syndut != None:
             if not self._scanning:
                 # Array creation moved here, before Continue Scan # JGH 5/15/14
                 self.CreateStepArray() # Creates StepArray
@@ -1001,94 +1189,100 @@ class MSA:
     # not transition with a data transition, preventing crosstalk in LPT cable.
 
     def CreateStepArray(self):
-        global cb, LO1, LO2, LO3
+        LO1, LO2, LO3 = self.LO1, self.LO2, self.LO3
         p = self.frame.prefs
-
-        VarsArray = []  # VarsArray size = VariableList size
-        StepArray = []  # StepArray size = Number of steps # aka BIG BERTHA
-
-        for f in self._freqs: # there are _nsteps+1 f's indexed 0 to _nsteps
+        freqs = self._freqs
+        n = len(freqs) # there are _nsteps+1 f's indexed 0 to _nsteps
+
+        # Band, switch bits and equivalent 1G frequency of each step
+        bands = []
+        swP4BitsList = []
+        thisfreqs = []
+        for f in freqs:
             if p.mBand == True:
                 _GHzBand = min(max(int(f/1000) + 1, 1), 3) # JGH Values 1,2,3
             else:
                 _GHzBand = 1
             self._GHzBand = _GHzBand
-            swP4Bits = self.getSw4Bits(_GHzBand)
-            self.swP4Bits = swP4Bits
-            thisfreq = self._Equiv1GFreq(f)  # get equivalent 1G frequency
-            # With this we got all LO1.freq (thisfreq)
-            # Calculate all Steps for LO2 and LO1.
+            bands.append(_GHzBand)
+            swP4BitsList.append(self.getSw4Bits(_GHzBand))
+            thisfreqs.append(self._Equiv1GFreq(f))  # get equivalent 1G frequency
+        self.swP4Bits = swP4BitsList[-1]
+        thisfreqs = array(thisfreqs)
 
+        # Calculate all Steps for LO2 and LO1, for all steps at once.
         #--------------------------------------------------------------------------
-            # THIS SECTION TO BE USED IN cftest. When not in cftest, LO2 parameters had been
-            # calculated at step 8, initialization of LO2. This will over-ride those parameters.
-            if self.cftest == True:
-                # LO2 is frequency dependent during the cavity filter test
-                #cftestLO2freq = nominalLO2freq(self.appxLO2) + msacommandfreq(f)
-                cftestLO2freq = self.appxLO2 + thisfreq
-                ncount = divSafe(cftestLO2freq, divSafe(self.masterclock, LO2.rcounter))
-                LO2.ncounter = int(round(ncount))
-                LO2.fcounter = 0  #fcounter is not used anymore                    
-                if 0 or debug:
-                    print("msa>1053< LO2 testfreq, ncounter, fcounter: ", \
-                          cftestLO2freq, LO2.ncounter, LO2.fcounter)
-                LO2.CreatePLLN()
-                LO2.freq = ((LO2.Bcounter*LO2.preselector) + LO2.Acounter+ \
-                            (LO2.fcounter/16))*LO2.pdf
-                if 0 or debug:
-                    print("msa>1046< LO2.PLLtype, LO2 freq, rcounter, pdf, ncounter, fcounter, \
-                          Acounter, Bcounter, PLLbits: ",\
-                          LO2.PLLtype, LO2.freq, LO2.rcounter, LO2.pdf, LO2.ncounter, LO2.fcounter,
-                          LO2.Acounter, LO2.Bcounter, LO2.PLLbits)
-
-                #during cftest, LO1freq = LO2freq - finalfiltercenterfreq
-                LO1.Calculate(LO2.freq - self.finalfreq) #creates LO1 for cftest operation
+        # THIS SECTION TO BE USED IN cftest. When not in cftest, LO2 parameters had been
+        # calculated at step 8, initialization of LO2. This will over-ride those parameters.
+        if self.cftest == True:
+            # LO2 is frequency dependent during the cavity filter test
+            #cftestLO2freq = nominalLO2freq(self.appxLO2) + msacommandfreq(f)
+            LO2fcounter = 0  #fcounter is not used anymore
+            LO2s = synth.CalculateLO2(self.appxLO2 + thisfreqs,
+                            self.masterclock, LO2.rcounter, LO2.pdf,
+                            LO2.PLLtype, LO2.preselector)
+            LO2s.LoadStep(LO2, -1)
+            LO2.fcounter = LO2fcounter
+            LO2freqs = LO2s.freq
+            #during cftest, LO1freq = LO2freq - finalfiltercenterfreq
+            LO1s = LO1.CalculateSteps(LO2freqs - self.finalfreq) #creates LO1 for cftest operation
         #--------------------------------------------------------------------------
+        else:
+            LO2s = None
+            LO2freqs = zeros(n) + LO2.freq
+            if not self.dds1Sweep:
+                LO1s = LO1.CalculateSteps(thisfreqs + LO2.freq - self.finalfreq) #creates LO1 for normal operation
             else:
-                if not self.dds1Sweep:
-                    LO1.Calculate(thisfreq + LO2.freq - self.finalfreq) #creates LO1 for normal operation
-                else:
-                    LO1.CreateDDS(f, msa.masterclock)
-
-                # returns with: LO1.ncounter, LO1.PLLbits, LO1.Acounter, LO1.Bcounter,
-                #  LO1.DDSbits, LO1.ddsoutput, LO1.pdf, LO1.freq
-            if 0 or debug:
-                print("msa>1059< f, LO2.freq, thisfreq, LO1.freq: ", f, LO2.freq, thisfreq, LO1.freq)
-
-            if not self.dds3Track:
-                # Calculate All Steps For LO3 Synthesizer
-                self._CalculateAllStepsForLO3Synth(f)
-                # returns with: LO3.ncounter, LO3.PLLbits, LO3.Acounter, LO3.Bcounter,
-                #  LO3.DDSbits, LO3.ddsoutput, LO3.pdf, LO3.freq
-            else:
-                LO3.CreateDDS(f, msa.masterclock)
-
-            RealFinalIF = LO2.freq -(LO1.freq - thisfreq)
-
-            #This is where we build the StepArray (containing all parameters for ONE step)
-            #in tandem with calculating all the steps.
-            #StepArray is used to Show Variables and for building the SweepArray
-            #When completed, we will then build the SweepArray using the info in the StepArray.
-            #The StepArray has the same number of slots as the number of steps in the sweep
-            #Each slot is a VarsArray containg hard variables for each step in the sweep
-            #we add a VarsArray to the StepArray each time we calculate the parameters for each step.            
-            #LO1.fcounter(7) is not used, been set to 0. Now, LO1.PLLbits
-            #LO2.fcounter(15) is not used, been set to 0. May use for something else.
-            #LO3.fcounter(23) is not used, been set to 0. Now, LO3.PLLbits
-            VarsArray = [f, \
-                         LO1.ddsoutput, LO1.freq, LO1.pdf, LO1.ncounter, LO1.Bcounter, \
-                         LO1.Acounter,  LO1.PLLbits, LO1.rcounter, \
-                         LO2.PLLbits, LO2.freq, LO2.pdf, LO2.ncounter, LO2.Bcounter, \
-                         LO2.Acounter,  LO2.fcounter, LO2.rcounter, \
-                         LO3.ddsoutput, LO3.freq, LO3.pdf, LO3.ncounter, LO3.Bcounter, \
-                         LO3.Acounter,  LO3.PLLbits, LO3.rcounter, \
-                         RealFinalIF, self.masterclock, \
-                         LO1.DDSbits, LO3.DDSbits, \
-                         self.swP4Bits] #Scotty added 27 and 28, JGH added 29
-            
-            # The VarsArray  is used to Show Variables
-            # The StepArray (aka BIG BERTHA contains the parameters for ALL steps
-            StepArray.append(VarsArray)
+                LO1s = synth.CalculateDDSOnly(freqs, self.masterclock, LO1)
+        LO1s.LoadStep(LO1, -1)
+        # LO1s holds, per step: ncounter, PLLbits, Acounter, Bcounter,
+        #  DDSbits, ddsoutput, pdf, freq
+
+        if not self.dds3Track:
+            # Calculate All Steps For LO3 Synthesizer
+            LO3freqs = []
+            for i in range(n):
+                self._GHzBand = bands[i]
+                LO3freqs.append(self._LO3Freq(freqs[i], LO2freqs[i]))
+            LO3s = LO3.CalculateSteps(array(LO3freqs))
+        else:
+            LO3s = synth.CalculateDDSOnly(freqs, self.masterclock, LO3)
+        LO3s.LoadStep(LO3, -1)
+
+        RealFinalIF = LO2freqs - (LO1s.freq - thisfreqs)
+
+        #This is where we build the StepArray (containing all parameters for ONE step)
+        #from the per-step LO values calculated above.
+        #StepArray is used to Show Variables and for building the SweepArray
+        #When completed, we will then build the SweepArray using the info in the StepArray.
+        #The StepArray has the same number of slots as the number of steps in the sweep
+        #Each slot is a VarsArray containg hard variables for each step in the sweep
+        #LO1.fcounter(7) is not used, been set to 0. Now, LO1.PLLbits
+        #LO2.fcounter(15) is not used, been set to 0. May use for something else.
+        #LO3.fcounter(23) is not used, been set to 0. Now, LO3.PLLbits
+        def column(steps, name, value):
+            if steps:
+                return getattr(steps, name).tolist()
+            return [value] * n
+        columns = [list(freqs), \
+            LO1s.ddsoutput.tolist(), LO1s.freq.tolist(), LO1s.pdf.tolist(), \
+            LO1s.ncounter.tolist(), LO1s.Bcounter.tolist(), \
+            LO1s.Acounter.tolist(), LO1s.PLLbits.tolist(), [LO1.rcounter] * n, \
+            column(LO2s, "PLLbits", LO2.PLLbits), LO2freqs.tolist(), \
+            column(LO2s, "pdf", LO2.pdf), column(LO2s, "ncounter", LO2.ncounter), \
+            column(LO2s, "Bcounter", LO2.Bcounter), \
+            column(LO2s, "Acounter", LO2.Acounter), [LO2.fcounter] * n, \
+            [LO2.rcounter] * n, \
+            LO3s.ddsoutput.tolist(), LO3s.freq.tolist(), LO3s.pdf.tolist(), \
+            LO3s.ncounter.tolist(), LO3s.Bcounter.tolist(), \
+            LO3s.Acounter.tolist(), LO3s.PLLbits.tolist(), [LO3.rcounter] * n, \
+            RealFinalIF.tolist(), [self.masterclock] * n, \
+            LO1s.DDSbits.tolist(), LO3s.DDSbits.tolist(), \
+            swP4BitsList] #Scotty added 27 and 28, JGH added 29
+
+        # The VarsArray  is used to Show Variables
+        # The StepArray (aka BIG BERTHA contains the parameters for ALL steps
+        StepArray = [list(VarsArray) for VarsArray in zip(*columns)]
 
         if 0 or debug:
             print("msa>1083< StepArray[0]: ", StepArray[0])
@@ -1121,6 +1315,7 @@ class MSA:
 ##            PLL1bits = LO1.PLLbits
 ##            PLL2bits = LO2.PLLbits
 ##            PLL3bits = LO3.PLLbits
+        cb = self.cb
         msb = 23 + 16
         shift1 = msb - cb.P1_PLL1DataBit
         shift2 = msb - cb.P1_PLL2DataBit 
@@ -1190,6 +1385,7 @@ class MSA:
         if self._step != self._end:		# if not at end
             self._step += self._sweepInc	# increment step
         else:					# if at end
+            self.pacer.SweepDone()
             if self._sweepDir == 0:		# sweeping left to right
                 self._step = 0			# back to starting left point
             elif self._sweepDir == 1:		# sweeping right to left
@@ -1249,7 +1445,7 @@ class MSA:
             "Real Final I.F. = %0.9f" % self.StepArray[step][25],#scotty, was %f
             "Masterclock = %0.6f" % self.StepArray[step][26],
             "Switches = " + bin(256 + self.StepArray[step][29])[-8:]
-            ]            
+            ] + self.pacer.GetTextList()
         return textList
 
     #--------------------------------------------------------------------------
@@ -1262,6 +1458,27 @@ class MSA:
         return Spectrum(title, self.RBWSelindex+1, self._fStart, self._fStop,
                         self._nSteps, self._freqs)
 
+#==============================================================================
+# Port P1 data bytes for clocking a 24-bit PLL register out on P1 bit dataBit,
+# MSB first, for sending with the interface's SendDevBytes. Blocks are cached
+# since the same R and N registers get sent repeatedly.
+
+pllDataBytesCache = {}
+
+def PLLDataBytes(data, dataBit):
+    key = (data, dataBit)
+    block = pllDataBytesCache.get(key)
+    if block is None:
+        block = [((data >> (23 - i)) & 1) << dataBit for i in range(24)]
+        if len(pllDataBytesCache) > 4096:
+            pllDataBytesCache.clear()
+        pllDataBytesCache[key] = block
+    return block
+
+# 40 zero data bytes for flushing a serial DDS's input register.
+
+DDSFlushBytes = [0] * 40
+
 #==============================================================================
 # An MSA Local Oscillator DDS and PLL.
 
@@ -1269,7 +1486,8 @@ class MSA_LO:
     # def __init__(self, id, freq, pllBit, le, fqud, PLLphasefreq, phasepolarity, appxdds, ddsfilbw):
     # JGH Above line substituted by the following
     def __init__(self, loid, freq, pllBit, le, fqud, PLLphasefreq, phasepolarity, \
-                 appxdds, ddsfilbw, PLLtype): # JGH 2/7/14 Fractional mode not used
+                 appxdds, ddsfilbw, PLLtype, owner=None): # JGH 2/7/14 Fractional mode not used
+        self.msa = owner or GetMsa()        # MSA instrument this LO belongs to
         self.id = loid                      # LO number, 1-3
         self.freq = freq                    # LO frequency
         self.CBP1_PLLDataBit = pllBit       # port 1 bit number for PLL data
@@ -1318,32 +1536,32 @@ class MSA_LO:
     # Set a PLL's register.
 
     def CommandPLL(self, data):
-        global cb
+        cb = self.msa.cb
         # CommandPLLslim --
         if 0 or debug:
             print ("msa>1239< LO%d CommandPLL 0x%06x" % (self.id, data))
-        shift = 23 - self.CBP1_PLLDataBit
-        mask = 1 << 23
-        # shift data out, MSB first
-        for i in range(24):
-##            a = ((data & mask) >> shift) + msa.bitsRBW # JGH Use next line
-            a = ((data & mask) >> shift)
-            cb.SetP(1, a)                  # data with clock low
-            cb.SetP(1, a + cb.P1_Clk)      # data with clock high
-            # shift next bit into position
-            data <<= 1
+        # shift data out, MSB first, as one clocked block: the interface
+        # presents each byte with clock low, then with clock high
+        cb.SendDevBytes(PLLDataBytes(data, self.CBP1_PLLDataBit), cb.P1_Clk)
         # remove data, leaving bitsRBW data to filter bank.
 ##        cb.SetP(1, msa.bitsRBW) # JGH use next line
         cb.SetP(1, 0)
 
         # send LEs to PLL1, PLL3, FQUDs to DDS1, DDS3, and command PDM
         # begin by setting up init word=LEs and Fquds + PDM state for thisstep
-        pdmcmd = GetMsa().invPhase << cb.P2_pdminvbit
+        pdmcmd = self.msa.invPhase << cb.P2_pdminvbit
         cb.SetP(2, self.CBP2_LE + pdmcmd) # present data to buffer input
         # remove the added latch signal to PDM, leaving just the static data
         cb.SetP(2, pdmcmd)
         cb.setIdle()
 
+    #--------------------------------------------------------------------------
+    # Return the values that determine what CommandPLLR() sends.
+
+    def RConfig(self):
+        return (self.PLLtype, self.rcounter, self.phasepolarity,
+                self.CBP1_PLLDataBit, self.CBP2_LE)
+
     #--------------------------------------------------------------------------
     # Initialize the PLL's R register.
 
@@ -1403,13 +1621,13 @@ class MSA_LO:
     # Reset serial DDS without disturbing Filter Bank or PDM.
 
     def ResetDDSserSLIM(self):
-        global cb
+        cb = self.msa.cb
         # must have DDS (AD9850/9851) hard wired. pin2=D2=0, pin3=D1=1,
         # pin4=D0=1, D3-D7 are don# t care. this will reset DDS into
         # parallel, invoke serial mode, then command to 0 Hz.
         if 0 or debug:
             print ("msa>1326< ResetDDSserSLIM")
-        pdmcmd = GetMsa().invPhase << cb.P2_pdminvbit
+        pdmcmd = self.msa.invPhase << cb.P2_pdminvbit
         #bitsRBW = msa.bitsRBW
 
         # (reset DDS1 to parallel) WCLK up, WCLK up and FQUD up, WCLK up and
@@ -1452,12 +1670,8 @@ class MSA_LO:
         # FQUD up, FQUD down present data to buffer,latch buffer,disable
         # buffer, present data+clk to buffer,latch buffer,disable buffer
 
-        #a = 0
-        for i in range(40):
-            # data with clock low
-            cb.SetP(1, 0)
-            # data with clock high
-            cb.SetP(1, cb.P1_Clk)
+        # 40 zero data bits, each with clock low then clock high
+        cb.SendDevBytes(DDSFlushBytes, cb.P1_Clk)
         # leaving bitsRBW latched
         cb.SetP(1, 0)
 
@@ -1560,7 +1774,7 @@ class MSA_LO:
 
         # CreateDDS by going to def CreateDDS(self, ddsout, ddsclock)
         wantdds = temppdf*self.rcounter
-        self.CreateDDS(wantdds, msa.masterclock)
+        self.CreateDDS(wantdds, self.msa.masterclock)
         # returns with: self.DDSbits and self.ddsoutput
 
         # actual phase freq of PLL
@@ -1577,4 +1791,13 @@ class MSA_LO:
         #The actual output frequency of the DDS [DDSout] is:
         self.ddsoutput = ddsclock * base/2**32 #precise output freq of DDS
 
+    #--------------------------------------------------------------------------
+    # Calculate PLL and DDS settings for an array of frequencies, without
+    # changing this LO. Returns a synth.LOSteps of per-step values.
+
+    def CalculateSteps(self, wantedVCOfreqs):
+        return synth.CalculateLO(wantedVCOfreqs, self.appxdds, self.rcounter,
+                    self.ddsfilbw, self.msa.masterclock, self.PLLtype,
+                    self.preselector, self.id)
+
 #Scotty---------------------------
@@ -72,6 +72,9 @@ class MSA_CB:
     if debug:
         show = True   # JGH
 
+    # set by interfaces that detect lost ADC read sync
+    syncLost = False
+
     #--------------------------------------------------------------------------
     # Set the Control Board Port Px.
 
@@ -150,6 +153,21 @@ class MSA_CB:
             print ("Clear")
         pass
 
+    def Release(self):
+        if self.show:
+            print ("Release")
+        pass
+
+    # Reopen the interface after a transport error. Returns True if usable.
+    def Reopen(self):
+        if self.show:
+            print ("Reopen")
+        return True
+
+    # Return True if exception exc is a recoverable transport error.
+    def IsTransportError(self, exc):
+        return False
+
 #==============================================================================
 class MSA_RPI(MSA_CB):
     # constants
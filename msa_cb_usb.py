@@ -1,6 +1,6 @@
 from msaGlobal import isMac, resdir, SetModuleVersion
 from util import msWait
-import os, string, subprocess, sys, usb
+import os, string, subprocess, sys, threading, usb
 from msa_cb import MSA_CB
 import array as uarray
 import usb.backend.libusb01 as libusb01
@@ -9,12 +9,59 @@ SetModuleVersion("msa_cb_usb",("1.30","EON","05/20/2014"))
 
 debug = False
 
+# defaults for the per-device ADC read sync checking
 usbSync = True
-usbReadCount = 0
 usbSyncCount = 20
 
 RequiredFx2CodeVersion = "0.1"
 
+# FX2s claimed by an MSA_CB_USB in this process, as (bus, address) pairs, so
+# that several MSAs can be driven at once without grabbing the same device
+claimedDevices = set()
+claimLock = threading.Lock()
+
+# cached USB device enumeration, refreshed only when no usable FX2 is found
+busCache = None
+
+# Cypress FX2 vendor request for writing on-chip RAM, and the CPU control
+# register used to hold the 8051 in reset while its code is loaded
+FX2_RW_RAM = 0xA0
+FX2_CPUCS = 0xE600
+FX2_MaxChunk = 1024
+
+# parsed FX2 code image, loaded once from usbpar.ihx
+fx2Image = None
+
+#------------------------------------------------------------------------------
+# Read an Intel hex file into a list of (address, data string) chunks, merging
+# contiguous records to cut down on the number of control transfers.
+
+def ReadIntelHex(fileName):
+    chunks = []
+    for line in open(fileName).readlines():
+        line = line.strip()
+        if not line.startswith(":"):
+            continue
+        rec = line[1:].decode("hex")
+        if sum(map(ord, rec)) & 0xff:
+            raise ValueError("%s: bad checksum in '%s'" % (fileName, line))
+        n = ord(rec[0])
+        addr = (ord(rec[1]) << 8) + ord(rec[2])
+        recType = ord(rec[3])
+        if recType == 1:
+            break
+        if recType != 0:
+            continue
+        data = rec[4:4+n]
+        if chunks:
+            lastAddr, lastData = chunks[-1]
+            if lastAddr + len(lastData) == addr and \
+                    len(lastData) + n <= FX2_MaxChunk:
+                chunks[-1] = (lastAddr, lastData + data)
+                continue
+        chunks.append((addr, data))
+    return chunks
+
 class Bus(object):
     r"""Bus object."""
     def __init__(self):
@@ -29,8 +76,20 @@ class MSA_CB_USB(MSA_CB):
     USB_IDVENDOR_CYPRESS = 0x04b4
     USB_IDPRODUCT_FX2 = 0x8613
 
-    def __init__(self):
+    # The FX2 to use may be selected by USB bus and address and/or by serial
+    # number. Zero or empty selectors match any device, so by default the
+    # first FX2 not already claimed by another MSA_CB_USB is used.
+
+    def __init__(self, bus=0, address=0, serial=""):
         self.show = debug
+        self.bus = bus
+        self.address = address
+        self.serial = serial
+        self.devId = None       # (bus, address) of the claimed device
+        self.usbSync = usbSync
+        self.usbReadCount = 0
+        self.usbSyncCount = usbSyncCount
+        self.syncLost = False
         self._wrCount = 0
         self._rdSeq = 0
         self._expRdSeq = 0
@@ -42,77 +101,194 @@ class MSA_CB_USB(MSA_CB):
 
     # Look for the FX2 device on USB and initialize it and self.usbFX2 if found
 
-    def busses(self):
-        r"""Return a tuple with the usb busses."""
-        return (Bus(),)
+    def busses(self, refresh=False):
+        r"""Return a tuple with the usb busses, enumerated once and cached."""
+        global busCache
+        if refresh or busCache is None:
+            busCache = (Bus(),)
+        return busCache
 
     def FindInterface(self):
         if not self.usbFX2:
-            try:
-                usbBusses = self.busses()
-            except:
-                print ("usb library not installed")
-                return
-
-            for bus in usbBusses:
-                for dev in bus.devices:
-                    if dev.idVendor == self.USB_IDVENDOR_CYPRESS and dev.idProduct == self.USB_IDPRODUCT_FX2:
-                        odev = dev.open()
-                        if 1:
-                        # Run prog to download code into the FX2
-                        # Disable if the code is permanently loaded into the EPROM
-                            try:
-                                cycfx2progName = os.path.join(resdir, "cycfx2prog")
-                                usbparName = os.path.join(resdir, "usbpar.ihx")
-                                cmd = [cycfx2progName, "prg:%s" % usbparName, "run"]
-                                if debug:
-                                    print (" ".join(cmd))
-
-                                p = subprocess.Popen(cmd, stdin=subprocess.PIPE,
-                                            stdout=subprocess.PIPE,
-                                            stderr=subprocess.STDOUT,
-                                            env=os.environ)
-
-                                result = p.wait()  # JGH ??????????????
-
-                                for line in p.stdout.readlines():
-                                    print ("cycfx2prog:", line)
-                            except OSError:
-                                print ("Error: cycfx2prog:", sys.exc_info()[1].strerror)
-                                return
-                            if result != 0:
-                                print ("cycfx2prog returned", result)
-                                return
-                            print ("CYPRESS DEVICE FOUND")
-                            try:
-                                odev = dev.open()
-
-                                # --------------------------------------------------
-
-    ##                            # If the program doesn't start, let it detach the
-    ##                            # Kernel driver ONCE, and then comment out the line
-    ##                            odev.detachKernelDriver(0)
-    ##                            if debug:
-    ##                               print ("Kernel Driver detached")
-    ##                            odev.setConfiguration(1) # JGH 10/31/13
-    ##                            if debug:
-    ##                                print ("Configuration has been set")
-    ##                            odev.releaseInterface() # JGH 10/14/13
-    ##                            if debug:
-    ##                                print ("Interface released")
-
-                                # --------------------------------------------------
-
-                                odev.claimInterface(0)
-                                # Alt Interface 1 is the Bulk intf: claim device
-                                odev.setAltInterface(1)
-                                self.usbFX2 = odev
-                                print ("")
-                                print ("      **** FINISHED WITHOUT ERRORS ****")
-                                print ("")
-                            except usb.USBError:
-                                print ("USBError Exception")
+            # try the cached device list first, then a fresh enumeration
+            for refresh in (False, True):
+                try:
+                    usbBusses = self.busses(refresh)
+                except:
+                    print ("usb library not installed")
+                    return
+
+                for bus in usbBusses:
+                    for dev in bus.devices:
+                        if dev.idVendor == self.USB_IDVENDOR_CYPRESS and dev.idProduct == self.USB_IDPRODUCT_FX2:
+                            if not self._ClaimDevice(dev):
+                                continue
+                            if self._OpenDevice(dev):
                                 return
+                            self.Release()
+
+    # Return the (bus, address) pair identifying a USB device.
+
+    def _DeviceId(self, dev):
+        d = getattr(dev, "dev", dev)
+        return (getattr(d, "bus", None), getattr(d, "address", None))
+
+    # Claim dev for this interface if it matches the bus/address selection
+    # and no other interface in this process is using it.
+
+    def _ClaimDevice(self, dev):
+        devId = self._DeviceId(dev)
+        if (self.bus and devId[0] != self.bus) or \
+                (self.address and devId[1] != self.address):
+            return False
+        claimLock.acquire()
+        try:
+            if devId in claimedDevices:
+                return False
+            claimedDevices.add(devId)
+        finally:
+            claimLock.release()
+        self.devId = devId
+        return True
+
+    # Release the claimed device so another interface may use it.
+
+    def Release(self):
+        claimLock.acquire()
+        try:
+            claimedDevices.discard(self.devId)
+        finally:
+            claimLock.release()
+        self.devId = None
+        self.usbFX2 = None
+
+    # Open dev's bulk interface, downloading the FX2 code first only if the
+    # device isn't already running the required version, and check its
+    # serial number against the selection. Returns True if successful.
+
+    def _OpenDevice(self, dev):
+        try:
+            self._ClaimBulk(dev.open())
+        except usb.USBError:
+            print ("USBError Exception")
+            return False
+        if self._RunningVersion() == RequiredFx2CodeVersion:
+            if debug:
+                print ("FX2 code %s already running" % RequiredFx2CodeVersion)
+        else:
+            odev = self.usbFX2
+            self.usbFX2 = None
+            try:
+                odev.releaseInterface()
+            except usb.USBError:
+                pass
+            if not self._LoadFirmware(odev) and not self._RunCycfx2prog():
+                return False
+            print ("CYPRESS DEVICE FOUND")
+            try:
+                self._ClaimBulk(dev.open())
+            except usb.USBError:
+                print ("USBError Exception")
+                return False
+
+        if self.serial:
+            try:
+                serial = self.usbFX2.getString(dev.iSerialNumber, 64)
+            except (usb.USBError, ValueError):
+                serial = None
+            if serial != self.serial:
+                try:
+                    self.usbFX2.releaseInterface()
+                except usb.USBError:
+                    pass
+                self.usbFX2 = None
+                return False
+        print ("")
+        print ("      **** FINISHED WITHOUT ERRORS ****")
+        print ("")
+        return True
+
+    def _ClaimBulk(self, odev):
+        # --------------------------------------------------
+
+##        # If the program doesn't start, let it detach the
+##        # Kernel driver ONCE, and then comment out the line
+##        odev.detachKernelDriver(0)
+##        if debug:
+##           print ("Kernel Driver detached")
+##        odev.setConfiguration(1) # JGH 10/31/13
+##        if debug:
+##            print ("Configuration has been set")
+##        odev.releaseInterface() # JGH 10/14/13
+##        if debug:
+##            print ("Interface released")
+
+        # --------------------------------------------------
+
+        odev.claimInterface(0)
+        # Alt Interface 1 is the Bulk intf: claim device
+        odev.setAltInterface(1)
+        self.usbFX2 = odev
+
+    # Ask the FX2 code for its version with the 'V' command, returning None if
+    # there's no answer (as when the FX2 holds no code or other code).
+
+    def _RunningVersion(self):
+        try:
+            fx2Vers = self._ReadVersion(100)
+        except usb.USBError:
+            fx2Vers = None
+        self._writeFIFO = ""
+        self._readFIFO = uarray.array('B', [])
+        return fx2Vers
+
+    # Download the FX2 code over the control endpoint, holding the 8051 in
+    # reset while its RAM is written. Returns True if successful.
+
+    def _LoadFirmware(self, odev):
+        global fx2Image
+        try:
+            if fx2Image is None:
+                fx2Image = ReadIntelHex(os.path.join(resdir, "usbpar.ihx"))
+            odev.controlMsg(0x40, FX2_RW_RAM, "\x01", FX2_CPUCS)
+            for addr, data in fx2Image:
+                odev.controlMsg(0x40, FX2_RW_RAM, data, addr, timeout=1000)
+            odev.controlMsg(0x40, FX2_RW_RAM, "\x00", FX2_CPUCS)
+        except (IOError, ValueError, AttributeError, usb.USBError):
+            print ("FX2 code download failed:", sys.exc_info()[1])
+            return False
+        return True
+
+    # Fall back to the external cycfx2prog to download the FX2 code.
+
+    def _RunCycfx2prog(self):
+        try:
+            cycfx2progName = os.path.join(resdir, "cycfx2prog")
+            usbparName = os.path.join(resdir, "usbpar.ihx")
+            cmd = [cycfx2progName]
+            if not None in self.devId:
+                # only program the device we claimed
+                cmd.append("-d=%03d.%03d" % tuple(map(int, self.devId)))
+            cmd += ["prg:%s" % usbparName, "run"]
+            if debug:
+                print (" ".join(cmd))
+
+            p = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                        env=os.environ)
+
+            result = p.wait()  # JGH ??????????????
+
+            for line in p.stdout.readlines():
+                print ("cycfx2prog:", line)
+        except OSError:
+            print ("Error: cycfx2prog:", sys.exc_info()[1].strerror)
+            return False
+        if result != 0:
+            print ("cycfx2prog returned", result)
+            return False
+        return True
 
     # For debug only # JGH 1/25/14
     def ReadUSBdevices(self):
@@ -159,10 +335,10 @@ class MSA_CB_USB(MSA_CB):
         self._writeFIFO += data
 
     # Read any FX2 data, with a silent timout if none present
-    def _read(self):
+    def _read(self, timeout=1000):
         fx2 = self.usbFX2
         try:
-            data = fx2.bulkRead(0x86, 512, 1000)
+            data = fx2.bulkRead(0x86, 512, timeout)
             if self.show:
                 print ("_read ->", string.join(["%02x" % b for b in data]))
         except usb.USBError:
@@ -273,27 +449,27 @@ class MSA_CB_USB(MSA_CB):
 
     # Return the data previously read from the ADCs
     def GetADCs(self, n):
-        global usbSync, usbReadCount, usbSyncCount
         mag = phase = 0
         tmp = 16
         for i in range(n):
             stat = self.InStatus()   # read data
-            if usbSync:
-                usbReadCount += 1
+            if self.usbSync:
+                self.usbReadCount += 1
                 err = False
                 if i == 0:
                     if ((stat & 0xf) != 0xf):
-                        print ("%10d out of sync %x" % (usbReadCount, stat))
+                        print ("%10d out of sync %x" % (self.usbReadCount, stat))
                         err = True
                 else:
                     if (stat & 0xf) != (tmp & 0x7):
-                        print ("%10d out of sync %2d %2d %02x" % (usbReadCount, i, tmp, stat))
+                        print ("%10d out of sync %2d %2d %02x" % (self.usbReadCount, i, tmp, stat))
                         err = True
                     tmp -= 1;
                 if err:
-                    usbSyncCount -= 1
-                    if usbSyncCount < 0:
-                        usbSync = False
+                    self.syncLost = True
+                    self.usbSyncCount -= 1
+                    if self.usbSyncCount < 0:
+                        self.usbSync = False
             stat = ((stat << 2) & 0xff) ^ 0x80
             mag =   (mag   << 1) | (stat & self.P5_MagData)
             phase = (phase << 1) | (stat & self.P5_PhaseData)
@@ -303,24 +479,49 @@ class MSA_CB_USB(MSA_CB):
 
     # Check that the FX2 is loaded with the proper version of code
     def ValidVersion(self):
+        fx2Vers = self._ReadVersion()
+        if fx2Vers != RequiredFx2CodeVersion:
+            print (">>>1023<<< Wrong FX2 code loaded: ", \
+                   fx2Vers, " need: ", RequiredFx2CodeVersion)
+            return False
+        else:
+            return True
+
+    # Read the version of the running FX2 code, waiting up to timeout ms
+    def _ReadVersion(self, timeout=1000):
         self._write("V" + chr(0))
         self.FlushRead()
         self.Flush()
-        msWait(100)
         fx2Vers = None
-        if self.HaveReadData() >= 2:
+        r = self._read(timeout)
+        if not isMac:
+            r = uarray.array('B', r)
+        self._readFIFO += r
+        if len(self._readFIFO) >= 2:
             fx2Vers = "%d.%d" % tuple(self._readFIFO[:2])
             if self.show:
                 print (">>>1018<<< fx2Vers: " + str(fx2Vers))
             self._readFIFO = self._readFIFO[2:]
         if self.show:
             print ("ValidVersion ->", fx2Vers)
-        if fx2Vers != RequiredFx2CodeVersion:
-            print (">>>1023<<< Wrong FX2 code loaded: ", \
-                   fx2Vers, " need: ", RequiredFx2CodeVersion)
+        return fx2Vers
+
+    # Reopen the FX2 after a transport error, re-running the device search
+    # with the original selection. Returns True if the FX2 is usable again.
+    def Reopen(self):
+        self.Release()
+        self.FindInterface()
+        if not self.usbFX2:
             return False
-        else:
-            return True
+        self.usbSync = usbSync
+        self.usbSyncCount = usbSyncCount
+        self.syncLost = False
+        self.Clear()
+        return True
+
+    # Return True if exception exc is a recoverable transport error
+    def IsTransportError(self, exc):
+        return isinstance(exc, usb.USBError)
 
     # Clear the read and write buffers and counts
     def Clear(self):
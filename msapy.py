@@ -60,7 +60,7 @@ print("sys.platform: ", sys.platform)
 
 import msaGlobal
 from msaGlobal import appdir, EVT_UPDATE_GRAPH, GetHardwarePresent, \
-    incremental, isMac, isWin, msPerUpdate, resdir, SetFontSize, \
+    incremental, isMac, isWin, resdir, SetFontSize, \
     SetModuleVersion, SetVersion, slowDisplay
 import os, re, string, time, threading, wx
 import copy as dcopy
@@ -68,14 +68,21 @@ import numpy.version
 from wx.lib.dialogs import ScrolledMessageDialog
 import trace
 from util import CentSpanToStartStop, CheckExtension, message, \
-    mhzStr, modDegree, Prefs, ShouldntOverwrite, StartStopToCentSpan
+    mhzStr, msElapsed, Prefs, ShouldntOverwrite, StartStopToCentSpan
 from theme import DarkTheme, LightTheme
 from events import ResetEvents, LogGUIEvent, GuiEvents
 from msa import MSA
 from marker import Marker
 from calMan import CalFileName, CalParseFreqFile, CalParseMagFile
+import calStore
+from calLibrary import CalLibrary
+from calWorker import CalWorker
 from vScale import VScale
+from detector import DET_NORMAL
+from ref import RefMath
 from spectrum import Spectrum
+from sweepArchive import archiveExt, SweepArchive
+from touchstone import Touchstone
 import twoPort   # Added by JGH 3/29/14
 
 SetModuleVersion("msapy",("1.30","JGH","05/20/2014"))
@@ -176,6 +183,7 @@ class MSASpectrumFrame(wx.Frame):
         self.sweepMenu = self.CreateMenu("&Sweep", [
             ("Sweep Parameters\tCTRL-F", "SetSweep", -1),
             ("Show Variables\tCTRL-I",  "ShowVars", -1),
+            ("Show Waterfall...",        "ShowWaterfall", -1),
             ("-",                        None, -1),
             ("Markers -->",              None, 4),
             ("Markers Independent",      "SetMarkers_Indep", -2),
@@ -190,6 +198,7 @@ class MSASpectrumFrame(wx.Frame):
             ("Save Graph Data",         "SaveGraphData", -1),
             ("Save Input Data",         "SaveInputData", -1),
             ("Save Installed Line Cal", "SaveInstalledLineCal", -1),
+            ("Record Sweep History...", "RecordSweeps", -1),
             ("-",                       None, -1),
             ("Dump Events",             "DumpEvents", -1),
             ("Save Debug Events",       "WriteEvents", -1),
@@ -399,6 +408,8 @@ class MSASpectrumFrame(wx.Frame):
         self.smithDlg = None
 
         self.spectrum = None
+        self.sweepArchive = None        # archive of completed sweeps
+        self.sweepArchivePath = None    # its file, while recording
         self.sweepDlg = None
         self.filterAnDlg = None
         self.compDlg = None
@@ -408,6 +419,7 @@ class MSASpectrumFrame(wx.Frame):
         self.crystalDlg = None
         self.stepDlg = None
         self.varDlg = None
+        self.waterfallDlg = None
         self.ReadCalPath()
         self.ReadCalFreq()
         self.Show(True)
@@ -446,13 +458,17 @@ class MSASpectrumFrame(wx.Frame):
         if not os.path.exists(cdir):
             os.makedirs(cdir)
         # Start EON Jan 28, 2014
-        self.bandCalFileName = os.path.join(cdir, "BandLineCal.s1p")
-        self.baseCalFileName = os.path.join(cdir, "BaseLineCal.s1p")
+        self.bandCalFileName = os.path.join(cdir, "BandLineCal" + calStore.calExt)
+        self.baseCalFileName = os.path.join(cdir, "BaseLineCal" + calStore.calExt)
         # read any operating calibration files
 #        msa.bandCal = self.LoadCal(self.bandCalFileName)
 #        msa.baseCal = self.LoadCal(self.baseCalFileName)
         msa.bandCal = None
         msa.baseCal = None
+        msa.calLibrary = CalLibrary(os.path.join(appdir, "MSA_Info",
+                                                 "CalLibrary"))
+        msa.calWorker = CalWorker(os.path.join(appdir, "MSA_Info",
+                                               "TestSetups"))
         # Start EON Jan 28, 2014
 
         # MAKE ONE SCAN TO CONFIGURE GRAPH
@@ -628,7 +644,8 @@ class MSASpectrumFrame(wx.Frame):
 
         LogGUIEvent("ScanPrecheck starting timer")
         # start display-update timer, given interval in ms
-        self.timer.Start(msPerUpdate)
+        msa.pacer.Reset()
+        self.timer.Start(msa.pacer.interval)
     #--------------------------------------------------------------------------
 
     #--------------------------------------------------------------------------
@@ -637,6 +654,8 @@ class MSASpectrumFrame(wx.Frame):
     def CalCheck(self):
         global msa
         p = self.prefs
+        if p.calLevel == 2:
+            self.FindLibraryCal()
         cal = (None, msa.baseCal, msa.bandCal)[p.calLevel]
         if cal:
             if ((msa.mode == MSA.MODE_VNATran and cal.oslCal) or \
@@ -664,6 +683,12 @@ class MSASpectrumFrame(wx.Frame):
                 if cal.oslCal:
                     cal.installBandCal()
                 # End EON Jan 10 2014
+            elif p.calLevel == 2 and fStart >= calF[0] and fStop <= calF[-1]:
+                # band calibration (as from the library) covering the sweep
+                msa.calNeedsInterp = True
+                if cal.oslCal:
+                    msa.NewScanSettings(p)
+                    cal.interpolateCal(msa._freqs)
             elif p.calLevel > 0 and msa.baseCal and \
                         fStart >= msa.baseCal.Fmhz[0] and \
                         fStop <= msa.baseCal.Fmhz[-1]:
@@ -686,6 +711,40 @@ class MSASpectrumFrame(wx.Frame):
                     needsRefresh = True
             return needsRefresh
 
+    #--------------------------------------------------------------------------
+    # If the band calibration doesn't match the sweep, install the best one
+    # saved in the calibration library, if any.
+
+    def FindLibraryCal(self):
+        global msa
+        p = self.prefs
+        lib = msa.calLibrary
+        if not lib:
+            return
+        oslCal = msa.mode == MSA.MODE_VNARefl
+        cal = msa.bandCal
+        if cal and cal.oslCal == oslCal and \
+                round(cal.Fmhz[0] - p.fStart, 8) == 0 and \
+                round(cal.Fmhz[-1] - p.fStop, 8) == 0 and \
+                cal.nSteps == p.nSteps and cal.isLogF == p.isLogF:
+            return
+        fixture = R0 = None
+        if oslCal:
+            if p.get("isSeriesFix", False):
+                fixture = "Series"
+            elif p.get("isShuntFix", False):
+                fixture = "Shunt"
+            else:
+                fixture = "Reflect"
+            R0 = p.get("fixtureR0", None)
+        path, exact = lib.Find(msa.mode, p.RBWSelindex + 1, oslCal, p.fStart,
+                               p.fStop, p.nSteps, p.isLogF, fixture, R0)
+        if path:
+            try:
+                msa.bandCal = lib.Get(path)
+            except (ValueError, KeyError, IOError):
+                pass
+
     #--------------------------------------------------------------------------
     # Stop any scanning and wait for all results to be updated.
 
@@ -779,8 +838,9 @@ class MSASpectrumFrame(wx.Frame):
         assert wx.Thread_IsMain()
         ##LogGUIEvent("OnTimer")
 
-        # draw any new scan data from the back end thread
-        if not msa.scanResults.empty():
+        # draw any new scan data from the back end thread, when a frame is
+        # due (until then, it collects in the queue)
+        if not msa.scanResults.empty() and msa.pacer.Begin():
             spec = self.spectrum
             LogGUIEvent("OnTimer: have updates")
             if spec == None:
@@ -788,10 +848,20 @@ class MSASpectrumFrame(wx.Frame):
                 self.spectrum = spec
 
             # add scanned steps to our spectrum, noting if they include
-            # the last step
+            # the last step. Each sweep completed is recorded as it ends,
+            # before the next one starts over it.
             includesLastStep = False
             while not msa.scanResults.empty():
-                includesLastStep |= spec.SetStep(msa.scanResults.get())
+                valueSet = msa.scanResults.get()
+                if spec.SetStep(valueSet):
+                    includesLastStep = True
+                    if self.sweepArchivePath:
+                        # completion time, from the last step's capture
+                        when = time.time() - \
+                            (msElapsed() - valueSet[-1]) / 1000.
+                        self.ArchiveSweep(spec, when)
+                    if self.waterfallDlg:
+                        self.waterfallDlg.AddSweep(spec)
 
             # move the cursor to the last captured step
             specP.cursorStep = spec.step
@@ -804,9 +874,14 @@ class MSASpectrumFrame(wx.Frame):
                 if self.smithDlg and slowDisplay:
                     self.smithDlg.Refresh()
             self.DrawTraces()
+            # paint now, so the frame's drawing time includes it
+            specP.Update()
             LogGUIEvent("OnTimer: all traces drawn, cursorStep=%d" % spec.step)
             if self.varDlg:
                 self.varDlg.Refresh()
+            # follow the display's pace
+            if msa.pacer.End():
+                self.timer.Start(msa.pacer.interval)
 
         # put Scan/Halt/Continue buttons in right mode
         if msa.IsScanning() != self.btnScanMode:
@@ -861,6 +936,7 @@ class MSASpectrumFrame(wx.Frame):
 
         spec.isSeriesFix = p.get("isSeriesFix", False)
         spec.isShuntFix = p.get("isShuntFix", False)
+        spec.UpdateDerived()
 
         # set left (0) and right (1) vertical scale variables
         # and create potential traces for each (trva, trvb)
@@ -874,10 +950,12 @@ class MSASpectrumFrame(wx.Frame):
         p.vaDiv = vs0.div
         vaType = types[vaTypeIndex]
 
-        if spec.vaType != vaType:
+        if vs0.detector.mode != DET_NORMAL:
+            # traces of detected data are made from the detector's spectrum
+            trva = vaType(vs0.detector.Detect(spec, includePhase), 0)
+            spec.vaType = spec.trva = None
+        elif spec.vaType != vaType:
             trva = vaType(spec, 0)
-            trva.maxHold = vs0.maxHold
-            trva.max = False
             if incremental:
                 spec.vaType = vaType
                 spec.trva = trva
@@ -892,10 +970,12 @@ class MSASpectrumFrame(wx.Frame):
         p.vbDiv = vs1.div
         vbType = types[vbTypeIndex]
 
-        if spec.vbType != vbType:
+        if vs1.detector.mode != DET_NORMAL:
+            # traces of detected data are made from the detector's spectrum
+            trvb = vbType(vs1.detector.Detect(spec, includePhase), 1)
+            spec.vbType = spec.trvb = None
+        elif spec.vbType != vbType:
             trvb = vbType(spec, 1)
-            trvb.maxHold = vs1.maxHold
-            trvb.max = False
             if incremental:
                 spec.vbType = vbType
                 spec.trvb = trvb
@@ -924,62 +1004,47 @@ class MSASpectrumFrame(wx.Frame):
             trM.phaseTrace = trP
             trP.magTrace = trM
 
-        # draw any compatible reference traces
+        # draw the reference traces, resampled to the sweep's frequencies
         for ri in self.refs.keys():
             ref = self.refs[ri]
-            rsp = ref.spectrum
-            if rsp.nSteps == spec.nSteps and rsp.Fmhz[0] == spec.Fmhz[0] \
-                                         and rsp.Fmhz[-1] == spec.Fmhz[-1]:
-                mathMode = ref.mathMode
-                if trM and ri == 1 and ref.mathMode > 0:
-                    # Ref 1 math applied to Mag, Phase
-                    mData = trM.v
-                    mRef = rsp.Sdb
-                    if mathMode == 1:
-                        mMath = mData + mRef
-                    elif mathMode == 2:
-                        mMath = mData - mRef
-                    else:
-                        mMath = mRef - mData
-                    trM.v = dcopy.copy(mMath)
-                    if includePhase and trP:
-                        pData = trP.v
-                        pRef = rsp.Sdeg
-                        if mathMode == 1:
-                            pMath = pData + pRef
-                        elif mathMode == 2:
-                            pMath = pData - pRef
-                        else:
-                            pMath = pRef - pData
-                        trP.v = dcopy.copy(modDegree(pMath))
-                else:
-                    # Ref trace is displayed
-                    refTypeM = ref.vScale.dataType
-                    # vScales[] index 0 or 1 based on units (for now)
-                    i = trvb.units and trvb.units == refTypeM.units
-                    if not i:
-                        i = 0
-                    name = ref.name
-                    refHasPhase = includePhase and refTypeM.units == "dB"
-                    if refHasPhase:
-                        # create ref's phase trace, with unique names for both
-                        # (use continuous phase if that's being displayed)
-                        continPhase = trP.units == "CDeg"
-                        refTypeP = types[ref.vScale.typeIndex+1+continPhase]
-                        refTrP = refTypeP(rsp, 1-i)
-                        name = "%s_dB" % name
-                        phName = "%s_%s" % (ref.name, trP.name.split("_")[1])
-                    # create and assign name to ref's mag trace
-                    specP.traces[name] = refTrM = refTypeM(rsp, i)
-                    refTrM.name = name
-                    refTrM.isMain = False
-                    refTrM.iColor = self.IndexForColor(2 + 2*ri)
-                    if refHasPhase:
-                        # assign name to ref's phase trace
-                        specP.traces[phName] = refTrP
-                        refTrP.name = phName
-                        refTrP.isMain = False
-                        refTrP.iColor = self.IndexForColor(refTrM.iColor + 1)
+            rsp = ref.OnGrid(spec.Fmhz)
+            if trM and ri == 1 and ref.mathMode > 0:
+                # Ref 1 math applied to Mag, Phase, in place of them
+                if not (includePhase and trP):
+                    trP = None
+                math = RefMath.For(trM.spec)
+                mathM, mathP = math.Apply(ref, trM, trP)
+                specP.traces[trM.name] = trM = mathM
+                if trP:
+                    specP.traces[trP.name] = trP = mathP
+            else:
+                # Ref trace is displayed
+                refTypeM = ref.vScale.dataType
+                # vScales[] index 0 or 1 based on units (for now)
+                i = trvb.units and trvb.units == refTypeM.units
+                if not i:
+                    i = 0
+                name = ref.name
+                refHasPhase = includePhase and refTypeM.units == "dB"
+                if refHasPhase:
+                    # create ref's phase trace, with unique names for both
+                    # (use continuous phase if that's being displayed)
+                    continPhase = trP.units == "CDeg"
+                    refTypeP = types[ref.vScale.typeIndex+1+continPhase]
+                    refTrP = refTypeP(rsp, 1-i)
+                    name = "%s_dB" % name
+                    phName = "%s_%s" % (ref.name, trP.name.split("_")[1])
+                # create and assign name to ref's mag trace
+                specP.traces[name] = refTrM = refTypeM(rsp, i)
+                refTrM.name = name
+                refTrM.isMain = False
+                refTrM.iColor = self.IndexForColor(2 + 2*ri)
+                if refHasPhase:
+                    # assign name to ref's phase trace
+                    specP.traces[phName] = refTrP
+                    refTrP.name = phName
+                    refTrP.isMain = False
+                    refTrP.iColor = self.IndexForColor(refTrM.iColor + 1)
 
         # enable drawing of spectrum (if not already)
         specP.Enable()
@@ -1231,6 +1296,17 @@ class MSASpectrumFrame(wx.Frame):
             self.varDlg.Raise()
         self.varDlg.Show(True)
 
+    #--------------------------------------------------------------------------
+    # Open the Waterfall window, which shows each sweep completed from then
+    # on.
+
+    def ShowWaterfall(self, event=None):
+        if not self.waterfallDlg:
+            from waterfall import WaterfallDialog
+            self.waterfallDlg = WaterfallDialog(self)
+        else:
+            self.waterfallDlg.Raise()
+
     #==============================================================================
     # A window showing important variables.
 
@@ -1306,12 +1382,13 @@ class MSASpectrumFrame(wx.Frame):
         bitmap.SaveFile(path, bmtype)   # JGH 2/10/14
 
     #--------------------------------------------------------------------------
-    # Load or save spectrum data to an s1p file.
+    # Load or save spectrum data to a Touchstone file. A two-port file loads
+    # its S21.
 
     def LoadData(self, event):
         self.StopScanAndWait()
         p = self.prefs
-        wildcard = "S1P (*.s1p)|*.s1p"
+        wildcard = "Touchstone (*.s1p;*.s2p)|*.s1p;*.s2p"
         dataDir = p.get("dataDir", appdir)
         dlg = wx.FileDialog(self, "Choose file...", defaultDir=dataDir,
                 defaultFile="", wildcard=wildcard)
@@ -1320,7 +1397,12 @@ class MSASpectrumFrame(wx.Frame):
         path = dlg.GetPath()
         p.dataDir = os.path.dirname(path)
 ##        print ("Reading", path)
-        spec = self.spectrum = Spectrum.FromS1PFile(path)
+        try:
+            ts = Touchstone.Read(path)
+        except (ValueError, IOError) as e:
+            message(str(e), "Load Data")
+            return
+        spec = self.spectrum = Spectrum.FromTouchstone(ts)
         specP = self.specP
         specP.h0 = p.fStart = spec.Fmhz[0]  # EON Jan 10 2014
         specP.h1 = p.fStop  = spec.Fmhz[-1] # EON Jan 10 2014
@@ -1535,41 +1617,65 @@ class MSASpectrumFrame(wx.Frame):
         if self.CalCheck(): # EON Jan 29, 2014
             self.RefreshAllParms()
 
+    # Install a new band or base calibration. Saving it is left to the
+    # calibration worker, as is interpolating a new base calibration to the
+    # test setup sweeps.
+
     def SetBandCal(self, spectrum):
         global msa
         msa.bandCal = spectrum
-        if spectrum:
-            msa.bandCal.WriteS1P(self.bandCalFileName, self.prefs,
-                                 contPhase=True)
-        else:
-            try:
-                os.unlink(self.bandCalFileName)
-            except:
-                pass
+        msa.calWorker.Submit(self._StoreBandCal, spectrum,
+                             dcopy.copy(self.prefs))
+
+    def _StoreBandCal(self, spectrum, p):
+        self._WriteCal(spectrum, self.bandCalFileName, p)
+        if spectrum and msa.calLibrary:
+            msa.calLibrary.Add(spectrum, p)
 
     def SetBaseCal(self, spectrum):
         global msa
         msa.baseCal = spectrum
-        self.SaveCal(spectrum, self.baseCalFileName)
+        self._StoreBaseCal()
+
+    def _StoreBaseCal(self):
+        p = self.prefs
+        msa.calWorker.Submit(self._WriteCal, msa.baseCal,
+                             self.baseCalFileName, dcopy.copy(p))
+        msa.calWorker.PrecomputeBase(msa.baseCal, msa.mode,
+                                     p.RBWSelindex + 1)
 
     def SetBandeCal(self, spectrum):
         global msa
         msa.bandCal = spectrum
         self.SaveCal(spectrum, self.bandCalFileName)
 
+    # Calibrations are saved in the binary format of calStore, unless given
+    # an .s1p file name.
+
     def SaveCal(self, spectrum, path):
+        msa.calWorker.Wait()
+        self._WriteCal(spectrum, path, self.prefs)
+
+    def _WriteCal(self, spectrum, path, p):
         if spectrum:
-            spectrum.WriteS1P(path, self.prefs, contPhase=True)
+            if path.lower().endswith(".s1p"):
+                calStore.ExportText(spectrum, path, p)
+            else:
+                calStore.SaveCal(spectrum, path, p)
         elif os.path.exists(path):
             os.unlink(path)
 
     def LoadCal(self, path):
-        if os.path.exists(path):
-            cal = Spectrum.FromS1PFile(path) # EON Jan 29, 2014
-            if cal == None:
-                from cal import OslCal
-                cal = OslCal.FromS1PFile(path)
-            return cal
+        msa.calWorker.Wait()
+        if path.lower().endswith(".s1p"):
+            textPath = path
+        else:
+            if os.path.exists(path):
+                return calStore.LoadCal(path)
+            # may have been saved as text by an earlier version
+            textPath = os.path.splitext(path)[0] + ".s1p"
+        if os.path.exists(textPath):
+            return calStore.ImportText(textPath) # EON Jan 29, 2014
         else:
             return None
 
@@ -1577,7 +1683,7 @@ class MSASpectrumFrame(wx.Frame):
         global msa
         if msa.bandCal != None:
             msa.baseCal = dcopy.deepcopy(msa.bandCal)
-            msa.baseCal.WriteS1P(self.baseCalFileName, self.prefs, contPhase=True)
+            self._StoreBaseCal()
 
     #--------------------------------------------------------------------------
     # Read CalPath file for mag/phase linearity adjustment.
@@ -1590,9 +1696,9 @@ class MSASpectrumFrame(wx.Frame):
         p = self.prefs
         directory, fileName = CalFileName(p.RBWSelindex+1)
         try:
-            f = open(os.path.join(directory, fileName), "Ur")
             msa.magTableADC, msa.magTableDBm, msa.magTablePhase = \
-                    CalParseMagFile(f)
+                    calStore.LoadCalTable(os.path.join(directory, fileName),
+                                          "mag", CalParseMagFile)
             if 0 or debug:
                 print (fileName, "read OK.")
         except:
@@ -1610,8 +1716,9 @@ class MSASpectrumFrame(wx.Frame):
         self.StopScanAndWait()
         directory, fileName = CalFileName(0)
         try:
-            f = open(os.path.join(directory, fileName), "Ur")
-            msa.freqTableMHz, msa.freqTableDB = CalParseFreqFile(f)
+            msa.freqTableMHz, msa.freqTableDB = \
+                    calStore.LoadCalTable(os.path.join(directory, fileName),
+                                          "freq", CalParseFreqFile)
             if 0 or debug:
                 print (fileName, "read OK.")
         except:
@@ -1628,6 +1735,57 @@ class MSASpectrumFrame(wx.Frame):
     def SaveInputData(self, event):
         self.SaveData(writer=self.spectrum.WriteInput, name="InputData.txt")
 
+    #--------------------------------------------------------------------------
+    # Start or stop recording every completed sweep to a sweep history
+    # archive. The archive is opened at the end of the first sweep, and an
+    # existing one is added to if its frequencies are the same.
+
+    def RecordSweeps(self, event):
+        p = self.prefs
+        if self.sweepArchivePath:
+            path = self.sweepArchivePath
+            n = 0
+            if self.sweepArchive != None:
+                n = len(self.sweepArchive)
+            self.StopRecordingSweeps()
+            message("Recording stopped. %s holds %d sweeps." % (path, n),
+                    "Sweep History")
+            return
+        wildcard = "Sweep history (*%s)|*%s" % (archiveExt, archiveExt)
+        dataDir = p.get("dataDir", appdir)
+        dlg = wx.FileDialog(self, "Record sweeps to...", defaultDir=dataDir,
+                defaultFile="SweepHistory" + archiveExt, wildcard=wildcard,
+                style=wx.FD_SAVE)
+        if dlg.ShowModal() != wx.ID_OK:
+            return
+        path = CheckExtension(dlg.GetPath(), self, (archiveExt))
+        if path:
+            p.dataDir = os.path.dirname(path)
+            self.sweepArchivePath = path
+
+    # Record spectrum spec's sweep, completed at time when.
+
+    def ArchiveSweep(self, spec, when):
+        p = self.prefs
+        try:
+            if self.sweepArchive == None:
+                meta = {"mode": p.mode, "pathNo": p.RBWSelindex + 1,
+                        "isLogF": bool(p.isLogF)}
+                self.sweepArchive = SweepArchive(self.sweepArchivePath,
+                                                 spec.Fmhz, meta)
+            elif not self.sweepArchive.Matches(spec.Fmhz):
+                raise ValueError("Sweep changed; recording stopped.")
+            self.sweepArchive.Append(spec.Sdb, spec.Sdeg, when)
+        except (ValueError, IOError) as e:
+            self.StopRecordingSweeps()
+            message(str(e), "Sweep History")
+
+    def StopRecordingSweeps(self):
+        if self.sweepArchive != None:
+            self.sweepArchive.Close()
+        self.sweepArchive = None
+        self.sweepArchivePath = None
+
     def SaveInstalledLineCal(self, event):
         global msa
         p = self.prefs
@@ -1878,6 +2036,9 @@ class MSASpectrumFrame(wx.Frame):
             msa.syndut.Close()
         if self.smithDlg:
             self.smithDlg.Close()
+        if self.waterfallDlg:
+            self.waterfallDlg.Close()
+        self.StopRecordingSweeps()
         self.SavePrefs()
         print ("Exiting2")
         self.Destroy()
@@ -1,9 +1,9 @@
 from msaGlobal import GetMsa, SetModuleVersion
 import wx
-import copy as dcopy
 import wx.lib.colourselect as csel
-from numpy import zeros
-from util import floatOrEmpty
+import copy as dcopy
+from numpy import add, interp, pi, subtract, unwrap, zeros
+from util import floatOrEmpty, modDegree
 from msa import MSA
 from spectrum import Spectrum
 
@@ -22,15 +22,124 @@ class Ref(Spectrum):
         self.aWidth = 1
         self.bWidth = 1
         self.mathMode = 0
+        self._gridFmhz = None
+        self._gridSpec = None
 
     @classmethod
     def FromSpectrum(cls, refNum, spectrum, vScale):
         this = cls(refNum)
-        this.spectrum = dcopy.deepcopy(spectrum)
+        this.spectrum = spectrum.Copy(compact=True)
         this.vScale = vScale
         ##this.aColor = vColors[refNum]
         return this
 
+    #--------------------------------------------------------------------------
+    # The reference's spectrum on sweep frequencies Fmhz: its own spectrum if
+    # taken at them, or else a copy resampled onto them, kept until the
+    # sweep frequencies change. Beyond the reference's span its end values
+    # are held.
+
+    def OnGrid(self, Fmhz):
+        if Fmhz is self._gridFmhz:
+            return self._gridSpec
+        rsp = self.spectrum
+        rF = rsp.Fmhz
+        if len(rF) == len(Fmhz) and (rF == Fmhz).all():
+            gsp = rsp
+        else:
+            gsp = rsp.Copy(compact=True)
+            gsp.Resize(len(Fmhz) - 1, Fmhz)
+            gsp.step = gsp.maxStep = gsp.nSteps
+            gsp.Sdb = interp(Fmhz, rF, rsp.Sdb)
+            # interpolate phase unwrapped, so steps across +/-180 go the
+            # short way
+            deg = interp(Fmhz, rF, unwrap(rsp.Sdeg * pi/180) * 180/pi)
+            gsp.Sdeg = modDegree(deg)
+            gsp.Scdeg = interp(Fmhz, rF, rsp.Scdeg)
+            gsp.Mdb = interp(Fmhz, rF, rsp.Mdb)
+            gsp.Mdeg = interp(Fmhz, rF, rsp.Mdeg)
+        self._gridFmhz = Fmhz
+        self._gridSpec = gsp
+        return gsp
+
+#==============================================================================
+# Reference math: a trace's magnitude and phase values combined with a
+# reference's, step by step (Data + Ref, Data - Ref, or Ref - Data).
+#
+# One is kept per spectrum, in spec.derived, holding the results of the last
+# math done on its traces. Only the steps changed since then are recomputed,
+# unless the reference, math mode, or traces are different.
+
+refMathOps = (None, add, subtract, lambda data, ref: ref - data)
+
+class RefMath:
+    def __init__(self, spec):
+        self.spec = spec
+        self.key = None
+        self.values = None              # the traces' values, kept alive
+        self.mag = self.phase = None    # results
+        self.lo, self.hi = 0, 0         # range of steps needing update
+
+    # Return the RefMath of spectrum spec, creating it if needed.
+
+    @classmethod
+    def For(cls, spec):
+        math = spec.derived.get("refMath")
+        if math == None:
+            math = spec.derived["refMath"] = cls(spec)
+        return math
+
+    def Invalidate(self, lo, hi):
+        self.lo = min(self.lo, lo)
+        self.hi = max(self.hi, hi)
+
+    # Updating is done by Apply, as it needs the traces.
+
+    def Update(self):
+        pass
+
+    #--------------------------------------------------------------------------
+    # Apply ref's math to mag trace trM and phase trace trP (or None),
+    # returning copies of them holding the results. The traces themselves
+    # are left unchanged.
+
+    def Apply(self, ref, trM, trP=None):
+        n = len(trM.v)
+        rsp = ref.OnGrid(trM.Fmhz)
+        op = refMathOps[ref.mathMode]
+        # the traces' values are identified by their storage, which stays
+        # put while the traces are updated in place (and is held, so it
+        # can't be reused), and by their generations, which change when
+        # they are recomputed as a whole
+        key = (ref, ref.mathMode, rsp, trM.__class__, _Addr(trM.v),
+               trM.Generation(), trP and trP.__class__,
+               trP and _Addr(trP.v), trP and trP.Generation())
+        if key != self.key:
+            self.key = key
+            self.values = (trM.v, trP and trP.v)
+            self.mag = zeros(n)
+            self.phase = trP and zeros(n)
+            self.lo, self.hi = 0, n
+        if self.lo < self.hi:
+            s = slice(self.lo, self.hi)
+            self.lo, self.hi = n, 0
+            self.mag[s] = op(trM.v[s], rsp.Sdb[s])
+            if trP:
+                self.phase[s] = modDegree(op(trP.v[s], rsp.Sdeg[s]))
+
+        mathM = dcopy.copy(trM)
+        mathM.v = self.mag
+        if not trP:
+            return mathM, None
+        mathP = dcopy.copy(trP)
+        mathP.v = self.phase
+        mathM.phaseTrace = mathP
+        mathP.magTrace = mathM
+        return mathM, mathP
+
+def _Addr(a):
+    return a.__array_interface__["data"][0], len(a)
+
 #==============================================================================
 # The Reference Line dialog box.
 
@@ -0,0 +1,249 @@
+from msaGlobal import SetModuleVersion
+import re
+from numpy import abs as npabs, angle, asarray, clip, cos, cosh, errstate, \
+    exp, log10, maximum, mod, pi, sin, sinh, sqrt, where, zeros
+from util import constMaxValue, floatSI
+
+SetModuleVersion("rlcModel",("1.30","EON","05/20/2014"))
+
+#==============================================================================
+# RLC combination models, as used for calibration standards.
+#
+# An RLC spec string is parsed once into an RLCModel, which then gives the
+# impedance, or S11 or S21 response, of the combination over a whole array
+# of frequencies at once.
+#
+# Spec strings are of the form
+#
+#   RLC[S, R25, L10n, C200p, QL10, QC10, D2], Coax[xxx,xxx...]
+#
+# First item is S for series or P for parallel, referring to the RLC
+# combination. Remaining items are optional; one R, L, C, QL, QC and D are
+# allowed. R, L, C and D are in ohms, Henries, Farads and seconds, and
+# multiplier characters (k, u, n, etc.) are allowed. QL and QC are the Q
+# values for the L and C. D is the one-way delay in front of the
+# components, only used if there are no coax specs, which describe a
+# transmission line per Coax.CoaxParseSpecs. The coax specs are parsed
+# once, into coaxErr and the line's R0, VF, K1, K2 and length (feet).
+
+class RLCModel:
+    def __init__(self, connect="P", R=constMaxValue, L=constMaxValue, C=0,
+                 QL=100000, QC=100000, D=0, coaxSpec=""):
+        self.connect = connect
+        self.R = R
+        self.L = L
+        self.C = C
+        self.QL = QL
+        self.QC = QC
+        self.D = D
+        self.coaxSpec = coaxSpec
+        self.coaxErr = False
+        self.coax = None            # (R0, VF, K1, K2, lenFeet)
+        if coaxSpec != "":
+            from coax import Coax
+            isErr, R0, VF, K1, K2, lenFeet = Coax.CoaxParseSpecs(coaxSpec)
+            self.coaxErr = bool(isErr) or R0 <= 0
+            self.coax = (R0, VF, K1, K2, lenFeet)
+
+    #--------------------------------------------------------------------------
+    # Parse an RLC spec string. Returns (isErr, model).
+
+    @classmethod
+    def Parse(cls, spec):
+        m = re.match("RLC\\[(.+?)\\]", spec)
+        RLC = m and m.group(1) or ""
+        m = re.search("Coax\\[(.+?)\\]", spec)
+        coaxSpec = m and m.group(1) or ""
+
+        model = cls(coaxSpec=coaxSpec)
+        isErr = model.coaxErr
+        for val in re.split(", *", RLC.strip()):
+            if val == "":
+                break
+            m = re.match("([A-Z]+)(.*)", val)
+            if m == None:
+                isErr = True
+                continue
+            tag, v = m.groups()
+            if tag == "S":
+                model.connect = "S"
+                model.R = 0
+                model.L = 0
+                model.C = constMaxValue
+            elif tag == "P":
+                model.connect = "P"
+                model.R = constMaxValue
+                model.L = constMaxValue
+                model.C = 0
+            elif v != "":
+                v = floatSI(v)
+                if tag in ("R", "L", "C", "QL", "QC"):
+                    setattr(model, tag, v)
+                    if (tag == "R" and v < 0) or (tag[0] == "Q" and v <= 0):
+                        isErr = True
+                elif tag == "D":
+                    if coaxSpec == "":
+                        model.D = v
+                else:
+                    isErr = True
+            else:
+                isErr = True
+        return isErr, model
+
+    #--------------------------------------------------------------------------
+    # Impedance of the RLC combination at frequencies freq (Hz), not
+    # including any coax or delay. For a series circuit, C >= constMaxValue
+    # means there is no C (a short); for a parallel one, L >= constMaxValue
+    # means there is no L (an open). The result is limited to
+    # +/-constMaxValue, with a non-negative real part.
+
+    def Impedance(self, freq):
+        freq = asarray(freq, dtype=float)
+        R, L, C = self.R, self.L, self.C
+        QL = self.QL > 0 and self.QL or 0.000001
+        QC = self.QC > 0 and self.QC or 0.000001
+        n = len(freq)
+        twoPiF = 2 * pi * freq
+        noFreq = freq == 0
+
+        with errstate(divide="ignore", invalid="ignore"):
+            # inductor and capacitor impedances, with their Qs
+            ZL = zeros(n, dtype=complex) + complex(0, constMaxValue)
+            if abs(L) < constMaxValue:
+                ZLi = twoPiF * L
+                ZL = where(noFreq, ZL, ZLi / QL + 1j * ZLi)
+            ZC = zeros(n, dtype=complex) + complex(0, -constMaxValue)
+            if C != 0:
+                ZCi = -1 / (twoPiF * C)
+                ZC = where(noFreq, ZC, npabs(ZCi) / QC + 1j * ZCi)
+
+            if self.connect == "S":
+                Z = R + ZL
+                if abs(C) < constMaxValue:
+                    Z = Z + ZC
+                if C == 0:
+                    Z[:] = complex(0, -constMaxValue)
+                else:
+                    Z[noFreq] = complex(0, -constMaxValue)
+            elif R == 0 or L == 0 or abs(C) >= constMaxValue:
+                # parallel with a zero-ohm component
+                Z = zeros(n, dtype=complex)
+            else:
+                # parallel: add admittances and then invert
+                A = zeros(n, dtype=complex) + 1. / R
+                if abs(L) < constMaxValue:
+                    A = where(noFreq, A, A + 1 / ZL)
+                if C != 0:
+                    A = A + 1 / ZC
+                Z = 1 / A
+
+        Zr = clip(Z.real, 0, constMaxValue)
+        Zi = clip(Z.imag, -constMaxValue, constMaxValue)
+        return Zr + 1j * Zi
+
+    #--------------------------------------------------------------------------
+    # Response of the combination at frequencies Fmhz (MHz), tested at
+    # reference impedance Z0: S11 if jig is "S11", S21 of a shunt connection
+    # if "S21Shunt", otherwise S21 of a series connection. This is the
+    # response after a perfect calibration, so the jig's shunt delay is not
+    # included. Returns (dB, degrees) arrays, with degrees in (-180, 180].
+
+    def Response(self, Fmhz, Z0, jig):
+        Fmhz = asarray(Fmhz, dtype=float)
+        freq = Fmhz * 1e6
+        Z = self.Impedance(freq)
+        S = None
+        if self.coax != None:
+            R0, VF, K1, K2, lenFeet = self.coax
+            coaxZ0 = CoaxZ0(Fmhz, R0, VF, K1, K2)
+            GL = CoaxGamma(Fmhz, VF, K1, K2) * lenFeet
+            if jig == "S11" or jig == "S21Shunt":
+                if lenFeet != 0:
+                    Z = coaxZ0 * ((Z * cosh(GL) + coaxZ0 * sinh(GL)) /
+                                  (Z * sinh(GL) + coaxZ0 * cosh(GL)))
+            else:
+                # series S21 of coax ignores the termination
+                S = 2 / (exp(GL) + exp(-GL) + (exp(GL) - exp(-GL)) / 2 *
+                         (Z0 / coaxZ0 + coaxZ0 / Z0))
+        elif self.D != 0 and (jig == "S11" or jig == "S21Shunt"):
+            # delay the reflection at 50 ohms by the round trip time
+            G = RefcoFromImpedance(50, Z)
+            G = G * (cos(-4 * pi * self.D * freq) +
+                     1j * sin(-4 * pi * self.D * freq))
+            Z = ImpedanceFromRefco(50, G)
+
+        if S is None:
+            if jig == "S11":
+                S = RefcoFromImpedance(Z0, Z)
+            elif jig == "S21Shunt":
+                Z = maximum(Z.real, 0) + 1j * Z.imag
+                S = (2 * Z) / (2 * Z + Z0)
+            else:
+                Z = maximum(Z.real, 0) + 1j * Z.imag
+                S = (2 * Z0) / (2 * Z0 + Z)
+
+        mag = npabs(S)
+        with errstate(divide="ignore"):
+            db = where(mag <= 1e-20, -400., 20 * log10(mag))
+        deg = mod(angle(S, deg=True), 360)
+        deg = where(deg > 180, deg - 360, deg)
+        return db, deg
+
+#------------------------------------------------------------------------------
+# Coax characteristic impedances and propagation factors (gamma, per foot)
+# at frequencies Fmhz (MHz), for a line of nominal impedance R0, velocity
+# factor VF and loss factors K1 and K2, as Coax.CoaxComplexZ0Iterate and
+# Coax.CoaxGetPropagationGamma give them point by point.
+
+def CoaxZ0(Fmhz, R0, VF, K1, K2):
+    f = maximum(asarray(Fmhz, dtype=float), 0.000001)
+    Z0 = zeros(len(f), dtype=complex) + (R0 > 0 and R0 or 1)
+    if K1 == 0 and K2 == 0:
+        return Z0
+    twoPiF = 2 * pi * f
+    ac = 0.0011513 * K1 * sqrt(f)
+    ad = 0.0011513 * K2 * f
+    gamma = (ac + ad) + 1j * twoPiF / (VF * 983.6)
+    # iterate from R0, a third time only at low frequencies or high loss
+    third = (f < 1) | ((f < 10) & (K1 > 0.6 or K2 > 0.03))
+    for i in range(3):
+        R = 2 * ac * Z0.real
+        G = 2 * ad * Z0.real / npabs(Z0)**2
+        L = (gamma * Z0).imag / twoPiF
+        C = maximum(1e6 * (gamma / Z0).imag / twoPiF, 0.001)
+        Zi = sqrt((R + 1j * twoPiF * L) / (G + 1j * twoPiF * C * 1e-6))
+        Z0 = where(third, Zi, Z0) if i == 2 else Zi
+    return Z0
+
+def CoaxGamma(Fmhz, VF, K1, K2):
+    f = maximum(asarray(Fmhz, dtype=float), 0.000001)
+    if VF <= 0:
+        beta = constMaxValue
+    else:
+        beta = 2 * pi * f / (VF * 983.6)
+    return 0.001151 * (K1 * sqrt(f) + K2 * f) + 1j * beta
+
+# Reflection coefficients of impedances Z at reference resistance R0.
+
+def RefcoFromImpedance(R0, Z):
+    Z = asarray(Z, dtype=complex)
+    with errstate(divide="ignore", invalid="ignore"):
+        G = (Z - R0) / (Z + R0)
+    return where(Z + R0 == 0, complex(constMaxValue, 0), G)
+
+# Impedances from reflection coefficients G at reference resistance R0,
+# limited as uRefcoToImpedance does.
+
+def ImpedanceFromRefco(R0, G):
+    G = asarray(G, dtype=complex)
+    rho = clip(npabs(G), 0, 1)
+    G = rho * (cos(angle(G)) + 1j * sin(angle(G)))
+    den = 1 - G
+    with errstate(divide="ignore", invalid="ignore"):
+        Z = R0 * (1 + G) / den
+    Z = where(npabs(den) < 0.0000000001, complex(constMaxValue, 0), Z)
+    Z = where(G.real > 0.999999, complex(constMaxValue, 0), Z)
+    Z = where(G.real < -0.999999, 0j, Z)
+    Zr = where(Z.real < 0.001, 0, Z.real)
+    Zi = where(abs(Z.imag) < 0.001, 0, Z.imag)
+    return Zr + 1j * Zi
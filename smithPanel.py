@@ -1,7 +1,7 @@
 from msaGlobal import GetFontSize, isLinux, SetModuleVersion
 import wx
 from math import atan2
-from numpy import arange, angle, interp, log10, nan_to_num, pi, sqrt, tan
+from numpy import angle, column_stack, log10, nan_to_num, pi, sqrt, tan
 from util import si
 from events import LogGUIEvent
 
@@ -65,6 +65,9 @@ class SmithPanel(wx.Panel):
         ##self.SetBackgroundStyle(wx.BG_STYLE_CUSTOM)
         self.Bind(wx.EVT_PAINT,        self.OnPaint)
         self.Bind(wx.EVT_SIZE,         self.OnSizeChanged)
+        self._gridBitmap = None
+        self._gridKey = None        # size, R0, and colors grid was drawn for
+        self.smRad = 0              # chart radius (pixels)
 
     #--------------------------------------------------------------------------
     # Force the grid and other parts to be redrawn on a resize.
@@ -72,6 +75,7 @@ class SmithPanel(wx.Panel):
     def FullRefresh(self):
         if debug:
             print ("Smith.FullRefresh")
+        self._gridKey = None
         self.Refresh()
 
     def OnSizeChanged(self, event):
@@ -79,44 +83,39 @@ class SmithPanel(wx.Panel):
         event.Skip()   # (will continue handling event)
 
     #--------------------------------------------------------------------------
-    # Repaint the Smith chart.
+    # Draw the chart's grid, circles, arcs, and labels into the grid bitmap,
+    # unless it's already drawn for this size, theme, and R0.
 
-    def OnPaint(self, event):
-        LogGUIEvent("Smith.OnPaint")
-        frame = self.frame
-        specP = frame.specP
+    def DrawGrid(self, clientWid, clientHt):
         p = self.prefs
-        self.vColors = vColors = p.theme.vColors
         foreColor = p.theme.foreColor
         backColor = p.theme.backColor
         gridColor = p.theme.gridColor
-        forePen = wx.Pen(foreColor, 1, wx.SOLID)
-        #backPen = wx.Pen(backColor, 1, wx.SOLID)
+        R0 = p.get("graphR",50)
+        key = (clientWid, clientHt, R0, fontSize) + \
+                tuple(tuple(c.Get()) for c in (foreColor, backColor, gridColor))
+        if key == self._gridKey:
+            return
+        LogGUIEvent("Smith.DrawGrid")
         gridPen = wx.Pen(gridColor, 1, wx.SOLID)
         fontSizeGC = fontSize * (1, 1.5)[isLinux]
         normalFont = wx.Font(fontSizeGC, wx.SWISS, wx.NORMAL, wx.NORMAL)
         backBrush = wx.Brush(backColor, wx.SOLID)
-        clientWid, clientHt = self.GetSize()
-
-        # ------ GRID ------
-
-        # (GraphicsContext doesn't like AutoBufferedPaintDC, so we use:)
-        if self.IsDoubleBuffered():
-            dc = wx.PaintDC(self)
-        else:
-            dc = wx.BufferedPaintDC(self)
-            dc.Clear()
 
+        self._gridBitmap = wx.EmptyBitmap(clientWid, clientHt)
+        dc = wx.MemoryDC()
+        dc.SelectObject(self._gridBitmap)
+        dc.SetBackground(backBrush)
+        dc.Clear()
         gc = wx.GraphicsContext.Create(dc)
         gc.Translate(clientWid/2, clientHt/2)
-        foreFont = gc.CreateFont(normalFont, foreColor)
         gridFont = gc.CreateFont(normalFont, gridColor)
 
         # pure resistance line across center
         gc.SetFont(gridFont)
         text = "0"
         tw, th = gc.GetTextExtent(text)
-        smRad = min(clientWid, clientHt)/2 - th - 5
+        self.smRad = smRad = min(clientWid, clientHt)/2 - th - 5
         path = gc.CreatePath()
         path.MoveToPoint(-smRad, 0)
         path.AddLineToPoint(smRad, 0)
@@ -124,7 +123,6 @@ class SmithPanel(wx.Panel):
         gc.StrokePath(path)
         gc.DrawText(text, -smRad-tw-2, -th/2)
 
-        R0 = p.get("graphR",50)
         for R in (0.2, 0.5, 1., 2., 4.):
             # resistance arcs
             s11r = (R-1) / (R+1)
@@ -168,6 +166,45 @@ class SmithPanel(wx.Panel):
         gc.SetPen(wx.Pen(gridColor, 2, wx.SOLID))
         gc.StrokePath(path)
 
+        del gc
+        dc.SelectObject(wx.NullBitmap)
+        self._gridKey = key
+
+    #--------------------------------------------------------------------------
+    # Repaint the Smith chart.
+
+    def OnPaint(self, event):
+        LogGUIEvent("Smith.OnPaint")
+        frame = self.frame
+        specP = frame.specP
+        p = self.prefs
+        self.vColors = vColors = p.theme.vColors
+        foreColor = p.theme.foreColor
+        backColor = p.theme.backColor
+        forePen = wx.Pen(foreColor, 1, wx.SOLID)
+        #backPen = wx.Pen(backColor, 1, wx.SOLID)
+        fontSizeGC = fontSize * (1, 1.5)[isLinux]
+        normalFont = wx.Font(fontSizeGC, wx.SWISS, wx.NORMAL, wx.NORMAL)
+        backBrush = wx.Brush(backColor, wx.SOLID)
+        clientWid, clientHt = self.GetSize()
+
+        # ------ GRID ------
+
+        # (GraphicsContext doesn't like AutoBufferedPaintDC, so we use:)
+        if self.IsDoubleBuffered():
+            dc = wx.PaintDC(self)
+        else:
+            dc = wx.BufferedPaintDC(self)
+            dc.Clear()
+
+        self.DrawGrid(clientWid, clientHt)
+        dc.DrawBitmap(self._gridBitmap, 0, 0)
+        smRad = self.smRad
+
+        gc = wx.GraphicsContext.Create(dc)
+        gc.Translate(clientWid/2, clientHt/2)
+        foreFont = gc.CreateFont(normalFont, foreColor)
+
         # ------ TRACES ------
 
         f0 = specP.h0   # start freq (MHz)
@@ -211,32 +248,19 @@ class SmithPanel(wx.Panel):
             ##if specP.eraseOldTrace and trdf > 0:
             ##    # remove main line segs at the cursor to form a moving gap
             ##    eraseWidth = int(10/(trdf*dx)) + 1
-            eraseWidth = 0 # EON Jan 29, 2014
-            path = gc.CreatePath()
-            path.MoveToPoint(x[0], y[0])
-            for i in range(1, len(x)):
-                if 0 and i > specP.cursorStep and \
-                        i <= specP.cursorStep+eraseWidth:
-                    path.MoveToPoint(x[i], y[i])
-                else:
-                    path.AddLineToPoint(x[i], y[i])
+            ##eraseWidth = 0 # EON Jan 29, 2014
+            points = column_stack((x, y)).tolist()
             color = vColors[tr.iColor]
             gc.SetPen(wx.Pen(color, tr.dotSize, wx.SOLID))
-            gc.StrokePath(path)
+            if len(points) > 1:
+                gc.StrokeLines(points)
 
             # draw dots, either on all points if few, or just the startpoint
-            n = len(x)
-            if specP._haveDrawnGrid and specP.graphWid/fullLen > 20:
-                step = 1
-            else:
-                step = n
+            if not (specP._haveDrawnGrid and specP.graphWid/fullLen > 20):
+                points = points[:1]
             dsz = specP.dotSize
-            path = gc.CreatePath()
-            for i in range(0, n, step):
-                path.MoveToPoint(x[i], y[i])
-                path.AddLineToPoint(x[i], y[i])
             gc.SetPen(wx.Pen(color, dsz, wx.SOLID))
-            gc.StrokePath(path)
+            gc.StrokeLineSegments(points, points)
 
         # ------ MARKERS ------
 
@@ -259,10 +283,13 @@ class SmithPanel(wx.Panel):
                     mf = (m.mhz, log10(max(m.mhz, 1e-6)))[p.isLogF]
                     j = max(min((mf - trf0) / trdf, nv), 0)
 
-                # S11.real,S11.imag: coords of points to plot
-                js = arange(len(tr.S11))
-                x =  smRad * interp(j, js, tr.S11.real)
-                y = -smRad * interp(j, js, tr.S11.imag)
+                # S11 at j, interpolated between steps
+                S11 = tr.S11
+                j0 = min(int(j), len(S11) - 1)
+                j1 = min(j0 + 1, len(S11) - 1)
+                s11 = S11[j0] + (j - j0) * (S11[j1] - S11[j0])
+                x =  smRad * s11.real
+                y = -smRad * s11.imag
 
                 if m.name == "X":
                     # draw cursor, if present
@@ -1,16 +1,54 @@
 from msaGlobal import GetVersion, SetModuleVersion
-import string, time
-from numpy import array, isnan, select, zeros
+import copy as dcopy
+import time
+from numpy import array, float32, float64, interp, isnan, select, uint16, \
+    zeros
 from events import LogGUIEvent
-from util import MHz, siScale
+from touchstone import Touchstone
 
 SetModuleVersion("spectrum",("1.30","EON","05/20/2014"))
 
+# Columns of a Spectrum's storage and their types. The ADC readings are
+# 16-bit counts; capture times are only displayed.
+spectrumColumns = (
+    ("Sdb", float64),       # magnitudes (dB)
+    ("Sdeg", float64),      # phases (degrees)
+    ("Scdeg", float64),     # continuous phases (degrees)
+    ("Mdb", float64),       # raw magnitudes (dB)
+    ("Mdeg", float64),      # raw phases (degrees)
+    ("magdata", uint16),    # magnitude data from ADC
+    ("phasedata", uint16),  # phase data from ADC
+    ("Tread", float32),     # times when captured (ms from start)
+)
+# display-only columns, stored as float32 in a compact Spectrum
+compactColumns = ("Mdb", "Mdeg")
+
+def _SpectrumDtype(compact):
+    return [(name, (dtype, float32)[compact and name in compactColumns])
+            for name, dtype in spectrumColumns]
+# steps of capacity added at a time when a Spectrum grows
+spectrumChunk = 4096
+
+# A Spectrum attribute that is a view of one column of its storage, covering
+# its steps. Assigning to it copies into the column.
+
+def _ColumnProperty(name):
+    def get(self):
+        return self._data[name][:self._n]
+    def set(self, value):
+        self._data[name][:self._n] = value
+        self.Invalidate(0, self._n)
+    return property(get, set)
+
 #==============================================================================
 # Holder of the parameters and results of one scan.
+#
+# The per-step results are kept in one structured array, a row per step,
+# whose columns are seen as the arrays Sdb, Sdeg, etc.
 
-class Spectrum:
-    def __init__(self, when, pathNo, fStart, fStop, nSteps, Fmhz):
+class Spectrum(object):
+    def __init__(self, when, pathNo, fStart, fStop, nSteps, Fmhz,
+                 compact=False):
         self.isLogF = (Fmhz[0] + Fmhz[2])/2 != Fmhz[1]
         self.desc = "%s, Path %d, %d %s steps, %g to %g MHz." % \
             (when, pathNo, nSteps, ("linear", "log")[self.isLogF], \
@@ -19,37 +57,109 @@ class Spectrum:
         self.Fmhz = Fmhz            # array of frequencies (MHz), one per step
         n = nSteps + 1
         self.oslCal = False        # EON Jan 10 2014
-        self.Sdb = zeros(n)         # array of corresponding magnitudes (dB)
-        self.Sdeg = zeros(n)        # phases (degrees)
-        self.Scdeg = zeros(n)       # continuous phases (degrees)
-        self.Mdb = zeros(n)         # raw magnitudes (dB)
-        self.Mdeg = zeros(n)        # raw phases (degrees)
-        self.magdata = zeros(n)     # magnitude data from ADC
-        self.phasedata = zeros(n)   # phase data from ADC
-        self.Tread = zeros(n)       # times when captured (ms from start)
+        self._n = n
+        self._data = zeros(n, dtype=_SpectrumDtype(compact))
         self.step = 0               # current step number
         self.vaType = None
         self.trva = None
         self.vbType = None
         self.trvb = None
         self.maxStep = 0
+        self._gen = 0               # data generation, for _interpCache
+        self._interpCache = {}
+        self.derived = {}           # caches of derived data, by name
         LogGUIEvent("Spectrum n=%d" % n)
 
+    Sdb = _ColumnProperty("Sdb")
+    Sdeg = _ColumnProperty("Sdeg")
+    Scdeg = _ColumnProperty("Scdeg")
+    Mdb = _ColumnProperty("Mdb")
+    Mdeg = _ColumnProperty("Mdeg")
+    magdata = _ColumnProperty("magdata")
+    phasedata = _ColumnProperty("phasedata")
+    Tread = _ColumnProperty("Tread")
+
+    #--------------------------------------------------------------------------
+    # Change the number of steps to nSteps, with frequencies Fmhz, keeping the
+    # data of existing steps. Capacity grows a chunk at a time, so this is
+    # cheap for open-ended captures. Views of the columns taken before
+    # growing no longer follow the spectrum.
+
+    def Resize(self, nSteps, Fmhz):
+        n = nSteps + 1
+        if n > len(self._data):
+            capacity = -(-n // spectrumChunk) * spectrumChunk
+            data = zeros(capacity, dtype=self._data.dtype)
+            m = min(self._n, n)
+            data[:m] = self._data[:m]
+            self._data = data
+        elif n > self._n:
+            self._data[self._n:n] = 0
+        self._n = n
+        self.nSteps = nSteps
+        self.Fmhz = Fmhz
+        self.maxStep = min(self.maxStep, nSteps)
+        self._gen += 1
+        self._interpCache = {}
+        self.derived = {}
+
+    #--------------------------------------------------------------------------
+    # A copy of the spectrum's data without its traces, as kept by a
+    # reference. Frequencies are shared, as they are never changed in place.
+    # A compact copy, for display only, keeps the display-only columns as
+    # float32.
+
+    def Copy(self, compact=False):
+        this = dcopy.copy(self)
+        if compact:
+            this._data = self._data[:self._n].astype(_SpectrumDtype(True))
+        else:
+            this._data = self._data[:self._n].copy()
+        this.vaType = this.trva = None
+        this.vbType = this.trvb = None
+        this._interpCache = {}
+        this.derived = {}
+        return this
+
+    # Copy the data of the given steps (an index array or slice) from
+    # spectrum src. Derived caches aren't told; the caller must.
+
+    def CopySteps(self, src, steps):
+        self._data[steps] = src._data[steps]
+        self._gen += 1
+
+    #--------------------------------------------------------------------------
+    # Derived data caches (such as trace.S11Data) compute quantities from
+    # the spectrum's data as needed. Invalidate marks steps lo to hi-1 as
+    # changed in each; UpdateDerived brings them all up to date. A cache
+    # that must see every value stored (such as a detector) has a SetStep
+    # method, called in place of Invalidate as each step is set. Either way
+    # the data generation moves on.
+
+    def Invalidate(self, lo, hi):
+        self._gen += 1
+        for cache in self.derived.values():
+            cache.Invalidate(lo, hi)
+
+    def UpdateDerived(self):
+        for cache in self.derived.values():
+            cache.Update()
+
     # Set values on step i in the spectrum. Returns True if last step.
 
     def SetStep(self, valueSet):
         i, Sdb, Sdeg, Scdeg, magdata, phasedata, Mdb, Mdeg, Tread = valueSet
         if i <= self.nSteps:
             self.step = i
-            LogGUIEvent("SetStep %d, len(Sdb)=%d" % (i, len(self.Sdb)))
-            self.Sdb[i] = Sdb
-            self.Sdeg[i] = Sdeg
-            self.Scdeg[i] = Scdeg
-            self.Mdb[i] = Mdb
-            self.Mdeg[i] = Mdeg
-            self.magdata[i] = magdata
-            self.phasedata[i] = phasedata
-            self.Tread[i] = Tread
+            LogGUIEvent("SetStep %d, len(Sdb)=%d" % (i, self._n))
+            self._data[i] = (Sdb, Sdeg, Scdeg, Mdb, Mdeg, _ADC(magdata),
+                             _ADC(phasedata), Tread)
+            self._gen += 1
+            for cache in self.derived.values():
+                if hasattr(cache, "SetStep"):
+                    cache.SetStep(self, i)
+                else:
+                    cache.Invalidate(i, i + 1)
             if self.trva:
                 self.trva.SetStep(self, i)
             if self.trvb:
@@ -60,7 +170,27 @@ class Spectrum:
 
     # Spectrum[i] returns the tuple (Fmhz, Sdb, Sdeg) for step i
     def __getitem__(self, i):
-        return self.Fmhz[i], self.Sdb[i], self.Sdeg[i]
+        j = (i, i + self._n)[i < 0]
+        if j < 0 or j >= self._n:
+            raise IndexError("step %d not in spectrum" % i)
+        row = self._data[j]
+        return self.Fmhz[j], row["Sdb"], row["Sdeg"]
+
+    # Used as a line calibration that doesn't match the sweep: Sdb and Scdeg
+    # interpolated onto frequencies fMhz. Results are cached by data
+    # generation and target grid, so they can be prepared in another thread.
+
+    def InterpolatedCal(self, fMhz):
+        fMhz = array(fMhz, dtype=float)
+        key = (self._gen, fMhz.tostring())
+        cal = self._interpCache.get(key)
+        if cal == None:
+            cal = (interp(fMhz, self.Fmhz, self.Sdb),
+                   interp(fMhz, self.Fmhz, self.Scdeg))
+            if len(self._interpCache) >= 16:
+                self._interpCache.clear()
+            self._interpCache[key] = cal
+        return cal
 
     #--------------------------------------------------------------------------
     # Write spectrum and input data to a text file.
@@ -82,82 +212,54 @@ class Spectrum:
     # Write spectrum to an S1P-format file.
 
     def WriteS1P(self, fileName, p, contPhase=False):
-        f = open(fileName, "w")
-        f.write("!MSA, msapy %s\n" % GetVersion)
-        f.write("!Date: %s\n" % time.ctime())
-        f.write("!%s Sweep Path %d\n" % \
-            (("Linear", "Log")[p.isLogF], p.RBWSelindex+1))
-        f.write("# MHz S DB R 50\n")
-        f.write("!  MHz       S21_dB    S21_Deg\n")
+        self.ToTouchstone(p, contPhase).Write(fileName,
+                                labels="  MHz       S21_dB    S21_Deg")
+
+    # The spectrum as a one-port Touchstone, with comments describing the
+    # sweep settings p.
+
+    def ToTouchstone(self, p, contPhase=False):
         Sdeg = self.Sdeg
         if contPhase:
             Sdeg = self.Scdeg
         Sdeg = select([isnan(Sdeg)], [0], default=Sdeg)
-        for freq, Sdb, Sdeg in zip(self.Fmhz, self.Sdb, Sdeg):
-            f.write("%11.6f %10.5f %7.2f\n" % \
-                    (freq, Sdb, Sdeg))
-        f.close()
+        comments = ["MSA, msapy %s" % GetVersion,
+                    "Date: %s" % time.ctime(),
+                    "%s Sweep Path %d" % \
+                        (("Linear", "Log")[p.isLogF], p.RBWSelindex+1)]
+        return Touchstone.FromParams(self.Fmhz, [(self.Sdb, Sdeg)], "DB",
+                                     comments=comments)
 
     #--------------------------------------------------------------------------
-    # Read spectrum from an S1P file. Constructs the Spectrum too.
+    # Read spectrum from an S1P file. Constructs the Spectrum too. Returns
+    # None if the file isn't a one-port Touchstone file.
 
     @classmethod
     def FromS1PFile(cls, fileName):
-        fScale = 1.
-        R0 = 50
-        Fmhz = []
-        Sdb = []
-        Sdeg = []
-        when = "**UNKNOWN DATE**"
-        pathNo = 1
-        f = open(fileName, "r")
-
-        for line in f.readlines():
-            line = line.strip()
-            if len(line) > 1:
-                if line[0] == "!":
-                    if line[1:6] == "Date:":
-                        when = line[6:].strip()
-                elif line[0] == "#":
-                    words = string.split(line[1:])
-                    i = 0
-                    while i < len(words):
-                        word = words[i]
-                        i += 1
-                        if len(word) > 1 and word[-2:] == "Hz":
-                            fScale = siScale(word[:-2]) / MHz
-                        elif word == "S":
-                            sType = words[i]
-                            if sType != "DB":
-                                raise ValueError( \
-                                    "Unsupported S type '%s' % sType")
-                            i += 1
-                        elif word == "R":
-                            R0 = words[i]
-                            i += 1
-                        else:
-                            raise KeyError("Unrecognized S1P keyword '%s'" \
-                                            % word)
-                else:
-                    words = string.split(line)
-                    if len(words) != 3:
-                        f.close()
-                        return None
-                        #raise ValueError( \
-                        #    "S1P file format wrong: expected freq, Sdb, Sdeg")
-                    Fmhz.append(float(words[0]) * fScale)
-                    Sdb.append(float(words[1]))
-                    Sdeg.append(float(words[2]))
-        f.close()
-
-        n = len(Fmhz)
-        if n == 0:
+        try:
+            ts = Touchstone.Read(fileName, nPorts=1)
+        except ValueError:
             return None
-            #raise ValueError("S1P file: no data found")
+        return cls.FromTouchstone(ts)
+
+    # Construct a Spectrum from Touchstone data: S11 of a one-port file or
+    # S21 of a two-port one.
 
-        print ("Read %d steps." % (n-1), "Start=", Fmhz[0], "Stop=", Fmhz[-1])
-        this = cls(when, pathNo, Fmhz[0], Fmhz[-1], n - 1, array(Fmhz))
-        this.Sdb = array(Sdb)
-        this.Sdeg = array(Sdeg)
+    @classmethod
+    def FromTouchstone(cls, ts):
+        n = len(ts.Fmhz)
+        when = ts.Comment("Date:") or "**UNKNOWN DATE**"
+        pathNo = 1
+        print ("Read %d steps." % (n-1), "Start=", ts.Fmhz[0], "Stop=", ts.Fmhz[-1])
+        this = cls(when, pathNo, ts.Fmhz[0], ts.Fmhz[-1], n - 1, ts.Fmhz)
+        if ts.nPorts == 1:
+            this.Sdb, this.Sdeg = ts.DbDeg(1, 1)
+        else:
+            this.Sdb, this.Sdeg = ts.DbDeg(2, 1)
         this.Scdeg = this.Sdeg
         return this
+
+# An ADC reading as a 16-bit count.
+
+def _ADC(value):
+    return min(max(int(round(value)), 0), 0xffff)
@@ -177,3 +177,4 @@ def SetStepAttenuator(value):
     msa._SetFreqBand(band, cb.P4_AttenLE)
     msa._SetFreqBand(band)
     cb.msWait(100)
+    msa.InvalidateHardwareState()
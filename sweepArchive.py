@@ -0,0 +1,152 @@
+from msaGlobal import SetModuleVersion
+import json, os, struct, time
+from numpy import array, dtype, fromfile, memmap, searchsorted
+
+SetModuleVersion("sweepArchive",("1.30","EON","05/20/2014"))
+
+#==============================================================================
+# Append-only archive of completed sweeps, for long-running monitoring.
+#
+# An archive file is a header, like a calibration file's, followed by the
+# sweep's step frequencies and then one fixed-size record per sweep:
+#
+#   "MSASWP\r\n", format version and header length (two little-endian
+#   uint32s), a JSON header giving the step count and any metadata,
+#   padding to a 64-byte boundary, the frequencies (float64 MHz), then for
+#   each sweep its completion time (float64 seconds since the epoch) and
+#   its magnitudes (dB) and phases (degrees) as float32s.
+#
+# Records are written as sweeps complete and read back through a memory
+# map, so memory use doesn't grow with the number of sweeps archived. All
+# sweeps of an archive share its frequencies.
+
+archiveMagic = "MSASWP\r\n"
+archiveFormatVersion = 1
+archiveExt = ".msh"
+archiveAlign = 64
+
+class SweepArchive:
+    # Open archive fileName, creating it for sweeps at frequencies Fmhz if
+    # it doesn't exist. An existing archive is appended to.
+
+    def __init__(self, fileName, Fmhz=None, meta={}):
+        self.fileName = fileName
+        if os.path.exists(fileName) and os.path.getsize(fileName) > 0:
+            self._ReadHeader()
+            if Fmhz is not None and not self.Matches(Fmhz):
+                raise ValueError("%s holds sweeps of other frequencies" % \
+                                 fileName)
+        elif Fmhz is not None:
+            self._Create(Fmhz, meta)
+        else:
+            raise ValueError("%s: no archive" % fileName)
+        self._file = None
+        self._map = None
+
+    def _Create(self, Fmhz, meta):
+        Fmhz = array(Fmhz, dtype="<f8")
+        header = json.dumps({"steps": len(Fmhz), "meta": meta},
+                            default=float)
+        start = len(archiveMagic) + 8 + len(header)
+        pad = -start % archiveAlign
+        f = open(self.fileName, "wb")
+        f.write(archiveMagic)
+        f.write(struct.pack("<II", archiveFormatVersion, len(header) + pad))
+        f.write(header + " " * pad)
+        Fmhz.tofile(f)
+        f.close()
+        self._SetLayout(len(Fmhz), start + pad, meta)
+        self.Fmhz = Fmhz
+
+    def _ReadHeader(self):
+        f = open(self.fileName, "rb")
+        try:
+            if f.read(len(archiveMagic)) != archiveMagic:
+                raise ValueError("%s is not a sweep archive" % self.fileName)
+            version, headerLen = struct.unpack("<II", f.read(8))
+            if version > archiveFormatVersion:
+                raise ValueError("%s: unsupported archive format %d" % \
+                                 (self.fileName, version))
+            header = json.loads(f.read(headerLen))
+            n = header["steps"]
+            self.Fmhz = fromfile(f, dtype="<f8", count=n)
+        finally:
+            f.close()
+        self._SetLayout(n, len(archiveMagic) + 8 + headerLen,
+                        header["meta"])
+
+    def _SetLayout(self, n, offset, meta):
+        self.nSteps = n - 1
+        self.meta = meta
+        self.recordType = dtype([("time", "<f8"), ("Sdb", "<f4", (n,)),
+                                 ("Sdeg", "<f4", (n,))])
+        self._recordsStart = offset + 8 * n
+
+    #--------------------------------------------------------------------------
+    # True if sweeps at frequencies Fmhz can be added to the archive.
+
+    def Matches(self, Fmhz):
+        return len(Fmhz) == len(self.Fmhz) and \
+            abs(array(Fmhz) - self.Fmhz).max() < 1e-9
+
+    # Add a sweep, given its magnitudes and phases (or a Spectrum), taken at
+    # time when (now if not given). A partial record left by an interrupted
+    # write is dropped first.
+
+    def Append(self, Sdb, Sdeg=None, when=None):
+        if Sdeg is None:
+            Sdb, Sdeg = Sdb.Sdb, Sdb.Sdeg
+        rec = array([(when or time.time(), Sdb, Sdeg)], dtype=self.recordType)
+        if self._file == None:
+            self._map = None
+            self._file = open(self.fileName, "r+b")
+            self._file.truncate(self._recordsStart +
+                                len(self) * self.recordType.itemsize)
+            self._file.seek(0, 2)
+        self._file.write(rec.tostring())
+        self._file.flush()
+
+    def Close(self):
+        if self._file != None:
+            self._file.close()
+            self._file = None
+        self._map = None
+
+    #--------------------------------------------------------------------------
+    # Reading back. Records are returned as views into the memory-mapped
+    # file; copy them to keep them.
+
+    def __len__(self):
+        size = os.path.getsize(self.fileName) - self._recordsStart
+        return max(size, 0) // self.recordType.itemsize
+
+    def Records(self):
+        n = len(self)
+        if self._map is None or len(self._map) != n:
+            self._map = None
+            if n == 0:
+                return array([], dtype=self.recordType)
+            self._map = memmap(self.fileName, dtype=self.recordType,
+                               mode="r", offset=self._recordsStart,
+                               shape=(n,))
+        return self._map
+
+    # Sweep i as (time, Sdb, Sdeg).
+
+    def Sweep(self, i):
+        rec = self.Records()[i]
+        return rec["time"], rec["Sdb"], rec["Sdeg"]
+
+    def Times(self):
+        return self.Records()["time"]
+
+    # Index of the last sweep completed at or before time when, or -1.
+
+    def IndexAt(self, when):
+        return searchsorted(self.Times(), when, side="right") - 1
+
+    # The last sweep completed at or before time when (or the first sweep),
+    # as for Sweep.
+
+    def SweepAt(self, when):
+        return self.Sweep(max(self.IndexAt(when), 0))
@@ -1,11 +1,12 @@
 from msaGlobal import GetHardwarePresent, GetMsa, isMac, SetHardwarePresent, \
     SetModuleVersion
 import wx
-from numpy import angle, arange, cos, exp, \
+from numpy import angle, arange, cos, exp, inf, \
     interp, log10, logspace, linspace, \
     pi, poly1d, sin, random, sqrt, zeros, zeros_like
 from numpy.fft import fft
 from msa import MSA
+from rlcModel import RLCModel
 from util import db, floatOrEmpty, floatSI, EquivS11FromS21, \
     modDegree, si, SI_ASCII, fF, kHz, GHz, mH, MHz, Ohms, pF, pH
 
@@ -301,8 +302,11 @@ class SynDUTDialog(wx.Dialog):
                 isSerLs  = self.isSerLs = int(floatSI(self.isSerLs))
                 isSerLsh = self.isSerLsh = int(floatSI(self.isSerLsh))
 
-                Zs =  par3(Rs,  1j*w*Ls,  -1j/(w*Cs),  isSerLs)
-                Zsh = par3(Rsh, 1j*w*Lsh, -1j/(w*Csh), isSerLsh)
+                # lossless components: infinite QL and QC
+                Zs = RLCModel("PS"[bool(isSerLs)], Rs, Ls, Cs, inf, inf). \
+                        Impedance(f*MHz)
+                Zsh = RLCModel("PS"[bool(isSerLsh)], Rsh, Lsh, Csh, inf, inf). \
+                        Impedance(f*MHz)
 
                 print ("RLC: Rs=", Rs, "Ls=", Ls, "Cs=", Cs, "ser=", isSerLs, \
                     "Rsh=", Rsh, "Lsh=", Lsh, "Csh=", Csh, "ser=", isSerLsh)
@@ -398,15 +402,10 @@ class SynDUTDialog(wx.Dialog):
         self.synSpecP = self.AdjustPhase(self.synSpecM, synSpecP) / 360.0 * \
                     65536.0
 
-# Conditionally form a parallel circuit with elements in list.
+# Conditionally form a parallel circuit of a and b.
 
 def par2(a, b, isSeries=False):
     if isSeries:
         return a + b
     return (a*b) / (a+b)
 
-def par3(a, b, c, isSeries=False):
-    if isSeries:
-        return a + b + c
-    return (a*b*c) / (b*c + a*c + a*b)
-
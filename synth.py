@@ -0,0 +1,162 @@
+from msaGlobal import SetModuleVersion
+from numpy import asarray, errstate, floor, floor_divide, int64, \
+    logical_or, nonzero, where, zeros
+
+SetModuleVersion("synth",("1.30","EON","05/20/2014"))
+
+#==============================================================================
+# Array versions of the MSA_LO PLL and DDS calculations.
+#
+# Each function takes arrays of frequencies (or N counter values) and returns
+# arrays of the same length, one element per sweep step, matching what the
+# scalar MSA_LO.Calculate, CreatePLLN and CreateDDS would compute one step at
+# a time, including their integer rounding. Nothing here touches the
+# hardware or an MSA_LO's attributes.
+
+# Round half away from zero to an int64 array, as Python's round() does.
+
+def RoundInt(x):
+    x = asarray(x, dtype=float)
+    ax = abs(x)
+    r = floor(ax)
+    r += (ax - r) >= 0.5
+    return where(x < 0, -r, r).astype(int64)
+
+# Array divSafe(): a/b, or a where b is zero.
+
+def DivSafe(a, b):
+    a = asarray(a, dtype=float)
+    b = asarray(b, dtype=float)
+    with errstate(divide="ignore", invalid="ignore"):
+        return where(b != 0, a / where(b != 0, b, 1), a)
+
+#------------------------------------------------------------------------------
+# Per-step values of one LO over a sweep, named as the MSA_LO attributes.
+
+class LOSteps:
+    def __init__(self, n):
+        self.ncounter = zeros(n, int64)
+        self.Acounter = zeros(n, int64)
+        self.Bcounter = zeros(n, int64)
+        self.PLLbits = zeros(n, int64)
+        self.DDSbits = zeros(n, int64)
+        self.ddsoutput = zeros(n)
+        self.pdf = zeros(n)
+        self.freq = zeros(n)
+
+    def __len__(self):
+        return len(self.freq)
+
+    # Copy the values for step i into an MSA_LO's attributes.
+
+    def LoadStep(self, lo, i):
+        lo.ncounter = int(self.ncounter[i])
+        lo.Acounter = int(self.Acounter[i])
+        lo.Bcounter = int(self.Bcounter[i])
+        lo.PLLbits = int(self.PLLbits[i])
+        lo.DDSbits = int(self.DDSbits[i])
+        lo.ddsoutput = float(self.ddsoutput[i])
+        lo.pdf = float(self.pdf[i])
+        lo.freq = float(self.freq[i])
+
+#------------------------------------------------------------------------------
+# DDS tuning words and actual output frequencies for wanted outputs ddsout.
+# Returns (DDSbits, ddsoutput).
+
+def DDSWords(ddsout, ddsclock):
+    base = RoundInt(DivSafe(asarray(ddsout, dtype=float) * (1<<32), ddsclock))
+    return base, ddsclock * base / 2.**32
+
+#------------------------------------------------------------------------------
+# Valid B counter range and N register layout for each PLL type:
+#   (min B, max B, min B-A, Nreg constant, B shift, A shift, max-B message)
+
+PLLNFormats = {
+    "2325": (3, 2047, 0, 0, 8, 1, "Bcounter > 2047"),
+    "2326": (3, 8191, 0, 1 + (1 << 20), 7, 2, "Bcounter >8191"),
+    "4118": (3, 8191, 0, 1 + (1 << 20), 7, 2, "Bcounter >8191"),
+    "2350": (3, 1023, 2, 3 + (1 << 21), 11, 6, "Bcounter > 2047"),
+    "2353": (3, 1023, 2, 3 + (1 << 21), 11, 6, "Bcounter > 2047"),
+    "4112": (3, 8191, 0, 1, 8, 2, "Bcounter > 2047"),
+    "4113": (3, 8191, 0, 1, 8, 2, "Bcounter > 2047"),
+}
+
+#------------------------------------------------------------------------------
+# PLL N registers for N counter values ncounter.
+# Returns (PLLbits, Acounter, Bcounter), or raises RuntimeError for the first
+# step whose counters the PLL can't take.
+
+def PLLNRegisters(ncounter, PLLtype, preselector=32):
+    ncounter = asarray(ncounter).astype(int64)
+    Bcounter = floor_divide(ncounter, preselector)
+    Acounter = ncounter - Bcounter*preselector
+    fmt = PLLNFormats.get(PLLtype)
+    if not fmt:
+        # unknown types leave no N register, as in MSA_LO.CreatePLLN
+        return zeros(len(ncounter), int64), Acounter, Bcounter
+    minB, maxB, minBA, const, shiftB, shiftA, maxMsg = fmt
+    checks = ((Bcounter < minB, "Bcounter <3"),
+              (Bcounter > maxB, maxMsg),
+              (Bcounter < Acounter + minBA, "Bcounter < Acounter"))
+    bad = logical_or.reduce([c for c, msg in checks])
+    if bad.any():
+        i = nonzero(bad)[0][0]
+        msg = [msg for c, msg in checks if c[i]][0]
+        raise RuntimeError(PLLtype + msg + " at step %d" % i)
+    Nreg = const + (Bcounter << shiftB) + (Acounter << shiftA)
+    return Nreg, Acounter, Bcounter
+
+#------------------------------------------------------------------------------
+# Full PLL and DDS settings of an LO for wanted VCO frequencies, the array
+# version of MSA_LO.Calculate. Returns an LOSteps.
+
+def CalculateLO(wantedVCOfreq, appxdds, rcounter, ddsfilbw, ddsclock,
+                PLLtype, preselector=32, loid=0):
+    wanted = asarray(wantedVCOfreq, dtype=float)
+    steps = LOSteps(len(wanted))
+    steps.ncounter = ncounter = RoundInt(DivSafe(wanted,
+                                        DivSafe(appxdds, rcounter)))
+    temppdf = DivSafe(wanted, ncounter)
+    steps.PLLbits, steps.Acounter, steps.Bcounter = \
+        PLLNRegisters(ncounter, PLLtype, preselector)
+    steps.DDSbits, steps.ddsoutput = DDSWords(temppdf*rcounter, ddsclock)
+    steps.pdf = steps.ddsoutput/rcounter
+    outside = abs(steps.ddsoutput - appxdds) > ddsfilbw/2.
+    if outside.any():
+        i = nonzero(outside)[0][0]
+        raise RuntimeError("DDS%doutput outside filter range: output=%g "\
+                           "pdf=%g" % (loid, steps.ddsoutput[i], steps.pdf[i]))
+    steps.freq = steps.pdf * ncounter
+    return steps
+
+#------------------------------------------------------------------------------
+# Settings of an LO whose DDS output is swept directly (DDS1 sweep, DDS3
+# track), the array version of MSA_LO.CreateDDS. The PLL values are those
+# the LO already holds, as CreateDDS leaves them unchanged.
+
+def CalculateDDSOnly(ddsout, ddsclock, lo):
+    steps = LOSteps(len(ddsout))
+    steps.DDSbits, steps.ddsoutput = DDSWords(ddsout, ddsclock)
+    steps.ncounter += int(lo.ncounter)
+    steps.Acounter += int(lo.Acounter)
+    steps.Bcounter += int(lo.Bcounter)
+    steps.PLLbits += int(lo.PLLbits)
+    steps.pdf += getattr(lo, "pdf", 0.)
+    steps.freq += lo.freq
+    return steps
+
+#------------------------------------------------------------------------------
+# LO2 during the cavity filter test, where its N counter follows the wanted
+# frequency with the R counter fixed. Returns an LOSteps.
+
+def CalculateLO2(wantedfreq, masterclock, rcounter, pdf, PLLtype,
+                 preselector=32):
+    wanted = asarray(wantedfreq, dtype=float)
+    steps = LOSteps(len(wanted))
+    steps.ncounter = ncounter = RoundInt(DivSafe(wanted,
+                                        DivSafe(masterclock, rcounter)))
+    steps.PLLbits, steps.Acounter, steps.Bcounter = \
+        PLLNRegisters(ncounter, PLLtype, preselector)
+    steps.pdf += pdf
+    steps.freq = ((steps.Bcounter*preselector) + steps.Acounter) * pdf
+    return steps
@@ -1,6 +1,7 @@
 from msaGlobal import appdir, GetMsa, SetModuleVersion
 import os,wx
 from util import gstr, Prefs
+from calStore import calExt
 
 SetModuleVersion("testSetups",("1.30","EON","05/20/2014"))
 
@@ -154,7 +155,7 @@ class TestSetupsDialog(wx.Dialog):
         name = self.nameBox.GetValue()
         self.setupNames[i] = name
         setup.save(self.SetupFileName(), header=name)
-        ident = "%02d.s1p" % (self.setupSel+1)
+        ident = "%02d%s" % (self.setupSel+1, calExt)
         msa = GetMsa()
         frame.SaveCal(msa.bandCal, frame.bandCalFileName[:-4] + ident)
         frame.SaveCal(msa.baseCal, frame.baseCalFileName[:-4] + ident)
@@ -182,7 +183,7 @@ class TestSetupsDialog(wx.Dialog):
 
     def OnLoadWithCal(self, event):
         frame = self.frame
-        ident = "%02d.s1p" % (self.setupSel+1)
+        ident = "%02d%s" % (self.setupSel+1, calExt)
         msa = GetMsa()
         msa.bandCal = frame.LoadCal(frame.bandCalFileName[:-4] + ident)
         msa.baseCal = frame.LoadCal(frame.baseCalFileName[:-4] + ident)
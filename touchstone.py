@@ -0,0 +1,233 @@
+from msaGlobal import SetModuleVersion
+import os, re
+from numpy import angle, array, asarray, column_stack, cos, errstate, \
+    float64, fromstring, log10, pi, sin, sqrt
+
+SetModuleVersion("touchstone",("1.30","EON","05/20/2014"))
+
+#==============================================================================
+# Touchstone (.s1p, .s2p, ... .snp) network parameter files.
+#
+# A file holds option ("#") and comment ("!") lines and, for each
+# frequency, the frequency and a pair of values per S parameter, in DB
+# (dB, degrees), MA (magnitude, degrees) or RI (real, imaginary) format.
+# Two-port files list S11, S21, S12, S22; others list the parameters row by
+# row, wrapping lines after four pairs.
+#
+# The numeric data is parsed as one block rather than line by line, and
+# writing is done a block of steps at a time, so that very long sweeps can
+# be read and written quickly.
+
+# frequency units and their scales (in MHz)
+tsUnits = {"HZ": 1e-6, "KHZ": 1e-3, "MHZ": 1., "GHZ": 1e3}
+tsUnitNames = {"HZ": "Hz", "KHZ": "kHz", "MHZ": "MHz", "GHZ": "GHz"}
+tsFormats = ("DB", "MA", "RI")
+# output formats of the frequency and of each value pair
+tsFreqFormats = {"HZ": "%.3f", "KHZ": "%.6f", "MHZ": "%11.6f", "GHZ": "%.9f"}
+tsPairFormats = {"DB": " %10.5f %7.2f", "MA": " %12.9f %7.2f",
+                 "RI": " %15.8e %15.8e"}
+# steps written at a time
+tsWriteBlock = 65536
+
+# leading comment, option and blank lines
+_headerPat = re.compile(r"(?:[ \t]*(?:[!#].*)?\r?\n)*")
+
+class Touchstone:
+    def __init__(self, Fmhz, data, nPorts=1, fmt="DB", R0=50.,
+                 comments=None):
+        self.Fmhz = asarray(Fmhz, dtype=float64)   # frequencies (MHz)
+        self.data = asarray(data, dtype=float64)   # value pairs, row per step
+        self.nPorts = nPorts
+        self.fmt = fmt.upper()
+        self.R0 = R0
+        self.comments = comments or []  # comment lines, without the "!"
+
+    #--------------------------------------------------------------------------
+    # Index of parameter Sij's pair in each row (i, j counted from 1).
+
+    def ParamIndex(self, i, j):
+        n = self.nPorts
+        if i < 1 or j < 1 or i > n or j > n:
+            raise ValueError("S%d%d not in a %d-port file" % (i, j, n))
+        if n == 2:
+            return (j - 1) * 2 + i - 1
+        return (i - 1) * n + j - 1
+
+    # Parameter Sij as arrays of (dB, degrees), (magnitude, degrees) or
+    # complex values. Phases in the file's own format are returned as read,
+    # so continuous phase is kept.
+
+    def DbDeg(self, i, j):
+        a, b = self._Pair(i, j)
+        if self.fmt == "DB":
+            return a, b
+        if self.fmt == "MA":
+            with errstate(divide="ignore"):
+                return 20 * log10(a), b
+        S = a + 1j * b
+        with errstate(divide="ignore"):
+            return 20 * log10(abs(S)), angle(S, deg=True)
+
+    def MagDeg(self, i, j):
+        a, b = self._Pair(i, j)
+        if self.fmt == "MA":
+            return a, b
+        if self.fmt == "DB":
+            return 10 ** (a / 20), b
+        S = a + 1j * b
+        return abs(S), angle(S, deg=True)
+
+    def Complex(self, i, j):
+        a, b = self._Pair(i, j)
+        if self.fmt == "RI":
+            return a + 1j * b
+        if self.fmt == "DB":
+            a = 10 ** (a / 20)
+        return a * (cos(b * pi / 180) + 1j * sin(b * pi / 180))
+
+    def _Pair(self, i, j):
+        k = 1 + 2 * self.ParamIndex(i, j)
+        return self.data[:,k], self.data[:,k+1]
+
+    # The first comment starting with key (e.g. "Date:"), with the key
+    # removed, or None.
+
+    def Comment(self, key):
+        for line in self.comments:
+            line = line.strip()
+            if line.startswith(key):
+                return line[len(key):].strip()
+        return None
+
+    #--------------------------------------------------------------------------
+    # Read a Touchstone file. The port count comes from the file's .snp
+    # extension, or failing that from the first data line. Option lines
+    # not given default to the Touchstone ones (GHz S MA R 50). Raises
+    # ValueError if the file isn't a readable S-parameter file.
+
+    @classmethod
+    def Read(cls, fileName, nPorts=None):
+        f = open(fileName, "rU")
+        text = f.read()
+        f.close()
+
+        # header lines are handled by line; the data is parsed as a block
+        end = _headerPat.match(text).end()
+        lines = text[:end].splitlines()
+        body = text[end:]
+        if re.search(r"[!#\[]", body):
+            lines += re.findall(r"^[ \t]*[!#\[].*", body, re.M)
+            body = re.sub(r"[!#\[].*", "", body)
+        comments = []
+        options = None
+        for line in lines:
+            line = line.strip()
+            if line.startswith("!"):
+                comments.append(line[1:])
+            elif line.startswith("#") and options == None:
+                options = line[1:].split()
+            elif line.startswith("["):
+                raise ValueError("%s: Touchstone 2 keyword %s not supported" \
+                                 % (fileName, line.split("]")[0] + "]"))
+
+        scale, fmt, R0 = cls._ParseOptions(fileName, options or [])
+
+        if nPorts == None:
+            m = re.match(r"\.s(\d+)p$", os.path.splitext(fileName)[1], re.I)
+            if m:
+                nPorts = int(m.group(1))
+        first = re.search(r"\S.*", body)
+        if first == None:
+            raise ValueError("%s: no data found" % fileName)
+        nFirst = len(first.group(0).split())
+        if nPorts == None:
+            nPorts = int(round(sqrt((nFirst - 1) / 2.)))
+        nCols = 1 + 2 * nPorts**2
+        if (nPorts <= 2 and nFirst != nCols) or nFirst > min(nCols, 9):
+            raise ValueError("%s: expected %d values per step, found %d" % \
+                             (fileName, nCols, nFirst))
+
+        # parsing stops at a bad number, so check it reached the last one
+        values = fromstring(body, dtype=float64, sep=" ")
+        last = body.rsplit(None, 1)[-1]
+        try:
+            complete = len(values) > 0 and float(last) == values[-1]
+        except ValueError:
+            complete = False
+        if not complete or len(values) % nCols != 0:
+            raise ValueError("%s: bad data" % fileName)
+        data = values.reshape(-1, nCols)
+        Fmhz = data[:,0] * scale
+        return cls(Fmhz, data, nPorts, fmt, R0, comments)
+
+    @staticmethod
+    def _ParseOptions(fileName, words):
+        scale = tsUnits["GHZ"]
+        fmt = "MA"
+        R0 = 50.
+        words = [w.upper() for w in words]
+        i = 0
+        while i < len(words):
+            word = words[i]
+            i += 1
+            if word in tsUnits:
+                scale = tsUnits[word]
+            elif word in tsFormats:
+                fmt = word
+            elif word == "R" and i < len(words):
+                R0 = float(words[i])
+                i += 1
+            elif word == "S":
+                pass
+            elif word in ("Y", "Z", "H", "G"):
+                raise ValueError("%s: %s parameters not supported" % \
+                                 (fileName, word))
+            else:
+                raise ValueError("%s: unrecognized option '%s'" % \
+                                 (fileName, word))
+        return scale, fmt, R0
+
+    #--------------------------------------------------------------------------
+    # Write to a Touchstone file, with the frequencies in the given units
+    # (Hz, kHz, MHz or GHz). labels, if given, is a comment line naming the
+    # columns, written after the option line.
+
+    def Write(self, fileName, unit="MHz", labels=None):
+        unit = unit.upper()
+        n = self.nPorts
+        f = open(fileName, "w")
+        for line in self.comments:
+            f.write("!%s\n" % line)
+        f.write("# %s S %s R %g\n" % (tsUnitNames[unit], self.fmt, self.R0))
+        if labels != None:
+            f.write("!%s\n" % labels)
+        # a row's format, wrapping after four pairs beyond two ports
+        pair = tsPairFormats[self.fmt]
+        rowFmt = tsFreqFormats[unit]
+        for k in range(n**2):
+            if n > 2 and k > 0 and (k % n == 0 or k % n % 4 == 0):
+                rowFmt += "\n" + " " * 11
+            rowFmt += pair
+        rowFmt += "\n"
+        data = self.data
+        scale = tsUnits[unit]
+        for start in range(0, len(data), tsWriteBlock):
+            block = array(data[start:start+tsWriteBlock])
+            block[:,0] = self.Fmhz[start:start+tsWriteBlock] / scale
+            f.write((rowFmt * len(block)) % tuple(block.ravel()))
+        f.close()
+
+    #--------------------------------------------------------------------------
+    # Make a Touchstone from frequencies Fmhz and a list of parameters, each
+    # a pair of arrays in format fmt, in file order.
+
+    @classmethod
+    def FromParams(cls, Fmhz, params, fmt="DB", R0=50., comments=None):
+        nPorts = int(round(sqrt(len(params))))
+        if nPorts**2 != len(params):
+            raise ValueError("%d parameters don't make a network" % \
+                             len(params))
+        cols = [Fmhz]
+        for a, b in params:
+            cols += [a, b]
+        return cls(Fmhz, column_stack(cols), nPorts, fmt, R0, comments)
@@ -1,15 +1,12 @@
-from msaGlobal import incremental, SetModuleVersion
-import copy as dcopy
-from numpy import append, convolve, diff, exp, log10
+from msaGlobal import SetModuleVersion
+from numpy import append, arange, convolve, cumsum, diff, exp, log10, \
+    maximum, minimum, where
 from numpy import  nan_to_num, pi, seterr, sqrt, zeros
-from numpy import ones, vstack
-from numpy.linalg import lstsq
 from util import mW, MHz, uF, uH
 from util import truncateS11ToUnity
 from util import min2
 from util import EquivS11FromS21
 from util import angle
-from util import db
 from msa import MSA
 
 SetModuleVersion("trace",("1.30","EON","05/20/2014"))
@@ -26,6 +23,7 @@ def SetMsa(val):
 # iScale: index into specP.vScales[]
 
 class Trace:
+    gen = 0     # bumped when the values are recomputed other than by step
     def __init__(self, spec, iScale):
         self.spec = spec
         self.iScale = iScale
@@ -40,13 +38,31 @@ class Trace:
         self.magTrace = None
         self.siFlags = 0
         self.isMain = True
-        self.maxHold = False
-        self.max = False
         try:
             self.LFmhz = log10(spec.Fmhz)
         except FloatingPointError:
             self.LFmhz = spec.Fmhz
 
+    # A read-only view of spectrum column a, used in place of a copy while
+    # the trace's values are the spectrum's.
+
+    def View(self, a):
+        v = a.view()
+        v.flags.writeable = False
+        return v
+
+    # A count that changes whenever the trace's values are recomputed in
+    # place as a whole, rather than step by step as the spectrum is set.
+
+    def Generation(self):
+        return self.gen
+
+    # Update step i of trace values v from a, unless v is a view of it.
+
+    def SetVStep(self, a, i):
+        if self.v.flags.writeable:
+            self.v[i] = a[i]
+
     # Return the data index for a given frequency in MHz.
     # Optionally returns the index base frequency f0 and spacing df.
 
@@ -86,19 +102,10 @@ class NoTrace(Trace):
 class SATrace(Trace):
     def __init__(self, spec, iScale):
         Trace.__init__(self, spec, iScale)
-        self.Sdb = dcopy.copy(spec.Sdb)
+        self.Sdb = self.View(spec.Sdb)
 
     def SetStep(self, spec, i):
-        if not self.maxHold:
-            self.Sdb[i] = spec.Sdb[i]
-        else:
-            if self.max:
-                if spec.Sdb[i] > self.Sdb[i]:
-                    self.Sdb[i] = spec.Sdb[i]
-            else:
-                self.Sdb[i] = spec.Sdb[i]
-                if i == spec.nSteps:
-                    self.max = True
+        pass
 
 class MagdBmTrace(SATrace):
     desc = "Magnitude (dBm)"
@@ -108,11 +115,11 @@ class MagdBmTrace(SATrace):
     bot = -120
     def __init__(self, spec, iScale):
         SATrace.__init__(self, spec, iScale)
-        self.v = dcopy.copy(self.Sdb)
+        self.v = self.Sdb
 
     def SetStep(self, spec, i):
         SATrace.SetStep(self, spec, i)
-        self.v[i] = self.Sdb[i]
+        self.SetVStep(self.Sdb, i)
 
 class MagWattsTrace(SATrace):
     desc = "Magnitude (Watts)"
@@ -157,19 +164,10 @@ traceTypesLists[MSA.MODE_SA] = (
 class SATGTrace(Trace):
     def __init__(self, spec, iScale):
         Trace.__init__(self, spec, iScale)
-        self.Sdb = dcopy.copy(spec.Sdb)
+        self.Sdb = self.View(spec.Sdb)
 
     def SetStep(self, spec, i):
-        if not self.maxHold:
-            self.Sdb[i] = spec.Sdb[i]
-        else:
-            if self.max:
-                if spec.Sdb[i] > self.Sdb[i]:
-                    self.Sdb[i] = spec.Sdb[i]
-            else:
-                self.Sdb[i] = spec.Sdb[i]
-                if i == spec.nSteps:
-                    self.max = True
+        pass
 
 class TransdBTrace(SATGTrace):
     desc = "Transmission (dB)"
@@ -179,11 +177,11 @@ class TransdBTrace(SATGTrace):
     bot = -120
     def __init__(self, spec, iScale):
         SATGTrace.__init__(self, spec, iScale)
-        self.v = dcopy.copy(self.Sdb)
+        self.v = self.Sdb
 
     def SetStep(self, spec, i):
         SATGTrace.SetStep(self, spec, i)
-        self.v[i] = self.Sdb[i]
+        self.SetVStep(self.Sdb, i)
 
 class TransRatTrace(SATGTrace):
     desc = "Transmission (Ratio)"
@@ -226,22 +224,11 @@ traceTypesLists[MSA.MODE_SATG] = (
 class S21Trace(Trace):
     def __init__(self, spec, iScale):
         Trace.__init__(self, spec, iScale)
-        self.Sdb = dcopy.copy(spec.Sdb)
-        self.Sdeg = dcopy.copy(spec.Sdeg)
+        self.Sdb = self.View(spec.Sdb)
+        self.Sdeg = self.View(spec.Sdeg)
         self.S21 = 10**(spec.Sdb/20) + exp(1j*pi*spec.Sdeg/180)
 
     def SetStep(self, spec, i):
-        if not self.maxHold:
-            self.Sdb[i] = spec.Sdb[i]
-        else:
-            if self.max:
-                if spec.Sdb[i] > self.Sdb[i]:
-                    self.Sdb[i] = spec.Sdb[i]
-            else:
-                self.Sdb[i] = spec.Sdb[i]
-                if i == spec.nSteps:
-                    self.max = True
-        self.Sdeg[i] = spec.Sdeg[i]
         self.S21[i] = 10**(spec.Sdb[i]/20) + exp(1j*pi*spec.Sdeg[i]/180)
 
 class S21MagTrace(S21Trace):
@@ -252,11 +239,11 @@ class S21MagTrace(S21Trace):
     bot = -100
     def __init__(self, spec, iScale):
         S21Trace.__init__(self, spec, iScale)
-        self.v = dcopy.copy(self.Sdb)
+        self.v = self.Sdb
 
     def SetStep(self, spec, i):
         S21Trace.SetStep(self, spec, i)
-        self.v[i] = self.Sdb[i]
+        self.SetVStep(self.Sdb, i)
 
 class S21PhaseTrace(S21Trace):
     desc = "S21 Phase Angle"
@@ -270,7 +257,7 @@ class S21PhaseTrace(S21Trace):
 
     def SetStep(self, spec, i):
         S21Trace.SetStep(self, spec, i)
-        self.v[i] = self.Sdeg[i]
+        self.SetVStep(self.Sdeg, i)
 
 class S21ConPhaseTrace(S21Trace):
     desc = "S21 Continuous Phase"
@@ -280,11 +267,11 @@ class S21ConPhaseTrace(S21Trace):
     bot = -180
     def __init__(self, spec, iScale):
         S21Trace.__init__(self, spec, iScale)
-        self.v = dcopy.copy(spec.Scdeg)
+        self.v = self.View(spec.Scdeg)
 
     def SetStep(self, spec, i):
         S21Trace.SetStep(self, spec, i)
-        self.v[i] = spec.Scdeg[i]
+        self.SetVStep(spec.Scdeg, i)
 
 class RawPowerTrace(S21Trace):
     desc = "Raw Power (dBm)"
@@ -294,11 +281,11 @@ class RawPowerTrace(S21Trace):
     bot = -100
     def __init__(self, spec, iScale):
         S21Trace.__init__(self, spec, iScale)
-        self.v = spec.Mdb
+        self.v = self.View(spec.Mdb)
 
     def SetStep(self, spec, i):
         S21Trace.SetStep(self, spec, i)
-        self.v[i] = spec.Mdb[i]
+        self.SetVStep(spec.Mdb, i)
 
 class RawPhaseTrace(S21Trace):
     desc = "Raw Phase Angle"
@@ -308,11 +295,11 @@ class RawPhaseTrace(S21Trace):
     bot = -180
     def __init__(self, spec, iScale):
         S21Trace.__init__(self, spec, iScale)
-        self.v = spec.Mdeg
+        self.v = self.View(spec.Mdeg)
 
     def SetStep(self, spec, i):
         S21Trace.SetStep(self, spec, i)
-        self.v[i] = spec.Mdeg[i]
+        self.SetVStep(spec.Mdeg, i)
 
 class InsLossTrace1(S21Trace):
     desc = "Insertion Loss (dB)"
@@ -333,58 +320,67 @@ class GroupDelayTrace(S21Trace):
     units = "sec"
     top = 0
     bot = 0
-    def __init__(self, spec, iScale, nPoints=0):
+    def __init__(self, spec, iScale, nPoints=2):
         S21Trace.__init__(self, spec, iScale)
-        self.v = v = zeros(spec.nSteps + 1)
-        if nPoints:
-            self.calcGd(nPoints)
-            return
+        self.v = zeros(spec.nSteps + 1)
+        self.calcGd(nPoints)
 
-        Scdeg = spec.Scdeg
-        Fmhz = spec.Fmhz
-        lastY = Scdeg[0]
-        lastX = Fmhz[0]
-        for i in range(1, spec.maxStep):
-            val = Scdeg[i]
-            deltaY = val - lastY
-            if deltaY > 0.5:
-                deltaY -= 1 
-            elif deltaY < -0.5:
-                deltaY += 1
-            lastY = val
-            val = Fmhz[i]
-            deltaF = val - lastX
-            lastX = val
-            v[i] = -deltaY / (deltaF * 360000000.0)
+    # Update the delays whose slope windows include step i.
 
     def SetStep(self, spec, i):
         S21Trace.SetStep(self, spec, i)
-        Scdeg = spec.Scdeg
-        Fmhz = spec.Fmhz
-        if i > 0:
-            deltaY = Scdeg[i] - Scdeg[i - 1]
-            if deltaY > 0.5:
-                deltaY -= 1 
-            elif deltaY < -0.5:
-                deltaY += 1
-            deltaF = Fmhz[i] - Fmhz[i - 1]
-            self.v[i] = -deltaY / (deltaF * 360000000.0)
+        n = max(spec.maxStep, i) + 1
+        lo = max(0, i - self.nPoints)
+        hi = min(n, i + self.nPoints + 1)
+        self.v[lo:hi] = GroupDelay(spec.Fmhz, spec.Scdeg, self.nPoints, n,
+                                   lo, hi)
 
     def calcGd(self, nPoints):
         spec = self.spec
-        nSteps = spec.maxStep
-        self.nPoints = nPoints;
-        nLeft = int(nPoints / 2)
-        self.Fmhz = Fmhz = spec.Fmhz
-        self.Scdeg = Scdeg = spec.Scdeg
-        for i in range(nSteps):
-            start = max(0, i - nLeft)
-            end = min(nSteps, start + nPoints)
-            x = Fmhz[start : end]
-            y = Scdeg[start : end]
-            A = vstack([x, ones(len(x))]).T
-            m, c = lstsq(A, y)[0]
-            self.v[i] = -m / 360000000.0
+        self.nPoints = nPoints
+        n = spec.maxStep + 1
+        self.v[:n] = GroupDelay(spec.Fmhz, spec.Scdeg, nPoints, n)
+        self.gen += 1
+
+#------------------------------------------------------------------------------
+# Group delay (seconds) at steps lo to hi-1 of the first n steps of
+# continuous phase Scdeg (degrees) over frequencies Fmhz: the negative of the
+# least-squares slope of the phase over nPoints steps around each step.
+# Windows are cut short at the ends of the data.
+#
+# The window sums are differences of cumulative sums. They are taken a
+# block of steps at a time, relative to the block's means, to keep their
+# rounding errors small for long sweeps.
+
+gdBlock = 4096
+
+def GroupDelay(Fmhz, Scdeg, nPoints, n=None, lo=0, hi=None):
+    if n == None:
+        n = len(Fmhz)
+    if hi == None:
+        hi = n
+    nPoints = max(int(nPoints), 1)
+    nLeft = nPoints // 2
+    gd = zeros(max(hi - lo, 0))
+    for b0 in range(lo, hi, gdBlock):
+        i = arange(b0, min(hi, b0 + gdBlock))
+        start = maximum(i - nLeft, 0)
+        end = minimum(start + nPoints, n)
+        s0, s1 = start[0], end[-1]
+        x = Fmhz[s0:s1] - Fmhz[s0:s1].mean()
+        y = Scdeg[s0:s1] - Scdeg[s0:s1].mean()
+        sums = []
+        for a in (x, y, x*x, x*y):
+            c = append(0., cumsum(a))
+            sums.append(c[end-s0] - c[start-s0])
+        Sx, Sy, Sxx, Sxy = sums
+        w = end - start
+        den = w*Sxx - Sx*Sx
+        save = seterr(all="ignore")
+        slope = where(den > 0, (w*Sxy - Sx*Sy) / den, 0)
+        seterr(**save)
+        gd[b0-lo:b0-lo+len(i)] = -slope / 360000000.0
+    return gd
 
 traceTypesLists[MSA.MODE_VNATran] = (
     NoTrace,
@@ -400,91 +396,152 @@ traceTypesLists[MSA.MODE_VNATran] = (
 #------------------------------------------------------------------------------
 # Reflection Mode.
 
-class S11Trace(Trace):
-    top = 0
-    bot = -100
-    def __init__(self, spec, iScale):
-        global msa
-        Trace.__init__(self, spec, iScale)
-#         self.Sdb = spec.Sdb
-        if incremental:
-            self.Sdb = dcopy.copy(spec.Sdb)
-        else:
-            self.Sdb = spec.Sdb
+class S11Data:
+    # Reflection data derived from a spectrum, for the reflection traces.
+    # One is kept per spectrum, in spec.derived, and shared by all traces
+    # (and Smith charts and dialogs through them) of that spectrum. The
+    # arrays are updated in place, only over the steps changed since the
+    # last update, so traces can hold views of them.
+
+    def __init__(self, spec):
+        self.spec = spec
+        n = len(spec.Fmhz)
+        self.nSteps = n - 1
+        self.Sdb = zeros(n)         # reflection (dB)
+        self.Sdeg = zeros(n)        # reflection (degrees)
+        self.S21db = zeros(n)       # data as measured (dB)
+        self.S21deg = zeros(n)      # data as measured (degrees)
+        self.S11 = zeros(n, dtype=complex)
+        self.Zs = zeros(n, dtype=complex)   # series impedance
+        self.Zp = zeros(n, dtype=complex)   # equivalent parallel impedance
+        self.w = 2*pi*spec.Fmhz*MHz
+        self.columns = {}           # quantities computed for traces, by name
+        self.key = None
+        self.gen = 0                # count of updates over all steps
+        self.lo, self.hi = 0, n     # range of steps needing update
+
+    # Return the S11Data of spectrum spec, creating it if needed.
+
+    @classmethod
+    def For(cls, spec):
+        data = spec.derived.get("S11")
+        if data == None:
+            data = spec.derived["S11"] = cls(spec)
+        return data
+
+    def Invalidate(self, lo, hi):
+        self.lo = min(self.lo, lo)
+        self.hi = max(self.hi, hi)
+
+    # Bring the data up to date, over all steps if the fixture has changed.
+
+    def Update(self):
+        spec = self.spec
+        key = (spec.isSeriesFix, spec.isShuntFix, msa.fixtureR0)
+        if key != self.key:
+            self.key = key
+            self.lo, self.hi = 0, self.nSteps + 1
+            self.gen += 1
+        if self.lo >= self.hi:
+            return
+        s = slice(self.lo, self.hi)
+        self.lo, self.hi = self.nSteps + 1, 0
+        R0 = msa.fixtureR0
+        Sdb = spec.Sdb[s]
+        Sdeg = spec.Sdeg[s]
+        save = seterr(all="ignore")
+        S11 = 10**(Sdb/20) * exp(1j*pi*Sdeg/180)
         if truncateS11ToUnity:
-            self.Sdb = min2(self.Sdb, 0)
-#         self.Sdeg = spec.Sdeg
-        if incremental:
-            self.Sdeg = dcopy.copy(spec.Sdeg)
-        else:
-            self.Sdeg = spec.Sdeg
-        S11 = 10**(spec.Sdb/20) * exp(1j*pi*spec.Sdeg/180)
-        self.S21db = self.Sdb
-        self.S21deg = self.Sdeg
+            Sdb = min2(Sdb, 0)
+        self.S21db[s] = Sdb
+        self.S21deg[s] = Sdeg
 
         # Using a Series or Shunt "Reflectance" fixture:
         if spec.isSeriesFix or spec.isShuntFix:
-            S11, Zs = EquivS11FromS21(S11, spec.isSeriesFix, msa.fixtureR0)
-            self.S11 = S11
-            self.Zs = Zs
-            self.Sdb = db(abs(S11))
-            self.Sdeg = 180*angle(S11)/pi
+            S11, Zs = EquivS11FromS21(S11, spec.isSeriesFix, R0)
+            self.Sdb[s] = 20 * log10(abs(S11))
+            self.Sdeg[s] = 180*angle(S11)/pi
         else:
-            self.S11 = S11
-            save = seterr(all="ignore")
-            self.Zs = Zs = msa.fixtureR0 * (1 + S11) / (1 - S11)
-            seterr(**save)
-            self.Zs = nan_to_num(self.Zs)
+            Zs = nan_to_num(R0 * (1 + S11) / (1 - S11))
+            self.Sdb[s] = Sdb
+            self.Sdeg[s] = Sdeg
+        self.S11[s] = S11
+        self.Zs[s] = Zs
 
         # Zp is equivalent parallel impedance to Zs
         mag2 = Zs.real**2 + Zs.imag**2
-        save = seterr(all="ignore")
-        self.Zp = mag2/Zs.real + 1j*mag2/Zs.imag
+        self.Zp[s] = nan_to_num(mag2/Zs.real + 1j*mag2/Zs.imag)
+
+        for name, v in self.columns.items():
+            v[s] = self._Compute(name, s)
         seterr(**save)
-        self.Zp = nan_to_num(self.Zp)
-        self.w = 2*pi*spec.f*MHz
 
-    def SetStep(self, spec, i):
-        global msa
-        if not self.maxHold:
-            self.Sdb[i] = spec.Sdb[i]
-        else:
-            if self.max:
-                if spec.Sdb[i] > self.Sdb[i]:
-                    self.Sdb[i] = spec.Sdb[i]
-            else:
-                self.Sdb[i] = spec.Sdb[i]
-                if i == spec.nSteps:
-                    self.max = True
+    # The array of quantity name (a key of s11Quantities) over all steps,
+    # kept up to date from now on.
 
-        if truncateS11ToUnity:
-            self.Sdb[i] = min2(self.Sdb[i], 0)
-        self.Sdeg[i] = spec.Sdeg[i]
-        S11 = 10**(spec.Sdb[i]/20) * exp(1j*pi*spec.Sdeg[i]/180)
-        self.S21db = self.Sdb[i]
-        self.S21deg = self.Sdeg[i]
- 
-        # Using a Series or Shunt "Reflectance" fixture:
-        if spec.isSeriesFix or spec.isShuntFix:
-            S11, Zs = EquivS11FromS21(S11, spec.isSeriesFix, msa.fixtureR0)
-            self.S11[i] = S11
-            self.Zs[i] = Zs
-            self.Sdb[i] = db(abs(S11))
-            self.Sdeg[i] = 180*angle(S11)/pi
-        else:
-            self.S11[i] = S11
-            try:
-                self.Zs[i] = Zs = msa.fixtureR0 * (1 + S11) / (1 - S11)
-            except:
-                self.Zs[i] = Zs = complex(0, 0)
+    def Column(self, name):
+        v = self.columns.get(name)
+        if v is None:
+            save = seterr(all="ignore")
+            v = self.columns[name] = self._Compute(name, slice(None))
+            seterr(**save)
+        return v
+
+    def _Compute(self, name, s):
+        f = s11DbQuantities.get(name)
+        if f:
+            return f(self.Sdb[s])
+        return s11Quantities[name](self.Zs[s], self.Zp[s], self.w[s])
+
+# Quantities of the reflection traces, as functions of the reflection in dB
+# or of (Zs, Zp, w) arrays.
+
+s11DbQuantities = {
+    "S11_dB":   lambda Sdb: Sdb.copy(),
+    "Rho":      lambda Sdb: 10**(Sdb/20),
+    "RL":       lambda Sdb: -Sdb,
+    "RefPwr":   lambda Sdb: 100 * 10**(Sdb/10),
+    "VSWR":     lambda Sdb: (1+10**(Sdb/20)) / (1-10**(Sdb/20)),
+}
+
+s11Quantities = {
+    "Z_Mag":    lambda Zs, Zp, w: abs(Zs),
+    "Z_Ang":    lambda Zs, Zp, w: 180*angle(Zs)/pi,
+    "Rs":       lambda Zs, Zp, w: Zs.real.copy(),
+    "Xs":       lambda Zs, Zp, w: Zs.imag.copy(),
+    "Cs":       lambda Zs, Zp, w: nan_to_num(-1 / (Zs.imag*w)),
+    "Ls":       lambda Zs, Zp, w: nan_to_num(Zs.imag/w),
+    "Rp":       lambda Zs, Zp, w: Zp.real.copy(),
+    "Xp":       lambda Zs, Zp, w: Zp.imag.copy(),
+    "Cp":       lambda Zs, Zp, w: nan_to_num(-1 / (Zp.imag*w)),
+    "Lp":       lambda Zs, Zp, w: nan_to_num(Zp.imag/w),
+    "Q":        lambda Zs, Zp, w: abs(Zs.imag) / Zs.real,
+}
+
+# Base of the reflection traces. Each shows one column of its spectrum's
+# S11Data, named by its class's column attribute.
 
-        # Zp is equivalent parallel impedance to Zs
-        mag2 = Zs.real**2 + Zs.imag**2
-        try:
-            self.Zp[i] = mag2/Zs.real + 1j*mag2/Zs.imag
-        except ZeroDivisionError:
-            self.Zp[i] = 0
-        self.w[i] = 2*pi*spec.f[i]*MHz
+class S11Trace(Trace):
+    top = 0
+    bot = -100
+    column = None
+    def __init__(self, spec, iScale):
+        Trace.__init__(self, spec, iScale)
+        data = self.data = S11Data.For(spec)
+        data.Update()
+        for name in ("Sdb", "Sdeg", "S21db", "S21deg", "S11", "Zs", "Zp",
+                     "w"):
+            setattr(self, name, self.View(getattr(data, name)))
+        if self.column:
+            self.v = self.View(data.Column(self.column))
+
+    # Steps are computed by the S11Data when the traces are drawn.
+
+    def SetStep(self, spec, i):
+        pass
+
+    def Generation(self):
+        return self.data.gen
 
 class RMagTrace(Trace):
     desc = "Magnitude (dBm)"
@@ -494,10 +551,10 @@ class RMagTrace(Trace):
     bot = -120
     def __init__(self, spec, iScale):
         Trace.__init__(self, spec, iScale)
-        self.v = dcopy.copy(spec.Mdb)
+        self.v = self.View(spec.Mdb)
 
     def SetStep(self, spec, i):
-        self.v[i] = spec.Mdb[i]
+        self.SetVStep(spec.Mdb, i)
 
 class RPhaseTrace(Trace):
     desc = "Phase (deg)"
@@ -507,54 +564,20 @@ class RPhaseTrace(Trace):
     bot = -180
     def __init__(self, spec, iScale):
         Trace.__init__(self, spec, iScale)
-        self.v = dcopy.copy(spec.Mdeg)
+        self.v = self.View(spec.Mdeg)
 
     def SetStep(self, spec, i):
-        self.v[i] = spec.Mdeg[i]
+        self.SetVStep(spec.Mdeg, i)
 
 class CapTrace(S11Trace):
     units = "F"
     top = 1*uF
     bot = 0
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-
-    def SetV(self, Z):
-        save = seterr(all="ignore")
-        self.v = -1 / (Z.imag*self.w)
-        self.v = nan_to_num(self.v)
-        seterr(**save)
-
-    def Set(self, Z, i):
-        save = seterr(all="ignore")
-        self.v[i] = -1 / (Z[i].imag*self.w[i])
-        self.v[i] = nan_to_num(self.v[i])
-        seterr(**save)
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
 
 class InductTrace(S11Trace):
     units = "H"
     top = 1*uH
     bot = 0
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-
-    def SetV(self, Z):
-        save = seterr(all="ignore")
-        self.v = Z.imag/self.w
-        self.v = nan_to_num(self.v)
-        seterr(**save)
-
-    def Set(self, Z, i):
-        save = seterr(all="ignore")
-        self.v[i] = Z[i].imag/self.w[i]
-        self.v[i] = nan_to_num(self.v[i])
-        seterr(**save)
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
 
 class S11MagTrace(S11Trace):
     desc = "S11 Magnitude (dB)"
@@ -562,13 +585,7 @@ class S11MagTrace(S11Trace):
     units = "dB"
     top = 0
     bot = -100
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        self.v = self.Sdb
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = self.Sdb[i]
+    column = "S11_dB"
 
 class S11PhaseTrace(S11Trace):
     desc = "S11 Phase Angle (Deg)"
@@ -580,23 +597,13 @@ class S11PhaseTrace(S11Trace):
         S11Trace.__init__(self, spec, iScale)
         self.v = self.Sdeg
 
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = self.Sdeg[i]
-
 class RhoTrace(S11Trace):
     desc = "Reflect Coef. Mag (Rho)"
     name = "Rho"
     units = "Ratio"
     top = 1
     bot = 0
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        self.v = 10**(self.Sdb/20)
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = 10**(self.Sdb[i]/20)
+    column = "Rho"
 
 class ThetaTrace(S11Trace):
     desc = "Reflect Coef. Angle (Theta)"
@@ -608,10 +615,6 @@ class ThetaTrace(S11Trace):
         S11Trace.__init__(self, spec, iScale)
         self.v = self.Sdeg
 
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = self.Sdeg[i]
-
 class S21MagTrace1(S11Trace):
     desc = "S21 Magnitude (dB)"
     name = "S21_dB"
@@ -622,9 +625,6 @@ class S21MagTrace1(S11Trace):
         S11Trace.__init__(self, spec, iScale)
         self.v = self.S21db
 
-    def SetStep(self, spec, i):
-        self.v[i] = self.S21db[i]
-
 class S21PhaseTrace1(S11Trace):
     desc = "S21 Phase Angle (Deg)"
     name = "S21_Deg"
@@ -635,22 +635,13 @@ class S21PhaseTrace1(S11Trace):
         S11Trace.__init__(self, spec, iScale)
         self.v = self.S21deg
 
-    def SetStep(self, spec, i):
-        self.v[i] = self.S21deg[i]
-
 class ZMagTrace(S11Trace):
     desc = "Impedance Mag (Z Mag)"
     name = "Z_Mag"
     units = "ohms"
     top = 200
     bot = 0
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        self.v = abs(self.Zs) # EON Jan 10 2014
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = abs(self.Zs[i])
+    column = "Z_Mag"
 
 class ZPhaseTrace(S11Trace):
     desc = "Impedance Angle (Z Ang)"
@@ -658,13 +649,7 @@ class ZPhaseTrace(S11Trace):
     units = "Deg"
     top = 180
     bot = -180
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        self.v = 180*angle(self.Zs)/pi # EON Jan 10 2014
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = 180*angle(self.Zs[i])/pi
+    column = "Z_Ang"
 
 class SerResTrace(S11Trace):
     desc = "Series Resistance (Rs)"
@@ -672,13 +657,7 @@ class SerResTrace(S11Trace):
     units = "ohms"
     top = 200
     bot = 0
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        self.v = self.Zs.real
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = self.Zs[i].real
+    column = "Rs"
 
 class SerReactTrace(S11Trace):
     desc = "Series Reactance (Xs)"
@@ -686,39 +665,21 @@ class SerReactTrace(S11Trace):
     units = "ohms"
     top = 200
     bot = -200
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        self.v = self.Zs.imag
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = self.Zs[i].imag
+    column = "Xs"
 
 class SerCapTrace(CapTrace):
     desc = "Series Capacitance (Cs)"
     name = "Cs"
     top = 1*uF
     bot = 0
-    def __init__(self, spec, iScale):
-        CapTrace.__init__(self, spec, iScale)
-        self.SetV(self.Zs)
-
-    def SetStep(self, spec, i):
-        CapTrace.SetStep(self, spec, i)
-        self.Set(self.Zs, i)
+    column = "Cs"
 
 class SerInductTrace(InductTrace):
     desc = "Series Inductance (Ls)"
     name = "Ls"
     top = 1*uH
     bot = 0
-    def __init__(self, spec, iScale):
-        InductTrace.__init__(self, spec, iScale)
-        self.SetV(self.Zs)
-
-    def SetStep(self, spec, i):
-        InductTrace.SetStep(self, spec, i)
-        self.Set(self.Zs, i)
+    column = "Ls"
 
 class ParResTrace(S11Trace):
     desc = "Parallel Resistance (Rp)"
@@ -726,13 +687,7 @@ class ParResTrace(S11Trace):
     units = "ohms"
     top = 200
     bot = 0
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        self.v = self.Zp.real
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = self.Zp[i].real
+    column = "Rp"
 
 class ParReactTrace(S11Trace):
     desc = "Parallel Reactance (Xp)"
@@ -740,39 +695,21 @@ class ParReactTrace(S11Trace):
     units = "ohms"
     bot = -200
     top = 200
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        self.v = self.Zp.imag
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = self.Zp[i].imag
+    column = "Xp"
 
 class ParCapTrace(CapTrace):
     desc = "Parallel Capacitance (Cp)"
     name = "Cp"
     top = 1*uF
     bot = 0
-    def __init__(self, spec, iScale):
-        CapTrace.__init__(self, spec, iScale)
-        self.SetV(self.Zp)
-
-    def SetStep(self, spec, i):
-        CapTrace.SetStep(self, spec, i)
-        self.Set(self.Zp, i)
+    column = "Cp"
 
 class ParInductTrace(InductTrace):
     desc = "Parallel Inductance (Lp)"
     name = "Lp"
     top = 1*uH
     bot = 0
-    def __init__(self, spec, iScale):
-        InductTrace.__init__(self, spec, iScale)
-        self.SetV(self.Zp)
-
-    def SetStep(self, spec, i):
-        InductTrace.SetStep(self, spec, i)
-        self.Set(self.Zp, i)
+    column = "Lp"
 
 class ReturnLossTrace(S11Trace):
     desc = "Return Loss (db)"
@@ -780,13 +717,7 @@ class ReturnLossTrace(S11Trace):
     units = "dB"
     top = 60
     bot = 0
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        self.v = -self.Sdb
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = -self.Sdb[i]
+    column = "RL"
 
 class ReflPwrTrace(S11Trace):
     desc = "Reflected Power (%)"
@@ -794,13 +725,7 @@ class ReflPwrTrace(S11Trace):
     units = "%"
     top = 100
     bot = 0
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        self.v = 100 * 10**(self.Sdb/10)
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = 100 * 10**(self.Sdb[i]/10)
+    column = "RefPwr"
 
 class CompQTrace(S11Trace):
     desc = "Component Q"
@@ -808,13 +733,7 @@ class CompQTrace(S11Trace):
     units = "Ratio"
     top = 0
     bot = 0
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        self.v = abs(self.Zs.imag) / self.Zs.real
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        self.v[i] = abs(self.Zs[i].imag) / self.Zs[i].real
+    column = "Q"
 
 class VSWRTrace(S11Trace):
     desc = "VSWR"
@@ -822,15 +741,7 @@ class VSWRTrace(S11Trace):
     units = "Ratio"
     top = 10
     bot = 0
-    def __init__(self, spec, iScale):
-        S11Trace.__init__(self, spec, iScale)
-        rat = 10**(self.Sdb/20)
-        self.v = (1+rat) / (1-rat)
-
-    def SetStep(self, spec, i):
-        S11Trace.SetStep(self, spec, i)
-        rat = 10**(self.Sdb[i]/20)
-        self.v[i] = (1+rat) / (1-rat)
+    column = "VSWR"
 
 traceTypesLists[MSA.MODE_VNARefl] = (
     NoTrace,
@@ -30,7 +30,7 @@ print("sys.platform: ", sys.platform)
 
 import msaGlobal
 from msaGlobal import GetMsa, SetMsa, EVT_UPDATE_GRAPH, GetHardwarePresent, \
-    incremental, msPerUpdate, resdir, SetFontSize, \
+    incremental, resdir, SetFontSize, \
     SetModuleVersion, slowDisplay
 import os, re, string, time, threading, wx
 import copy as dcopy
@@ -38,14 +38,18 @@ import numpy.version
 from wx.lib.dialogs import ScrolledMessageDialog
 import trace
 from util import CentSpanToStartStop, CheckExtension, message, \
-    mhzStr, modDegree, Prefs, ShouldntOverwrite, StartStopToCentSpan
+    mhzStr, Prefs, ShouldntOverwrite, StartStopToCentSpan
 from theme import DarkTheme, LightTheme
 from events import ResetEvents, LogGUIEvent, GuiEvents
 from msa import MSA
 from marker import Marker
 from calMan import CalFileName, CalParseFreqFile, CalParseMagFile
+import calStore
 from vScale import VScale
+from detector import DET_NORMAL
+from ref import RefMath
 from spectrum import Spectrum
+from touchstone import Touchstone
 
 SetModuleVersion("msapy",("1.30","JGH","05/20/2014"))
 #SetVersion(version)
@@ -351,6 +355,8 @@ class TwoPortFrame(wx.Frame):
         self.smithDlg = None
 
         self.spectrum = None
+        self.twoPortData = None     # Touchstone data loaded, if any, and
+        self.twoPortSpec = None     # the spectrum made from it
         self.sweepDlg = None
         self.filterAnDlg = None
         self.compDlg = None
@@ -486,6 +492,7 @@ class TwoPortFrame(wx.Frame):
         ResetEvents()
         LogGUIEvent("ScanPrecheck")
         self.spectrum = None
+        self.twoPortData = self.twoPortSpec = None
         self.needRestart = False
         if msa.syndut: # JGH 2/8/14 syndutHook5
             if 0 or debug:
@@ -535,7 +542,8 @@ class TwoPortFrame(wx.Frame):
 
         LogGUIEvent("ScanPrecheck starting timer")
         # start display-update timer, given interval in ms
-        self.timer.Start(msPerUpdate)
+        msa.pacer.Reset()
+        self.timer.Start(msa.pacer.interval)
     #--------------------------------------------------------------------------
 
     #--------------------------------------------------------------------------
@@ -627,8 +635,9 @@ class TwoPortFrame(wx.Frame):
         assert wx.Thread_IsMain()
         ##LogGUIEvent("OnTimer")
 
-        # draw any new scan data from the back end thread
-        if not msa.scanResults.empty():
+        # draw any new scan data from the back end thread, when a frame is
+        # due (until then, it collects in the queue)
+        if not msa.scanResults.empty() and msa.pacer.Begin():
             spec = self.spectrum
             LogGUIEvent("OnTimer: have updates")
             if spec == None:
@@ -652,9 +661,14 @@ class TwoPortFrame(wx.Frame):
                 if self.smithDlg and slowDisplay:
                     self.smithDlg.Refresh()
             self.DrawTraces()
+            # paint now, so the frame's drawing time includes it
+            specP.Update()
             LogGUIEvent("OnTimer: all traces drawn, cursorStep=%d" % spec.step)
             if self.varDlg:
                 self.varDlg.Refresh()
+            # follow the display's pace
+            if msa.pacer.End():
+                self.timer.Start(msa.pacer.interval)
 
         # put Scan/Halt/Continue buttons in right mode
         if msa.IsScanning() != self.btnScanMode:
@@ -709,6 +723,7 @@ class TwoPortFrame(wx.Frame):
 
         spec.isSeriesFix = p.get("isSeriesFix", False)
         spec.isShuntFix = p.get("isShuntFix", False)
+        spec.UpdateDerived()
 
         # set left (0) and right (1) vertical scale variables
         # and create potential traces for each (trva, trvb)
@@ -722,10 +737,12 @@ class TwoPortFrame(wx.Frame):
         p.vaDiv = vs0.div
         vaType = types[vaTypeIndex]
 
-        if spec.vaType != vaType:
+        if vs0.detector.mode != DET_NORMAL:
+            # traces of detected data are made from the detector's spectrum
+            trva = vaType(vs0.detector.Detect(spec, includePhase), 0)
+            spec.vaType = spec.trva = None
+        elif spec.vaType != vaType:
             trva = vaType(spec, 0)
-            trva.maxHold = vs0.maxHold
-            trva.max = False
             if incremental:
                 spec.vaType = vaType
                 spec.trva = trva
@@ -740,10 +757,12 @@ class TwoPortFrame(wx.Frame):
         p.vbDiv = vs1.div
         vbType = types[vbTypeIndex]
 
-        if spec.vbType != vbType:
+        if vs1.detector.mode != DET_NORMAL:
+            # traces of detected data are made from the detector's spectrum
+            trvb = vbType(vs1.detector.Detect(spec, includePhase), 1)
+            spec.vbType = spec.trvb = None
+        elif spec.vbType != vbType:
             trvb = vbType(spec, 1)
-            trvb.maxHold = vs1.maxHold
-            trvb.max = False
             if incremental:
                 spec.vbType = vbType
                 spec.trvb = trvb
@@ -772,62 +791,47 @@ class TwoPortFrame(wx.Frame):
             trM.phaseTrace = trP
             trP.magTrace = trM
 
-        # draw any compatible reference traces
+        # draw the reference traces, resampled to the sweep's frequencies
         for ri in self.refs.keys():
             ref = self.refs[ri]
-            rsp = ref.spectrum
-            if rsp.nSteps == spec.nSteps and rsp.Fmhz[0] == spec.Fmhz[0] \
-                                         and rsp.Fmhz[-1] == spec.Fmhz[-1]:
-                mathMode = ref.mathMode
-                if trM and ri == 1 and ref.mathMode > 0:
-                    # Ref 1 math applied to Mag, Phase
-                    mData = trM.v
-                    mRef = rsp.Sdb
-                    if mathMode == 1:
-                        mMath = mData + mRef
-                    elif mathMode == 2:
-                        mMath = mData - mRef
-                    else:
-                        mMath = mRef - mData
-                    trM.v = dcopy.copy(mMath)
-                    if includePhase and trP:
-                        pData = trP.v
-                        pRef = rsp.Sdeg
-                        if mathMode == 1:
-                            pMath = pData + pRef
-                        elif mathMode == 2:
-                            pMath = pData - pRef
-                        else:
-                            pMath = pRef - pData
-                        trP.v = dcopy.copy(modDegree(pMath))
-                else:
-                    # Ref trace is displayed
-                    refTypeM = ref.vScale.dataType
-                    # vScales[] index 0 or 1 based on units (for now)
-                    i = trvb.units and trvb.units == refTypeM.units
-                    if not i:
-                        i = 0
-                    name = ref.name
-                    refHasPhase = includePhase and refTypeM.units == "dB"
-                    if refHasPhase:
-                        # create ref's phase trace, with unique names for both
-                        # (use continuous phase if that's being displayed)
-                        continPhase = trP.units == "CDeg"
-                        refTypeP = types[ref.vScale.typeIndex+1+continPhase]
-                        refTrP = refTypeP(rsp, 1-i)
-                        name = "%s_dB" % name
-                        phName = "%s_%s" % (ref.name, trP.name.split("_")[1])
-                    # create and assign name to ref's mag trace
-                    specP.traces[name] = refTrM = refTypeM(rsp, i)
-                    refTrM.name = name
-                    refTrM.isMain = False
-                    refTrM.iColor = self.IndexForColor(2 + 2*ri)
-                    if refHasPhase:
-                        # assign name to ref's phase trace
-                        specP.traces[phName] = refTrP
-                        refTrP.name = phName
-                        refTrP.isMain = False
-                        refTrP.iColor = self.IndexForColor(refTrM.iColor + 1)
+            rsp = ref.OnGrid(spec.Fmhz)
+            if trM and ri == 1 and ref.mathMode > 0:
+                # Ref 1 math applied to Mag, Phase, in place of them
+                if not (includePhase and trP):
+                    trP = None
+                math = RefMath.For(trM.spec)
+                mathM, mathP = math.Apply(ref, trM, trP)
+                specP.traces[trM.name] = trM = mathM
+                if trP:
+                    specP.traces[trP.name] = trP = mathP
+            else:
+                # Ref trace is displayed
+                refTypeM = ref.vScale.dataType
+                # vScales[] index 0 or 1 based on units (for now)
+                i = trvb.units and trvb.units == refTypeM.units
+                if not i:
+                    i = 0
+                name = ref.name
+                refHasPhase = includePhase and refTypeM.units == "dB"
+                if refHasPhase:
+                    # create ref's phase trace, with unique names for both
+                    # (use continuous phase if that's being displayed)
+                    continPhase = trP.units == "CDeg"
+                    refTypeP = types[ref.vScale.typeIndex+1+continPhase]
+                    refTrP = refTypeP(rsp, 1-i)
+                    name = "%s_dB" % name
+                    phName = "%s_%s" % (ref.name, trP.name.split("_")[1])
+                # create and assign name to ref's mag trace
+                specP.traces[name] = refTrM = refTypeM(rsp, i)
+                refTrM.name = name
+                refTrM.isMain = False
+                refTrM.iColor = self.IndexForColor(2 + 2*ri)
+                if refHasPhase:
+                    # assign name to ref's phase trace
+                    specP.traces[phName] = refTrP
+                    refTrP.name = phName
+                    refTrP.isMain = False
+                    refTrP.iColor = self.IndexForColor(refTrM.iColor + 1)
 
         # enable drawing of spectrum (if not already)
         specP.Enable()
@@ -1005,12 +1009,12 @@ class TwoPortFrame(wx.Frame):
         bitmap.SaveFile(path, bmtype)   # JGH 2/10/14
 
     #--------------------------------------------------------------------------
-    # Load or save spectrum data to an s1p file. JGH created 3/29/14
+    # Load or save two port data to a Touchstone file. JGH created 3/29/14
 
     def LoadParamsFile(self, event):
         self.StopScanAndWait()
         p = self.prefs
-        wildcard = "S1P (*.s1p)|*.s1p"
+        wildcard = "Touchstone (*.s2p;*.s1p)|*.s2p;*.s1p"
         dataDir = p.get("twoPortDir", twoPdir)
         dlg = wx.FileDialog(self, "Choose file...", defaultDir=dataDir,
                 defaultFile="", wildcard=wildcard)
@@ -1019,7 +1023,14 @@ class TwoPortFrame(wx.Frame):
         path = dlg.GetPath()
         p.dataDir = os.path.dirname(path)
 ##        print ("Reading", path)
-        spec = self.spectrum = Spectrum.FromS1PFile(path)
+        try:
+            ts = Touchstone.Read(path)
+        except (ValueError, IOError) as e:
+            message(str(e), "Load Parameters")
+            return
+        spec = self.spectrum = Spectrum.FromTouchstone(ts)
+        self.twoPortData = ts
+        self.twoPortSpec = spec
         specP = self.specP
         specP.h0 = p.fStart = spec.Fmhz[0]  # EON Jan 10 2014
         specP.h1 = p.fStop  = spec.Fmhz[-1] # EON Jan 10 2014
@@ -1028,11 +1039,19 @@ class TwoPortFrame(wx.Frame):
         self.RefreshAllParms()
         self.DrawTraces()
 
-    def SaveTwoPortFile(self, event=None, data=None, writer=None, name="TwoPortData.s1p"):
+    def SaveTwoPortFile(self, event=None, data=None, writer=None, name="TwoPortData.s2p"):
         self.StopScanAndWait()
         p = self.prefs
+        # the loaded two port data, while it's what is shown
+        ts = self.twoPortData
+        if data == None and writer == None and ts != None and \
+                ts.nPorts == 2 and self.spectrum is self.twoPortSpec:
+            data = ts
+            writer = self.WriteTwoPort
+            name = "TwoPortData.s%dp" % ts.nPorts
         if writer == None:
             writer = self.spectrum.WriteS1P
+            name = "TwoPortData.s1p"
         if data == None:
             data = self.spectrum
         if data == None:
@@ -1061,6 +1080,9 @@ class TwoPortFrame(wx.Frame):
         else:
             writer(data, path)
 
+    def WriteTwoPort(self, data, path):
+        data.Write(path)
+
     #--------------------------------------------------------------------------
     #
     def SaveSelParams(self, event=None, data=None, writer=None, name="SelParams.s1p"):
@@ -1253,14 +1275,7 @@ class TwoPortFrame(wx.Frame):
     def SetBandCal(self, spectrum):
         global msa
         msa.bandCal = spectrum
-        if spectrum:
-            msa.bandCal.WriteS1P(self.bandCalFileName, self.prefs,
-                                 contPhase=True)
-        else:
-            try:
-                os.unlink(self.bandCalFileName)
-            except:
-                pass
+        self.SaveCal(spectrum, self.bandCalFileName)
 
     def SetBaseCal(self, spectrum):
         global msa
@@ -1272,19 +1287,28 @@ class TwoPortFrame(wx.Frame):
         msa.bandCal = spectrum
         self.SaveCal(spectrum, self.bandCalFileName)
 
+    # Calibrations are saved in the binary format of calStore, unless given
+    # an .s1p file name.
+
     def SaveCal(self, spectrum, path):
         if spectrum:
-            spectrum.WriteS1P(path, self.prefs, contPhase=True)
+            if path.lower().endswith(".s1p"):
+                calStore.ExportText(spectrum, path, self.prefs)
+            else:
+                calStore.SaveCal(spectrum, path, self.prefs)
         elif os.path.exists(path):
             os.unlink(path)
 
     def LoadCal(self, path):
-        if os.path.exists(path):
-            cal = Spectrum.FromS1PFile(path) # EON Jan 29, 2014
-            if cal == None:
-                from cal import OslCal
-                cal = OslCal.FromS1PFile(path)
-            return cal
+        if path.lower().endswith(".s1p"):
+            textPath = path
+        else:
+            if os.path.exists(path):
+                return calStore.LoadCal(path)
+            # may have been saved as text by an earlier version
+            textPath = os.path.splitext(path)[0] + ".s1p"
+        if os.path.exists(textPath):
+            return calStore.ImportText(textPath) # EON Jan 29, 2014
         else:
             return None
 
@@ -1292,7 +1316,7 @@ class TwoPortFrame(wx.Frame):
         global msa
         if msa.bandCal != None:
             msa.baseCal = dcopy.deepcopy(msa.bandCal)
-            msa.baseCal.WriteS1P(self.baseCalFileName, self.prefs, contPhase=True)
+            self.SaveCal(msa.baseCal, self.baseCalFileName)
 
     #--------------------------------------------------------------------------
     # Read CalPath file for mag/phase linearity adjustment.
@@ -1305,9 +1329,9 @@ class TwoPortFrame(wx.Frame):
         p = self.prefs
         directory, fileName = CalFileName(p.RBWSelindex+1)
         try:
-            f = open(os.path.join(directory, fileName), "Ur")
             msa.magTableADC, msa.magTableDBm, msa.magTablePhase = \
-                    CalParseMagFile(f)
+                    calStore.LoadCalTable(os.path.join(directory, fileName),
+                                          "mag", CalParseMagFile)
             if debug:
                 print (fileName, "read OK.")
         except:
@@ -1325,8 +1349,9 @@ class TwoPortFrame(wx.Frame):
         self.StopScanAndWait()
         directory, fileName = CalFileName(0)
         try:
-            f = open(os.path.join(directory, fileName), "Ur")
-            msa.freqTableMHz, msa.freqTableDB = CalParseFreqFile(f)
+            msa.freqTableMHz, msa.freqTableDB = \
+                    calStore.LoadCalTable(os.path.join(directory, fileName),
+                                          "freq", CalParseFreqFile)
             if debug:
                 print (fileName, "read OK.")
         except:
@@ -3,6 +3,7 @@ import wx
 import copy as dcopy
 from numpy import isfinite
 from trace import traceTypesLists
+from detector import Detector, detectorNames
 from util import floatSI, si, SI_ASCII, StdScale
 
 SetModuleVersion("vScale",("1.30","EON","05/20/2014"))
@@ -70,10 +71,24 @@ class VScaleDialog(wx.Dialog):
         self.typeSelCB = cbox
         self.Bind(wx.EVT_COMBOBOX, self.OnSelectType, cbox)
         sizerGB.Add(cbox, (1, 4), flag=c)
-        self.MaxHoldChk = chk = wx.CheckBox(self, -1, "Max Hold")
-        chk.SetValue(vScale.maxHold)
-        chk.Bind(wx.EVT_CHECKBOX ,self.OnMaxHold)
-        sizerGB.Add(chk, (2, 4), flag=c)
+        # detector select, and sweeps to average
+        detector = vScale.detector
+        choices = detectorNames
+        i = detector.mode
+        cbox = wx.ComboBox(self, -1, choices[i], (0, 0), (200, -1), choices,
+                           style=wx.CB_READONLY)
+        cbox.SetStringSelection(choices[i])
+        self.detSelCB = cbox
+        self.Bind(wx.EVT_COMBOBOX, self.OnDetector, cbox)
+        sizerGB.Add(cbox, (2, 4), flag=c)
+        sizerH = wx.BoxSizer(wx.HORIZONTAL)
+        st = wx.StaticText(self, -1, "Sweeps to average")
+        sizerH.Add(st, 0, wx.ALIGN_CENTER_VERTICAL|wx.RIGHT, 5)
+        self.avgCountTC = tc = wx.TextCtrl(self, -1, str(detector.count),
+                                           size=(45, -1))
+        tc.Bind(wx.EVT_KILL_FOCUS, self.OnDetector)
+        sizerH.Add(tc, 0)
+        sizerGB.Add(sizerH, (3, 4), flag=c)
         sizerGB.AddGrowableCol(3)
 
         # TODO: VScale primary trace entry
@@ -131,14 +146,20 @@ class VScaleDialog(wx.Dialog):
         specP.frame.DrawTraces()
         specP.FullRefresh()
 
-    def OnMaxHold(self, event):
+    #--------------------------------------------------------------------------
+    # Detector mode or averaging count changed: start detecting afresh.
+
+    def OnDetector(self, event):
         specP = self.specP
-        vScale = self.vScale
-        vScale.maxHold = hold = self.MaxHoldChk.GetValue()
-        name = vScale.dataType.name
-        trace = specP.traces[name]
-        trace.maxHold = hold
-        trace.max = False
+        try:
+            count = max(int(self.avgCountTC.GetValue()), 1)
+        except ValueError:
+            count = self.vScale.detector.count
+        self.avgCountTC.SetValue(str(count))
+        self.vScale.detector.SetMode(self.detSelCB.GetSelection(), count)
+        specP.frame.DrawTraces()
+        specP.FullRefresh()
+        event.Skip()
 
     #--------------------------------------------------------------------------
     # Number of divisions is selected
@@ -190,7 +211,7 @@ class VScale:
         self.top = top
         self.bot = bot
         self.div = div
-        self.maxHold = False
+        self.detector = Detector()
         self.primeTraceUnits = primeTraceUnits
         typeList = traceTypesLists[mode]
         self.dataType = typeList[min(typeIndex, len(typeList)-1)]
@@ -0,0 +1,215 @@
+from msaGlobal import SetModuleVersion
+import wx
+from numpy import arange, array, clip, float32, interp, maximum, uint8, \
+    zeros
+from util import floatOrEmpty, mhzStr
+from events import LogGUIEvent
+
+SetModuleVersion("waterfall",("1.30","EON","05/20/2014"))
+
+# Color lookup table for waterfall levels 0 (bottom of range) to 255 (top):
+# black through blue, cyan, yellow, and red to white.
+_lutLevels = (0, 48, 96, 160, 224, 255)
+_lutColors = ((0, 0, 0), (0, 0, 160), (0, 200, 220), (240, 240, 0),
+              (230, 0, 0), (255, 255, 255))
+waterfallLut = array([interp(arange(256), _lutLevels,
+                             [c[i] for c in _lutColors]) for i in range(3)],
+                     dtype=uint8).T.copy()
+
+#==============================================================================
+# The image of a waterfall: the last depth sweeps' magnitudes, a row per
+# sweep, newest at the top, mapped through the color table over the range
+# bot to top (dB).
+#
+# Rows are kept in a ring twice the depth, each written at both row r and
+# row r + depth, so that the rows from r on are always the image in order:
+# adding a sweep writes only its own row and the image needs no copying.
+# A sweep with more steps than the image has columns is reduced to each
+# column's peak, so narrow signals stay visible.
+
+class WaterfallImage:
+    def __init__(self, width, depth, bot=-120., top=0.):
+        self.bot = bot
+        self.top = top
+        self._colMap = None
+        self.Resize(width, depth)
+
+    # Change the image size, keeping the newest rows if the width is the
+    # same.
+
+    def Resize(self, width, depth):
+        width = max(int(width), 1)
+        depth = max(int(depth), 1)
+        levels = zeros((2*depth, width), dtype=float32) + self.bot
+        rgb = zeros((2*depth, width, 3), dtype=uint8)
+        rgb[:] = waterfallLut[0]
+        n = 0
+        if getattr(self, "width", None) == width:
+            n = min(self.nRows, depth)
+            for a in (levels[:n], levels[depth:depth+n]):
+                a[:] = self.levels[self.row:self.row+n]
+            for a in (rgb[:n], rgb[depth:depth+n]):
+                a[:] = self.rgb[self.row:self.row+n]
+        self.width = width
+        self.depth = depth
+        self.levels = levels        # row magnitudes (dB)
+        self.rgb = rgb              # row colors
+        self.row = 0                # ring position of newest row
+        self.nRows = n              # rows filled
+
+    # Change the color range, recoloring the rows already added.
+
+    def SetRange(self, bot, top):
+        if (bot, top) != (self.bot, self.top):
+            self.bot = bot
+            self.top = top
+            self.rgb[:] = self._Colors(self.levels)
+
+    def _Colors(self, levels):
+        scale = 255. / max(self.top - self.bot, 1e-6)
+        i = clip((levels - self.bot) * scale, 0, 255).astype(uint8)
+        return waterfallLut[i]
+
+    #--------------------------------------------------------------------------
+    # Add a sweep of magnitudes Sdb (dB) as the newest row.
+
+    def AddRow(self, Sdb):
+        Sdb = array(Sdb, dtype=float32)
+        n = len(Sdb)
+        if self._colMap == None or self._colMap[:2] != (n, self.width):
+            # each column's first step
+            starts = arange(self.width) * n // self.width
+            self._colMap = (n, self.width, starts)
+        starts = self._colMap[2]
+        if n > self.width:
+            row = maximum.reduceat(Sdb, starts)
+        else:
+            row = Sdb[starts]
+        self.row = r = (self.row - 1) % self.depth
+        self.levels[r] = self.levels[r + self.depth] = row
+        self.rgb[r] = self.rgb[r + self.depth] = self._Colors(row)
+        self.nRows = min(self.nRows + 1, self.depth)
+
+    # The image, as a (depth, width, 3) array of colors. It's a view into
+    # the ring, valid until the next row is added.
+
+    def Image(self):
+        return self.rgb[self.row:self.row+self.depth]
+
+#==============================================================================
+# A waterfall window, showing the history of completed sweeps.
+
+class WaterfallDialog(wx.Dialog):
+    def __init__(self, frame):
+        self.frame = frame
+        self.prefs = p = frame.prefs
+        framePos = frame.GetPosition()
+        frameSize = frame.GetSize()
+        pos = p.get("waterfallWinPos", (framePos.x + frameSize.x - 500,
+                                        framePos.y + 100))
+        size = p.get("waterfallWinSize", (500, 400))
+        wx.Dialog.__init__(self, frame, -1, "Waterfall", pos, size,
+                           wx.DEFAULT_DIALOG_STYLE|wx.RESIZE_BORDER)
+        self.SetBackgroundColour(p.theme.backColor)
+        vs = frame.specP.vScales[0]
+        depth = p.get("waterfallDepth", 100)
+        top = p.get("waterfallTop", vs.top)
+        bot = p.get("waterfallBot", vs.bot)
+        c = wx.ALIGN_CENTER_VERTICAL
+        sizerV = wx.BoxSizer(wx.VERTICAL)
+
+        # depth and color range
+        sizerH = wx.BoxSizer(wx.HORIZONTAL)
+        self.boxes = []
+        for label, value in (("Sweeps", depth), ("Top dB", top),
+                             ("Bottom dB", bot)):
+            sizerH.Add(wx.StaticText(self, -1, label), 0, c|wx.LEFT, 10)
+            tc = wx.TextCtrl(self, -1, str(value), size=(60, -1),
+                             style=wx.TE_PROCESS_ENTER)
+            tc.Bind(wx.EVT_TEXT_ENTER, self.OnSetParms)
+            tc.Bind(wx.EVT_KILL_FOCUS, self.OnSetParms)
+            sizerH.Add(tc, 0, c|wx.LEFT, 4)
+            self.boxes.append(tc)
+        sizerV.Add(sizerH, 0, wx.ALL, 5)
+
+        self.panel = WaterfallPanel(self, WaterfallImage(size[0], depth,
+                                                         bot, top))
+        sizerV.Add(self.panel, 1, wx.EXPAND|wx.LEFT|wx.RIGHT, 5)
+        self.msgText = wx.StaticText(self, -1, "")
+        self.msgText.SetForegroundColour(p.theme.foreColor)
+        sizerV.Add(self.msgText, 0, wx.EXPAND|wx.ALL, 5)
+
+        self.SetSizer(sizerV)
+        self.Bind(wx.EVT_CLOSE, self.Close)
+        self.Show()
+
+    #--------------------------------------------------------------------------
+    # Depth or color range entered.
+
+    def OnSetParms(self, event):
+        p = self.prefs
+        image = self.panel.image
+        depth = int(floatOrEmpty(self.boxes[0].GetValue())) or image.depth
+        top = floatOrEmpty(self.boxes[1].GetValue())
+        bot = floatOrEmpty(self.boxes[2].GetValue())
+        if top <= bot:
+            top, bot = image.top, image.bot
+        p.waterfallDepth, p.waterfallTop, p.waterfallBot = depth, top, bot
+        for tc, value in zip(self.boxes, (depth, top, bot)):
+            tc.SetValue(str(value))
+        if depth != image.depth:
+            image.Resize(image.width, depth)
+        image.SetRange(bot, top)
+        self.panel.Refresh()
+        event.Skip()
+
+    # Add a completed sweep from spectrum spec.
+
+    def AddSweep(self, spec):
+        self.panel.image.AddRow(spec.Sdb)
+        self.msgText.SetLabel("%s to %s MHz, newest at top" %
+                              (mhzStr(spec.Fmhz[0]), mhzStr(spec.Fmhz[-1])))
+        self.panel.Refresh()
+
+    def Close(self, event=None):
+        self.prefs.waterfallWinPos = self.GetPosition().Get()
+        self.prefs.waterfallWinSize = self.GetSize().Get()
+        self.frame.waterfallDlg = None
+        self.Destroy()
+
+#==============================================================================
+# The panel a waterfall image is drawn in, stretched to fill it.
+
+class WaterfallPanel(wx.Panel):
+    def __init__(self, parent, image):
+        self.image = image
+        wx.Panel.__init__(self, parent, -1)
+        self.SetBackgroundColour(wx.BLACK)
+        self.Bind(wx.EVT_PAINT, self.OnPaint)
+        self.Bind(wx.EVT_SIZE, self.OnSizeChanged)
+        self.Bind(wx.EVT_ERASE_BACKGROUND, self.OnErase)
+
+    def OnErase(self, event):
+        pass
+
+    # The image's columns follow the panel's width.
+
+    def OnSizeChanged(self, event):
+        image = self.image
+        wid = self.GetSize()[0]
+        if wid > 0 and wid != image.width:
+            image.Resize(wid, image.depth)
+        self.Refresh()
+        event.Skip()
+
+    def OnPaint(self, event):
+        LogGUIEvent("Waterfall.OnPaint")
+        image = self.image
+        dc = wx.BufferedPaintDC(self)
+        clientWid, clientHt = self.GetSize()
+        if clientHt <= 0:
+            return
+        bitmap = wx.BitmapFromBuffer(image.width, image.depth, image.Image())
+        dc.SetUserScale(float(clientWid) / image.width,
+                        float(clientHt) / image.depth)
+        dc.DrawBitmap(bitmap, 0, 0)